@@ -27,7 +27,9 @@ setup(
     ],
     entry_points={
         'console_scripts': [
-            'tm-vhdlproducer = tmVhdlProducer.__main__:main'
+            'tm-vhdlproducer = tmVhdlProducer.__main__:main',
+            'tm-vhdlproducer-batch = tmVhdlProducer.batch:main',
+            'tm-vhdlproducer-daemon = tmVhdlProducer.daemon:main'
         ],
     },
     test_suite='tests',
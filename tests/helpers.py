@@ -0,0 +1,59 @@
+"""Stubs and factories of handles shared by the tests."""
+
+from tmVhdlProducer import algodist
+from tmVhdlProducer import plan
+from tmVhdlProducer.handles import Payload
+from tmVhdlProducer.handles import ConditionHandle
+from tmVhdlProducer.handles import AlgorithmHandle
+from tmVhdlProducer.handles import MenuHandle
+
+class ConditionStub(object):
+
+    def __init__(self, name, sliceLUTs, processors=0):
+        self.name = name
+        self.type = algodist.kSingleMuon
+        self.payload = Payload(sliceLUTs, processors)
+
+class AlgorithmStub(object):
+
+    def __init__(self, index, conditions):
+        self.index = index
+        self.name = "L1_Algorithm_{0}".format(index)
+        self.module_id = None
+        self.module_index = None
+        self.conditions = conditions
+        self.payload = Payload()
+        for condition in conditions:
+            self.payload += condition.payload
+
+    def __iter__(self):
+        return iter(self.conditions)
+
+def make_condition(name, sliceLUTs, type=algodist.tmEventSetup.SingleMuon, processors=0):
+    return plan.restore(ConditionHandle, name=name, type=type, objects=[], cuts=[],
+                        payload=Payload(sliceLUTs, processors))
+
+def make_algorithm(index, conditions, name=None):
+    payload = Payload()
+    for condition in conditions:
+        payload += condition.payload
+    expression = " AND ".join(condition.name for condition in conditions)
+    return plan.restore(AlgorithmHandle, index=index, name=name or "L1_Algorithm_{0}".format(index),
+                        expression=expression, expression_in_condition=expression,
+                        conditions=conditions, module_id=None, module_index=None, payload=payload)
+
+def make_collection(algorithms, tray=None):
+    """Returns module collection of a menu handle providing *algorithms*."""
+    conditions = {}
+    for algorithm in algorithms:
+        for condition in algorithm:
+            conditions[condition.name] = condition
+    menu = plan.restore(MenuHandle, name='L1Menu_Sample', menu_uuid='menu-uuid',
+                        firmware_uuid='firmware-uuid', scale_set_name='scales',
+                        version='0.7.4', condition_handles=conditions,
+                        algorithm_handles=list(algorithms))
+    return algodist.ModuleCollection(menu, tray or algodist.ResourceTray(algodist.DefaultConfigFile))
+
+def placement(collection):
+    """Returns mapping of algorithm names to module ids."""
+    return dict((algorithm.name, module.id) for module in collection for algorithm in module)
@@ -0,0 +1,431 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from tmVhdlProducer import algodist
+from tmVhdlProducer import plan
+from tmVhdlProducer.handles import Payload
+
+from .helpers import ConditionStub, AlgorithmStub
+from .helpers import make_condition, make_algorithm, make_collection, placement
+
+class ResourceTrayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tray = algodist.ResourceTray(algodist.DefaultConfigFile)
+
+    def testMapping(self):
+        self.assertEqual(self.tray.map_instance(algodist.kSingleTau), 'CaloCondition')
+        self.assertEqual(self.tray.map_objects([algodist.kJet, algodist.kTau]), ['calo', 'calo'])
+        self.assertRaises(KeyError, self.tray.map_cut, 'UnknownCut')
+
+    def testLookupTables(self):
+        for instance in self.tray.resources.instances:
+            self.assertIs(self.tray._instances[instance.type], instance)
+            for item in instance.objects:
+                self.assertIs(self.tray._objects[(instance.type, tuple(item.types))], item)
+
+    def testMeasureCache(self):
+        cache = algodist.MeasureCache()
+        tray = algodist.ResourceTray(algodist.DefaultConfigFile, cache)
+        self.assertIs(tray.cache, cache)
+        self.assertIsNone(cache.get('a'))
+        payload = Payload(.01, .02)
+        cache.put('a', payload)
+        cached = cache.get('a')
+        self.assertEqual(cached, payload)
+        self.assertIsNot(cached, payload)
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (1, 1, 1))
+        cache.clear()
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 0, 0))
+
+class ModuleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tray = algodist.ResourceTray(algodist.DefaultConfigFile)
+
+    def testIncrementalPayload(self):
+        a = ConditionStub('a', .01)
+        b = ConditionStub('b', .02)
+        c = ConditionStub('c', .04)
+        module = algodist.Module(0, self.tray)
+        floor = module.payload.sliceLUTs
+        first = AlgorithmStub(0, [a, b])
+        second = AlgorithmStub(1, [b, c])
+        module.append(first)
+        module.append(second)
+        self.assertAlmostEqual(module.payload.sliceLUTs, floor + .07)
+        self.assertEqual(sorted(condition.name for condition in module.conditions), ['a', 'b', 'c'])
+        module.remove(first)
+        self.assertAlmostEqual(module.payload.sliceLUTs, floor + .06)
+        self.assertFalse(module.hasCondition('a'))
+        self.assertTrue(module.hasCondition('b'))
+        self.assertEqual(second.module_index, 0)
+        self.assertIsNone(first.module_id)
+
+    def testMarginal(self):
+        a = ConditionStub('a', .01)
+        b = ConditionStub('b', .02)
+        module = algodist.Module(0, self.tray)
+        module.append(AlgorithmStub(0, [a]))
+        self.assertAlmostEqual(module.marginal(AlgorithmStub(1, [a, b, b])).sliceLUTs, .02)
+        self.assertAlmostEqual(module.marginal(AlgorithmStub(2, [a])).sliceLUTs, 0.)
+
+    def testExchange(self):
+        a = ConditionStub('a', .01)
+        b = ConditionStub('b', .02)
+        c = ConditionStub('c', .04)
+        module = algodist.Module(0, self.tray)
+        floor = module.payload.sliceLUTs
+        first = AlgorithmStub(0, [a, b])
+        second = AlgorithmStub(1, [b])
+        module.append(first)
+        module.append(second)
+        self.assertAlmostEqual(module.exchange(remove=[first]).sliceLUTs, floor + .02)
+        self.assertAlmostEqual(module.exchange(remove=[first, second]).sliceLUTs, floor)
+        self.assertAlmostEqual(module.exchange(remove=[first], append=[AlgorithmStub(2, [a, c])]).sliceLUTs, floor + .07)
+        self.assertAlmostEqual(module.payload.sliceLUTs, floor + .03)
+
+class ModuleSchedulerTest(unittest.TestCase):
+
+    def testLightest(self):
+        tray = algodist.ResourceTray(algodist.DefaultConfigFile)
+        modules = [algodist.Module(id, tray) for id in range(4)]
+        scheduler = algodist.ModuleScheduler(modules)
+        self.assertEqual(scheduler.lightest().id, 0)
+        self.assertEqual(scheduler.lightest([2, 3]).id, 2)
+        for index, id in enumerate((0, 2, 1)):
+            modules[id].append(AlgorithmStub(index, [ConditionStub(str(index), .01)]))
+            scheduler.update(modules[id])
+        self.assertEqual(scheduler.lightest().id, 3)
+        self.assertEqual(scheduler.lightest([0, 1, 2]).id, 0)
+        self.assertEqual(scheduler.lightest([2]).id, 2)
+
+    def testUnknownModules(self):
+        # Constraints may name modules not present (eg. ext:0,5 on 2 modules)
+        tray = algodist.ResourceTray(algodist.DefaultConfigFile)
+        modules = [algodist.Module(id, tray) for id in range(2)]
+        scheduler = algodist.ModuleScheduler(modules)
+        self.assertEqual(scheduler.lightest([0, 5]).id, 0)
+        for index in range(30):
+            modules[0].append(AlgorithmStub(index, [ConditionStub(str(index), .001)]))
+            scheduler.update(modules[0]) # compacts heaps
+        self.assertEqual(len(modules[0]), 30)
+        self.assertEqual(scheduler.lightest().id, 1)
+
+class ShadowIndexTest(unittest.TestCase):
+
+    def testShadowed(self):
+        a, b, c, d, e = [ConditionStub(name, .01) for name in 'abcde']
+        stack = [
+            AlgorithmStub(0, [a, b]),
+            AlgorithmStub(1, [c, d]),
+            AlgorithmStub(2, [b, c]),
+            AlgorithmStub(3, [e]),
+        ]
+        index = algodist.ShadowIndex(stack)
+        self.assertEqual(index.shadowed(['a', 'b'], 0.0), [stack[0], stack[2], stack[1]])
+        self.assertEqual(index.shadowed(['a', 'b'], 0.5), [stack[0]])
+        index.discard(stack[0])
+        self.assertEqual(index.shadowed(['a', 'b'], 0.3), [stack[2]])
+        self.assertEqual(index.shadowed(['x'], 0.0), [])
+
+class RefineTest(unittest.TestCase):
+
+    def assign(self, collection, modules):
+        algorithms = []
+        for module_id, names in enumerate(modules):
+            handles = dict((algorithm.name, algorithm) for algorithm in collection.algorithm_handles)
+            for module_index, name in enumerate(names):
+                algorithms.append(dict(index=handles[name].index, name=name, module_id=module_id, module_index=module_index))
+        collection.assign(len(modules), algorithms)
+
+    def testMove(self):
+        # Module 0 at 82.7 %, module 1 at 49.85 % (floor 17 %, ceiling 90 %),
+        # moving the 21.9 % algorithm results in a peak of 71.75 %.
+        move = make_algorithm(0, [make_condition('a', .219)], 'L1_Move')
+        keep = make_algorithm(1, [make_condition('b', .438)], 'L1_Keep')
+        other = make_algorithm(2, [make_condition('c', .3285)], 'L1_Other')
+        collection = make_collection([move, keep, other])
+        self.assign(collection, [['L1_Move', 'L1_Keep'], ['L1_Other']])
+        self.assertAlmostEqual(collection.modules[0].payload.sliceLUTs, .827)
+        self.assertEqual(collection.refine(), 1)
+        self.assertEqual(placement(collection), {'L1_Move': 1, 'L1_Keep': 0, 'L1_Other': 1})
+        self.assertAlmostEqual(max(module.payload.sliceLUTs for module in collection), .7175)
+
+    def testSwap(self):
+        # No single move fits, swapping the 30 % algorithm of module 0 with
+        # the 20 % algorithm of module 1 lowers the peak from 87 % to 82 %.
+        a = make_algorithm(0, [make_condition('a', .3)], 'L1_A')
+        b = make_algorithm(1, [make_condition('b', .4)], 'L1_B')
+        c = make_algorithm(2, [make_condition('c', .2)], 'L1_C')
+        d = make_algorithm(3, [make_condition('d', .35)], 'L1_D')
+        collection = make_collection([a, b, c, d])
+        self.assign(collection, [['L1_A', 'L1_B'], ['L1_C', 'L1_D']])
+        self.assertAlmostEqual(collection.modules[0].payload.sliceLUTs, .87)
+        self.assertEqual(collection.refine(), 1)
+        self.assertEqual(placement(collection), {'L1_A': 1, 'L1_B': 0, 'L1_C': 0, 'L1_D': 1})
+        self.assertAlmostEqual(max(module.payload.sliceLUTs for module in collection), .82)
+        self.assertEqual(collection.verify(len(collection), collection.assignments()), [])
+
+    def testProcessors(self):
+        # Equal sliceLUTs on both modules, swapping an algorithm using
+        # processors lowers the processors peak from 60 % to 30 %.
+        a = make_algorithm(0, [make_condition('a', .2, processors=.3)], 'L1_A')
+        b = make_algorithm(1, [make_condition('b', .2, processors=.3)], 'L1_B')
+        c = make_algorithm(2, [make_condition('c', .2)], 'L1_C')
+        d = make_algorithm(3, [make_condition('d', .2)], 'L1_D')
+        collection = make_collection([a, b, c, d])
+        self.assign(collection, [['L1_A', 'L1_B'], ['L1_C', 'L1_D']])
+        self.assertEqual(collection.refine(), 1)
+        self.assertEqual(placement(collection), {'L1_A': 1, 'L1_B': 0, 'L1_C': 0, 'L1_D': 1})
+        for module in collection:
+            self.assertAlmostEqual(module.payload.sliceLUTs, .57)
+            self.assertAlmostEqual(module.payload.processors, .3)
+
+class RedistributeTest(unittest.TestCase):
+
+    def makeMenu(self, changed=False, added=False, removed=False, logic=False):
+        conditions = [make_condition('cond_{0}'.format(index), .05) for index in range(8)]
+        algorithms = [make_algorithm(index, [conditions[index]]) for index in range(8)]
+        if changed:
+            algorithms[2] = make_algorithm(2, [conditions[2], make_condition('cond_new', .01)])
+        if logic: # same name and expression, other condition
+            algorithms[2] = make_algorithm(2, [make_condition('cond_2', .05, algodist.tmEventSetup.SingleEgamma)])
+        if added:
+            algorithms.append(make_algorithm(8, [make_condition('cond_8', .05)]))
+        if removed:
+            del algorithms[5]
+        return make_collection(algorithms)
+
+    def previous(self, modules=3):
+        collection = self.makeMenu()
+        collection.distribute(modules)
+        fp = io.StringIO()
+        collection.dump(fp)
+        fp.seek(0)
+        return placement(collection), algodist.read_distribution(fp)
+
+    def testUnchanged(self):
+        expected, previous = self.previous()
+        collection = self.makeMenu()
+        self.assertEqual(collection.redistribute(previous), [])
+        self.assertEqual(len(collection), 3) # previous number of modules
+        self.assertEqual(placement(collection), expected)
+        digests = [entry.pop('digest') for entry in previous['algorithms']]
+        self.assertEqual(collection.assignments(), previous['algorithms'])
+        self.assertEqual(digests, [plan.algorithm_digest(plan.resolve_algorithm(algorithm)) for algorithm in sorted(collection.algorithm_handles, key=lambda algorithm: algorithm.index)])
+
+    def testSticky(self):
+        expected, previous = self.previous()
+        collection = self.makeMenu(changed=True, added=True)
+        changed = collection.redistribute(previous)
+        current = placement(collection)
+        for name, module_id in expected.items():
+            if name != 'L1_Algorithm_2':
+                self.assertEqual(current[name], module_id, name)
+        # Changed and new algorithms are placed on modules already changed
+        self.assertEqual(current['L1_Algorithm_8'], current['L1_Algorithm_2'])
+        self.assertEqual(changed, sorted(set([expected['L1_Algorithm_2'], current['L1_Algorithm_2']])))
+
+    def testChangedLogic(self):
+        expected, previous = self.previous()
+        collection = self.makeMenu(logic=True)
+        self.assertEqual(collection.changedAlgorithms(previous), set(['L1_Algorithm_2']))
+        self.assertEqual(collection.redistribute(previous), [expected['L1_Algorithm_2']])
+        self.assertEqual(placement(collection), expected)
+
+    def menuJson(self, previous, digests=True, menu_uuid='menu-uuid'):
+        """Returns previous distribution in menu.json format."""
+        data = {
+            'menu_uuid': menu_uuid,
+            'n_modules': previous['n_modules'],
+            'algorithms': [[entry['name'], entry['index'], entry['module_id'], entry['module_index']] for entry in previous['algorithms']],
+        }
+        if digests:
+            data['digests'] = dict((entry['name'], entry['digest']) for entry in previous['algorithms'])
+        return algodist.read_distribution(io.StringIO(json.dumps(data)))
+
+    def testMenuJson(self):
+        expected, previous = self.previous()
+        collection = self.makeMenu(logic=True)
+        self.assertEqual(collection.redistribute(self.menuJson(previous, menu_uuid='other')), [expected['L1_Algorithm_2']])
+        self.assertEqual(placement(collection), expected)
+        # Without digests algorithms are unchanged for the same menu only
+        collection = self.makeMenu()
+        self.assertEqual(collection.redistribute(self.menuJson(previous, digests=False)), [])
+        collection = self.makeMenu()
+        with self.assertLogs(level='WARNING'):
+            changed = collection.redistribute(self.menuJson(previous, digests=False, menu_uuid='other'))
+        self.assertEqual(collection.changedAlgorithms(self.menuJson(previous, digests=False, menu_uuid='other')),
+                         set(expected))
+        self.assertEqual(changed, sorted(set(placement(collection).values())))
+
+    def testSorting(self):
+        expected, previous = self.previous()
+        added = [make_algorithm(8 + index, [make_condition('cond_new_{0}'.format(index), .01 * (index + 1))]) for index in range(3)]
+        names = [algorithm.name for algorithm in added]
+        for reverse_sorting in (False, True):
+            collection = self.makeMenu()
+            for algorithm in added:
+                algorithm.module_id = algorithm.module_index = None
+            collection.algorithm_handles.extend(added)
+            collection.reverse_sorting = reverse_sorting
+            with self.assertLogs(level='INFO') as logs:
+                collection.redistribute(previous)
+            order = [name for line in logs.output for name in names if " . adding {0} ".format(name) in line]
+            self.assertEqual(order, names[::-1] if reverse_sorting else names)
+
+    def testRemoved(self):
+        expected, previous = self.previous()
+        collection = self.makeMenu(removed=True)
+        self.assertEqual(collection.redistribute(previous), [expected['L1_Algorithm_5']])
+        del expected['L1_Algorithm_5']
+        self.assertEqual(placement(collection), expected)
+
+    def testModules(self):
+        expected, previous = self.previous(modules=3)
+        collection = self.makeMenu()
+        changed = collection.redistribute(previous, modules=2)
+        self.assertEqual(len(collection), 2)
+        self.assertIn(2, changed)
+        for name, module_id in expected.items():
+            if module_id < 2:
+                self.assertEqual(placement(collection)[name], module_id, name)
+
+def make_sample():
+    """Returns collection of six algorithms, one using an external condition."""
+    a, b, c = [make_condition(name, .1) for name in 'abc']
+    algorithms = [
+        make_algorithm(0, [a, b]),
+        make_algorithm(1, [b]),
+        make_algorithm(2, [c]),
+        make_algorithm(3, [a, c]),
+        make_algorithm(4, [make_condition('d', .2)]),
+        make_algorithm(5, [make_condition('ext', .01, algodist.kExternals)]),
+    ]
+    return make_collection(algorithms)
+
+class StoredDistributionTest(unittest.TestCase):
+
+    def setUp(self):
+        collection = make_sample()
+        collection.setConstraint(algodist.kExternals, [1])
+        collection.distribute(2)
+        self.expected = placement(collection)
+        self.algorithms = collection.assignments()
+
+    def testAssign(self):
+        collection = make_sample()
+        collection.assign(2, self.algorithms)
+        self.assertEqual(placement(collection), self.expected)
+        self.assertEqual(collection.assignments(), self.algorithms)
+
+    def testAssignErrors(self):
+        unknown = dict(self.algorithms[0], name='L1_Unknown')
+        self.assertRaises(RuntimeError, make_sample().assign, 2, self.algorithms + [unknown])
+        for module_id in (2, -1):
+            invalid = [dict(self.algorithms[0], module_id=module_id)] + self.algorithms[1:]
+            self.assertRaises(RuntimeError, make_sample().assign, 2, invalid)
+
+    def testAssignDuplicate(self):
+        first = self.algorithms[0]
+        with self.assertRaises(ValueError) as context:
+            make_sample().assign(2, self.algorithms + [dict(first, module_index=99)])
+        self.assertEqual(str(context.exception), "algorithm assigned more then once: {index} {name}".format(**first))
+
+    def testAssignMissing(self):
+        first = self.algorithms[0]
+        with self.assertRaises(ValueError) as context:
+            make_sample().assign(2, self.algorithms[1:])
+        self.assertEqual(str(context.exception), "algorithm not assigned: {index} {name}".format(**first))
+
+    def testAssignOverflow(self):
+        # Ceiling is 90 %, module floor 17 %
+        algorithms = [make_algorithm(index, [make_condition(str(index), .3)]) for index in range(3)]
+        collection = make_collection(algorithms)
+        stored = [dict(index=index, name=algorithm.name, module_id=0, module_index=index) for index, algorithm in enumerate(algorithms)]
+        self.assertRaises(algodist.ResourceOverflowError, collection.assign, 1, stored)
+
+    def verify(self, algorithms, constraints=None):
+        collection = make_sample()
+        for condition_type, modules in (constraints or {}).items():
+            collection.setConstraint(condition_type, modules)
+        return collection.verify(2, algorithms)
+
+    def testVerify(self):
+        self.assertEqual(self.verify(self.algorithms), [])
+        first = self.algorithms[0]
+        errors = self.verify(self.algorithms + [dict(first, name='L1_Unknown')])
+        self.assertEqual(errors, ["no such algorithm in menu: {0} L1_Unknown".format(first['index'])])
+        errors = self.verify(self.algorithms + [first])
+        self.assertEqual(errors, ["algorithm assigned more then once: {index} {name}".format(**first)])
+        errors = self.verify(self.algorithms[1:])
+        self.assertIn("algorithm not assigned: {index} {name}".format(**first), errors)
+        self.assertIn("module {0} has non consecutive local indices".format(first['module_id']), errors)
+        errors = self.verify([dict(first, module_id=2)] + self.algorithms[1:])
+        self.assertIn("algorithm {name} assigned to invalid module 2".format(**first), errors)
+
+    def testVerifyConstraints(self):
+        ext = [algorithm for algorithm in self.algorithms if algorithm['name'] == 'L1_Algorithm_5'][0]
+        self.assertEqual(ext['module_id'], 1)
+        errors = self.verify(self.algorithms, {algodist.kExternals: [0]})
+        self.assertEqual(errors, ["algorithm L1_Algorithm_5 on module 1 violates constraint for Externals"])
+
+    def testVerifyCeiling(self):
+        algorithms = [make_algorithm(index, [make_condition(str(index), .3)]) for index in range(3)]
+        collection = make_collection(algorithms)
+        stored = [dict(index=index, name=algorithm.name, module_id=0, module_index=index) for index, algorithm in enumerate(algorithms)]
+        errors = collection.verify(1, stored)
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(errors[0].startswith("module 0 exceeds ceiling"))
+
+    def load(self, data):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'menu.json')
+            with open(filename, 'w') as fp:
+                json.dump(data, fp)
+            collection = make_sample()
+            return algodist.load_distribution(collection.eventSetup, filename, collection.tray)
+        finally:
+            shutil.rmtree(directory)
+
+    def testLoadDistribution(self):
+        data = dict(firmware_uuid='approved-uuid', n_modules=2, algorithms=self.algorithms)
+        collection = self.load(data)
+        self.assertEqual(placement(collection), self.expected)
+        self.assertEqual(collection.eventSetup.getFirmwareUuid(), 'approved-uuid')
+        # menu.json format
+        algorithms = [[a['name'], a['index'], a['module_id'], a['module_index']] for a in self.algorithms]
+        collection = self.load(dict(firmware_uuid='approved-uuid', n_modules=2, algorithms=algorithms))
+        self.assertEqual(placement(collection), self.expected)
+        self.assertEqual(collection.eventSetup.getFirmwareUuid(), 'approved-uuid')
+        # Regenerated if not provided
+        collection = self.load(dict(n_modules=2, algorithms=self.algorithms))
+        self.assertNotIn(collection.eventSetup.getFirmwareUuid(), ('approved-uuid', 'firmware-uuid'))
+
+    def testLoadInvalid(self):
+        data = dict(firmware_uuid='approved-uuid', n_modules=2, algorithms=self.algorithms[1:])
+        self.assertRaises(RuntimeError, self.load, data)
+
+class ReadDistributionTest(unittest.TestCase):
+
+    def testFormats(self):
+        expected = [
+            dict(name='L1_A', index=0, module_id=1, module_index=0),
+            dict(name='L1_B', index=2, module_id=0, module_index=0),
+        ]
+        dump = dict(n_modules=2, algorithms=expected)
+        data = algodist.read_distribution(io.StringIO(json.dumps(dump)))
+        self.assertEqual(data['n_modules'], 2)
+        self.assertEqual(data['algorithms'], expected)
+        menu = dict(n_modules=2, algorithms=[['L1_A', 0, 1, 0], ['L1_B', 2, 0, 0]])
+        data = algodist.read_distribution(io.StringIO(json.dumps(menu)))
+        self.assertEqual(data['algorithms'], expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from tmVhdlProducer import batch
+from tmVhdlProducer import main
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testJobArgv(self):
+        job = {'menu': 'L1Menu_sample.xml', 'dist': 2, 'ratio': 0.5, 'constraint': ['ext:0'], 'dryrun': True, 'update': False}
+        argv = batch.job_argv(job, '/data')
+        self.assertEqual(argv, ['/data/L1Menu_sample.xml', '--dist', '2', '--ratio', '0.5', '--constraint', 'ext:0', '--dryrun'])
+
+    def testLoadManifest(self):
+        filename = os.path.join(self.directory, 'manifest.json')
+        with open(filename, 'w') as fp:
+            json.dump({
+                'defaults': {'modules': 6, 'output': 'output'},
+                'jobs': [
+                    {'menu': 'L1Menu_sample.xml', 'dist': 1},
+                    {'menu': '/data/L1Menu_sample.xml', 'dist': 2, 'modules': 4, 'cache_dir': 'cache', 'output': 'output-2'},
+                ]
+            }, fp)
+        jobs = [main.parse_args(argv) for argv in batch.load_manifest(filename, {'dryrun': True, 'output': '/build'})]
+        self.assertEqual(jobs[0].menu, os.path.join(self.directory, 'L1Menu_sample.xml'))
+        self.assertEqual(jobs[0].modules, 6)
+        self.assertTrue(jobs[0].dryrun)
+        self.assertEqual(jobs[1].menu, '/data/L1Menu_sample.xml')
+        self.assertEqual(jobs[1].modules, 4)
+        self.assertEqual(jobs[1].cache_dir, os.path.join(self.directory, 'cache'))
+        # Command line options overrule the manifest
+        self.assertEqual([job.output for job in jobs], ['/build', '/build'])
+
+    def testRunBatch(self):
+        def run(args, **kwargs):
+            if args.dist == 2:
+                raise RuntimeError("no resources left")
+            self.assertIs(kwargs['tray'], batch._trays[args.config])
+            return main.EXIT_SUCCESS
+        jobs = [main.parse_args(['L1Menu_sample.xml', '--modules', '6', '--dist', str(dist), '--dryrun']) for dist in (1, 2, 3)]
+        with mock.patch.object(main, 'run', side_effect=run):
+            with self.assertLogs(level='ERROR') as logs:
+                self.assertEqual(batch.run_batch(jobs, 1), [batch.EXIT_SUCCESS, batch.EXIT_FAILURE, batch.EXIT_SUCCESS])
+            self.assertIn("job 1 failed", logs.output[0])
+            self.assertIn("RuntimeError: no resources left", logs.output[0])
+            # Jobs in forked worker processes (logged traceback not shown)
+            with mock.patch.object(logging.getLogger(), 'handlers', [logging.NullHandler()]):
+                self.assertEqual(batch.run_batch(jobs, 2), [batch.EXIT_SUCCESS, batch.EXIT_FAILURE, batch.EXIT_SUCCESS])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from urllib.request import urlopen, Request
+from urllib.error import HTTPError
+
+from tmVhdlProducer import daemon
+
+from .helpers import make_condition, make_algorithm, make_collection
+
+class DaemonTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = daemon.ProducerServer(('localhost', 0))
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.start()
+        cls.url = 'http://localhost:{0}'.format(cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.thread.join()
+
+    def request(self, path, data=None, content_type='application/json'):
+        body = None if data is None else json.dumps(data).encode()
+        headers = {} if data is None else {'Content-Type': content_type}
+        try:
+            response = urlopen(Request(self.url + path, body, headers))
+        except HTTPError as e:
+            response = e
+        with response:
+            return response.getcode(), json.loads(response.read().decode())
+
+    def testMenus(self):
+        code, data = self.request('/menus')
+        self.assertEqual(code, 200)
+        self.assertEqual(data['menus'], [])
+        code, data = self.request('/invalidate', {})
+        self.assertEqual(code, 200)
+        self.assertEqual(data['removed'], 0)
+
+    def testErrors(self):
+        code, data = self.request('/missing', {})
+        self.assertEqual(code, 404)
+        code, data = self.request('/distribute', [])
+        self.assertEqual(code, 400)
+        self.assertIn('error', data)
+
+    def testContentType(self):
+        # Reject cross site requests a browser sends without preflight
+        for content_type in ('text/plain', 'application/x-www-form-urlencoded', 'multipart/form-data'):
+            code, data = self.request('/invalidate', {}, content_type)
+            self.assertEqual(code, 415)
+            self.assertIn('error', data)
+        code, data = self.request('/invalidate', {}, 'application/json; charset=utf-8')
+        self.assertEqual(code, 200)
+
+    def testConcurrentDistribute(self):
+        # Sweeps of concurrent requests do not share state
+        barrier = threading.Barrier(2)
+        def load_menu(filename, tray, cache):
+            name = os.path.splitext(os.path.basename(filename))[0]
+            algorithms = []
+            for index in range(24):
+                condition = make_condition('{0}_{1}'.format(name, index), .01 * (index % 5 + 1))
+                algorithms.append(make_algorithm(index, [condition], 'L1_{0}_{1}'.format(name, index)))
+            barrier.wait(10)
+            return make_collection(algorithms).eventSetup
+        directory = tempfile.mkdtemp()
+        interval = sys.getswitchinterval()
+        try:
+            options = {}
+            for name in ('A', 'B'):
+                filename = os.path.join(directory, '{0}.xml'.format(name))
+                with open(filename, 'w') as fp:
+                    fp.write(name)
+                options[name] = {'menu': filename, 'modules': 2, 'sweep': True, 'sweep_modules': '2-4', 'sweep_ratio': '0:0.5:0.1'}
+            responses = {}
+            def distribute(name):
+                responses[name] = self.request('/distribute', options[name])
+            sys.setswitchinterval(1e-6) # interleave the sweeps
+            with mock.patch.object(daemon, 'load_menu', load_menu):
+                threads = [threading.Thread(target=distribute, args=(name,)) for name in options]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+            shutil.rmtree(directory)
+        for name, (code, data) in responses.items():
+            self.assertEqual(code, 200, data)
+            names = sorted(algorithm[0] for algorithm in data['algorithms'])
+            self.assertEqual(names, sorted('L1_{0}_{1}'.format(name, index) for index in range(24)))
+
+if __name__ == '__main__':
+    unittest.main()
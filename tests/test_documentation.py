@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+
+from tmVhdlProducer import documentation
+
+class ReporterStub(object):
+
+    def __init__(self):
+        self.threads = set()
+
+    def write_html(self, filename):
+        self.threads.add(threading.get_ident())
+        with open(filename, 'w') as fp:
+            fp.write('<html/>')
+
+    def write_twiki(self, filename):
+        self.threads.add(threading.get_ident())
+        with open(filename, 'w') as fp:
+            fp.write('---+ L1Menu_sample')
+
+class DocumentationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testFilename(self):
+        filename = documentation.document_filename('doc', 'L1Menu_sample', 2, 'html')
+        self.assertEqual(filename, os.path.join('doc', 'L1Menu_sample-d2.html'))
+
+    def testWriteInprocess(self):
+        reporter = ReporterStub()
+        with mock.patch.object(documentation, 'create_reporter', return_value=reporter) as create_reporter:
+            with ThreadPoolExecutor(2) as executor:
+                future = documentation.write_documentation(executor, 'L1Menu_sample-d1.xml', self.directory, 'L1Menu_sample', 1)
+                filenames = future.result()
+        create_reporter.assert_called_once_with('L1Menu_sample-d1.xml')
+        self.assertEqual(len(reporter.threads), 1)
+        self.assertEqual(sorted(os.listdir(self.directory)), ['L1Menu_sample-d1.html', 'L1Menu_sample-d1.twiki'])
+        self.assertEqual([os.path.basename(filename) for filename in filenames], ['L1Menu_sample-d1.html', 'L1Menu_sample-d1.twiki'])
+
+    def testFallback(self):
+        with mock.patch.object(documentation, 'tmReporter', None):
+            with self.assertLogs(level='INFO') as logs:
+                self.assertIsNone(documentation.create_reporter('L1Menu_sample-d1.xml'))
+        self.assertEqual(logs.output, ["INFO:root:tm-reporter API not available, using tm-reporter executable"])
+
+if __name__ == '__main__':
+    unittest.main()
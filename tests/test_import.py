@@ -0,0 +1,30 @@
+import subprocess
+import sys
+import unittest
+
+HeavyModules = (
+    'tmEventSetup',
+    'tmGrammar',
+    'tmTable',
+    'tmReporter',
+    'jinja2',
+    'tmVhdlProducer.algodist',
+    'tmVhdlProducer.vhdlproducer',
+)
+"""Modules not to be imported by the entry point."""
+
+def run_python(code):
+    """Runs code in a fresh interpreter, returns completed process."""
+    command = [sys.executable, '-c', code]
+    return subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+class ImportTest(unittest.TestCase):
+
+    def testLazyImports(self):
+        code = "import sys, tmVhdlProducer.__main__; print('\\n'.join(sys.modules))"
+        modules = run_python(code).stdout.split()
+        for module in HeavyModules:
+            self.assertNotIn(module, modules)
+
+if __name__ == '__main__':
+    unittest.main()
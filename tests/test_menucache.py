@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tmVhdlProducer import menucache
+
+class MenuStub(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def getName(self):
+        return self.name
+
+class MenuCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testKey(self):
+        cache = menucache.MenuCache(self.directory)
+        menu = os.path.join(self.directory, 'menu.xml')
+        config = os.path.join(self.directory, 'config.json')
+        with open(menu, 'w') as fp:
+            fp.write('<menu/>')
+        with open(config, 'w') as fp:
+            fp.write('{}')
+        key = cache.key(menu, config)
+        self.assertEqual(key, cache.key(menu, config))
+        with open(menu, 'w') as fp:
+            fp.write('<menu></menu>')
+        self.assertNotEqual(key, cache.key(menu, config))
+
+    def testStoreLoad(self):
+        cache = menucache.MenuCache(self.directory)
+        self.assertIsNone(cache.load('a'))
+        cache.store('a', {'name': 'L1Menu_Sample'})
+        self.assertEqual(cache.load('a'), {'name': 'L1Menu_Sample'})
+        cache.remove('a')
+        self.assertIsNone(cache.load('a'))
+
+    def testEvict(self):
+        cache = menucache.MenuCache(self.directory, max_size=1)
+        for key in ('a', 'b', 'c'):
+            cache.store(key, list(range(100)))
+            os.utime(cache.path(key), (0, len(cache.entries())))
+        self.assertEqual(len(cache.entries()), 1)
+        self.assertIsNotNone(cache.load('c'))
+
+class MemoryMenuCacheTest(unittest.TestCase):
+
+    def testStoreLoad(self):
+        cache = menucache.MemoryMenuCache()
+        self.assertIsNone(cache.load('a'))
+        menu = MenuStub('L1Menu_sample')
+        cache.store('a', menu)
+        loaded = cache.load('a')
+        self.assertEqual(loaded.name, 'L1Menu_sample')
+        self.assertIsNot(loaded, cache.load('a'))
+        self.assertEqual(cache.entries()[0][:2], ('a', 'L1Menu_sample'))
+        self.assertTrue(cache.remove('a'))
+        self.assertFalse(cache.remove('a'))
+        cache.store('a', menu)
+        self.assertEqual(cache.clear(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+
+from tmVhdlProducer import options
+from tmVhdlProducer import main
+
+class RangeTest(unittest.TestCase):
+
+    def testExpandRange(self):
+        self.assertEqual(options.expand_range("3"), [3])
+        self.assertEqual(options.expand_range("4-6"), [4, 5, 6])
+        self.assertRaises(ValueError, options.expand_range, "6-4")
+        self.assertRaises(ValueError, options.expand_range, "1-2-3")
+
+    def testParseRange(self):
+        self.assertEqual(options.parse_range("2,4-7,5,9"), [2, 4, 5, 6, 7, 9])
+        self.assertEqual(options.constraint_t("ext:2,4-6"), ("ext", [2, 4, 5, 6]))
+
+    def testSweepModules(self):
+        self.assertEqual(main.modules_range_t("4-6"), [4, 5, 6])
+        args = main.parse_args(['L1Menu_sample.xml', '--modules', '6', '--dist', '1', '--sweep', '--sweep-modules', '4-6'])
+        self.assertEqual(args.sweep_modules, [4, 5, 6])
+        self.assertRaises(ValueError, main.modules_range_t, "30-33")
+
+    def testPreviousModules(self):
+        args = main.parse_args(['L1Menu_sample.xml', '--dist', '2', '--previous', 'menu.json'])
+        self.assertIsNone(args.modules) # defaults to previous number of modules
+        with self.assertRaises(SystemExit):
+            main.parse_args(['L1Menu_sample.xml', '--dist', '2'])
+
+if __name__ == '__main__':
+    unittest.main()
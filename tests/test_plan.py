@@ -0,0 +1,54 @@
+import io
+import unittest
+
+from tmVhdlProducer import algodist
+from tmVhdlProducer import plan
+from tmVhdlProducer.handles import Payload
+from tmVhdlProducer.handles import ConditionHandle
+
+def make_condition(name):
+    return plan.PlanCondition(name=name, type=algodist.kSingleMuon, objects=[], cuts=[], payload=Payload(.01, 0))
+
+def make_algorithm(index, conditions, module_id, module_index):
+    return plan.PlanAlgorithm(index=index, name="L1_Algorithm_{0}".format(index),
+                              expression=" AND ".join(condition.name for condition in conditions),
+                              expression_in_condition=" AND ".join(condition.name for condition in conditions),
+                              conditions=conditions, module_id=module_id, module_index=module_index)
+
+class FirmwarePlanTest(unittest.TestCase):
+
+    def testDumpLoad(self):
+        a, b = make_condition('a'), make_condition('b')
+        algorithms = [
+            make_algorithm(0, [a, b], 1, 0),
+            make_algorithm(1, [b], 0, 1),
+            make_algorithm(2, [a], 0, 0),
+        ]
+        info = dict(name='L1Menu_Sample', uuid_menu='0', uuid_firmware='1', scale_set='scales', version='0.7.4')
+        fp = io.StringIO()
+        plan.FirmwarePlan(info, 2, {'a': a, 'b': b}, algorithms).dump(fp)
+        fp.seek(0)
+        firmware = plan.FirmwarePlan.load(fp)
+        self.assertEqual(firmware.eventSetup.getName(), 'L1Menu_Sample')
+        self.assertEqual(len(firmware), 2)
+        self.assertEqual([algorithm.index for algorithm in firmware.modules[0]], [2, 1])
+        self.assertEqual([algorithm.index for algorithm in firmware.modules[1]], [0])
+        algorithm = firmware.algorithms[0]
+        self.assertEqual([condition.name for condition in algorithm], ['a', 'b'])
+        self.assertIs(algorithm.conditions[0], firmware.condition_handles['a'])
+        self.assertAlmostEqual(algorithm.payload.sliceLUTs, .02)
+
+    def testResolve(self):
+        handle = plan.restore(ConditionHandle, name='a', type=algodist.tmEventSetup.SingleMuon,
+                              objects=[], cuts=[], payload=Payload(.01, 0))
+        condition = plan.resolve_condition(handle)
+        self.assertEqual(condition.type, algodist.kSingleMuon)
+        self.assertTrue(condition.isMuonCondition())
+        self.assertEqual(plan.algorithm_digest(plan.resolve_algorithm(make_algorithm(0, [handle], 0, 0))),
+                         plan.algorithm_digest(make_algorithm(0, [condition], 0, 0)))
+
+    def testVersion(self):
+        self.assertRaises(ValueError, plan.FirmwarePlan.load, io.StringIO('{"format": "tm-vhdlproducer-plan", "version": 0}'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from tmVhdlProducer import runcontext
+from tmVhdlProducer import documentation
+
+from .test_documentation import ReporterStub
+
+class RecordCollector(logging.Handler):
+
+    def __init__(self):
+        super(RecordCollector, self).__init__(logging.DEBUG)
+        self.addFilter(runcontext.RunFilter())
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+class RunContextTest(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('tm-vhdlproducer-test')
+        self.logger.setLevel(logging.DEBUG)
+
+    def testScope(self):
+        self.assertIsNone(runcontext.current())
+        self.assertRaises(RuntimeError, runcontext.RunFilter)
+        with runcontext.scope() as run:
+            self.assertIs(runcontext.current(), run)
+            with runcontext.scope() as inner:
+                self.assertIs(inner, run) # runs belong to the enclosing run
+        self.assertIsNone(runcontext.current())
+        with runcontext.scope() as other:
+            self.assertIsNot(other, run)
+
+    def testFilter(self):
+        def concurrent_run():
+            with runcontext.scope():
+                self.logger.info("other run")
+        with runcontext.scope():
+            collector = RecordCollector()
+            self.logger.addHandler(collector)
+            try:
+                self.logger.info("this run")
+                thread = threading.Thread(target=concurrent_run)
+                thread.start()
+                thread.join()
+                with ThreadPoolExecutor(1) as executor:
+                    executor.submit(self.logger.info, "plain thread").result()
+                with runcontext.ContextExecutor(1) as executor:
+                    executor.submit(self.logger.info, "context thread").result()
+            finally:
+                self.logger.removeHandler(collector)
+        self.assertEqual(collector.messages, ["this run", "context thread"])
+
+    def testQuiet(self):
+        # Records below warning are suppressed in the quiet context only
+        with self.assertLogs(level='INFO') as logs:
+            with runcontext.quiet():
+                logging.info("suppressed")
+                logging.warning("warning")
+                thread = threading.Thread(target=logging.info, args=("other context",))
+                thread.start()
+                thread.join()
+            logging.info("after")
+        self.assertEqual([record.getMessage() for record in logs.records], ["warning", "other context", "after"])
+
+    def testDocumentation(self):
+        # Log records of documentation threads belong to the run
+        directory = tempfile.mkdtemp()
+        root = logging.getLogger()
+        level = root.level
+        root.setLevel(logging.INFO)
+        try:
+            with runcontext.scope():
+                collector = RecordCollector()
+                root.addHandler(collector)
+                try:
+                    with runcontext.ContextExecutor(2) as executor:
+                        target = documentation.document_filename(directory, 'L1Menu_sample', 1, 'html')
+                        executor.submit(documentation.write_document, ReporterStub(), 'L1Menu_sample-d1.xml', 'html', target).result()
+                finally:
+                    root.removeHandler(collector)
+        finally:
+            root.setLevel(level)
+            shutil.rmtree(directory)
+        self.assertEqual(collector.messages, ["writing HTML documentation {0}".format(target)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from tmVhdlProducer import stats
+from tmVhdlProducer import algodist
+from tmVhdlProducer import vhdlproducer
+
+from .helpers import ConditionStub, AlgorithmStub
+
+class StatsTest(unittest.TestCase):
+
+    def setUp(self):
+        stats.reset()
+
+    def tearDown(self):
+        stats.reset()
+
+    def testCounters(self):
+        self.assertEqual(set(stats.counters()), set(name for name, _ in stats.Counters))
+        self.assertFalse(any(stats.counters().values()))
+        stats.increment('template.renders')
+        stats.increment('shadowed.comparisons', 3)
+        self.assertEqual(stats.counters()['template.renders'], 1)
+        self.assertEqual(stats.counters()['shadowed.comparisons'], 3)
+        self.assertEqual(len(stats.report()), len(stats.Counters))
+
+    def testCollect(self):
+        stats.increment('template.renders')
+        marker = stats.mark()
+        stats.increment('template.renders', 2)
+        counts = stats.collect(marker)
+        self.assertEqual(counts, {'template.renders': 2})
+        stats.merge(counts)
+        self.assertEqual(stats.counters()['template.renders'], 5)
+
+    def testContext(self):
+        # Resetting counters of a concurrent run keeps counters of this run
+        def concurrent_run():
+            stats.reset()
+            stats.increment('template.renders', 5)
+            counts.append(stats.counters()['template.renders'])
+        counts = []
+        stats.increment('template.renders')
+        thread = threading.Thread(target=concurrent_run)
+        thread.start()
+        thread.join()
+        self.assertEqual(counts, [5])
+        self.assertEqual(stats.counters()['template.renders'], 1)
+
+    def testDump(self):
+        stats.increment('measure.calls')
+        fp = io.StringIO()
+        stats.dump(fp, menu_name='L1Menu_sample')
+        data = json.loads(fp.getvalue())
+        self.assertEqual(data['format'], stats.StatsFormat)
+        self.assertEqual(data['menu_name'], 'L1Menu_sample')
+        self.assertEqual(data['counters']['measure.calls'], 1)
+
+    def testAppend(self):
+        tray = algodist.ResourceTray(algodist.DefaultConfigFile)
+        module = algodist.Module(0, tray)
+        module.append(AlgorithmStub(0, [ConditionStub('a', .01)]))
+        with self.assertRaises(algodist.ResourceOverflowError):
+            module.append(AlgorithmStub(1, [ConditionStub('b', 2.)]))
+        self.assertEqual(stats.counters()['append.attempts'], 2)
+        self.assertEqual(stats.counters()['append.rejected'], 1)
+
+    def testShadowed(self):
+        a, b, c = [ConditionStub(name, .01) for name in 'abc']
+        stack = [AlgorithmStub(0, [a, b]), AlgorithmStub(1, [c])]
+        index = algodist.ShadowIndex(stack)
+        index.shadowed(['a'], 1.0)
+        self.assertEqual(stats.counters()['shadowed.comparisons'], 1)
+
+    def testTemplates(self):
+        directory = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(directory, 'module.vhd'), 'w') as fp:
+                fp.write("{{ value }}")
+            engine = vhdlproducer.TemplateEngine(directory, cache_dir=None)
+            engine.render('module.vhd', {'value': 42})
+            engine.stream('module.vhd', {'value': 42}, io.StringIO())
+            self.assertEqual(stats.counters()['template.renders'], 2)
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest.main()
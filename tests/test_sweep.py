@@ -0,0 +1,64 @@
+import unittest
+
+from tmVhdlProducer import algodist
+from tmVhdlProducer import sweep
+
+from .helpers import make_condition, make_algorithm, make_collection, placement
+
+def make_sample():
+    """Returns collection of ten algorithms, one using an external condition."""
+    algorithms = [make_algorithm(index, [make_condition('cond_{0}'.format(index), .1)]) for index in range(9)]
+    algorithms.append(make_algorithm(9, [make_condition('ext_0', .01, algodist.kExternals)]))
+    return make_collection(algorithms)
+
+class SweepTest(unittest.TestCase):
+
+    def testParams(self):
+        params = sweep.sweep_params([2, 3], ratios=[0.0, 0.5], constraints={algodist.kExternals: [0]},
+                                    alternatives=[{algodist.kExternals: [1]}])
+        self.assertEqual(len(params), 8)
+        self.assertEqual(params[0].constraints, ((algodist.kExternals, (0,)),))
+        self.assertEqual(params[1].constraints, ((algodist.kExternals, (1,)),))
+
+    def testRank(self):
+        collection = make_sample()
+        params = sweep.sweep_params([1, 2, 3])
+        results = sweep.sweep(collection, params, jobs=1)
+        # 1 module exceeds resources, 3 modules lower the peak payload
+        self.assertEqual([result.params.modules for result in results], [3, 2, 1])
+        self.assertIsNone(results[-1].algorithms)
+        self.assertLess(results[0].peak, results[1].peak)
+
+    def testMissingConstraints(self):
+        collection = make_sample()
+        params = sweep.sweep_params([2, 3], alternatives=[{algodist.kExternals: [2]}])
+        missing = [p for p in params if sweep.missing_constraints(collection, p)]
+        self.assertEqual(len(missing), 1)
+        self.assertEqual(missing[0].modules, 2)
+        for placement_ in (algodist.PlacementLightest, algodist.PlacementMarginal):
+            results = sweep.sweep(make_sample(), sweep.sweep_params([2, 3], placements=[placement_],
+                                  alternatives=[{algodist.kExternals: [2]}]), jobs=1)
+            self.assertEqual(len(results), 4)
+            invalid = [result for result in results if result.algorithms is None]
+            self.assertEqual([(result.params.modules, result.params.constraints) for result in invalid],
+                             [(2, ((algodist.kExternals, (2,)),))])
+
+    def testApplyResult(self):
+        collection = make_sample()
+        params = sweep.sweep_params([3], constraints={algodist.kExternals: [2]})
+        results = sweep.sweep(collection, params, jobs=1)
+        sweep.apply_result(collection, results[0])
+        self.assertEqual(len(collection), 3)
+        self.assertEqual(placement(collection)['L1_Algorithm_9'], 2)
+        self.assertEqual(collection.assignments(), results[0].algorithms)
+        failed = sweep.SweepResult(params[0], None, None, None)
+        self.assertRaises(algodist.ResourceOverflowError, sweep.apply_result, collection, failed)
+
+    def testJobs(self):
+        params = sweep.sweep_params([2, 3], ratios=[0.0, 0.5])
+        serial = sweep.sweep(make_sample(), params, jobs=1)
+        parallel = sweep.sweep(make_sample(), params, jobs=2)
+        self.assertEqual(serial, parallel)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from tmVhdlProducer import tracing
+from tmVhdlProducer import runcontext
+from tmVhdlProducer import vhdlproducer
+
+class TracingTest(unittest.TestCase):
+
+    def tearDown(self):
+        tracing.disable()
+
+    def testDisabled(self):
+        self.assertFalse(tracing.enabled())
+        with tracing.span('distribute') as span:
+            self.assertIsInstance(span, tracing.NullSpan)
+        self.assertEqual(tracing.mark(), 0)
+        self.assertEqual(tracing.collect(0), [])
+
+    def testSpans(self):
+        tracer = tracing.enable()
+        with tracing.span('outer', modules=6):
+            with tracing.span('inner'):
+                pass
+        events = [event for event in tracer.events if event['ph'] == 'X']
+        self.assertEqual([event['name'] for event in events], ['inner', 'outer'])
+        inner, outer = events
+        self.assertLessEqual(outer['ts'], inner['ts'])
+        self.assertGreaterEqual(outer['ts'] + outer['dur'], inner['ts'] + inner['dur'])
+        self.assertEqual(outer['args'], {'modules': 6})
+        fp = io.StringIO()
+        tracing.disable().dump(fp)
+        data = json.loads(fp.getvalue())
+        self.assertEqual(len(data['traceEvents']), len(tracer.events))
+
+    def testCollect(self):
+        tracing.enable()
+        marker = tracing.mark()
+        with tracing.span('worker'):
+            pass
+        events = tracing.collect(marker)
+        self.assertEqual(events[-1]['name'], 'worker')
+        self.assertEqual(tracing.mark(), marker)
+
+    def testContext(self):
+        # Concurrent runs record separate traces, helper threads of a
+        # run record into the trace of the run.
+        def concurrent_run():
+            tracers.append(tracing.active())
+            tracer = tracing.enable()
+            with tracing.span('other'):
+                pass
+            tracing.disable()
+            tracers.append(tracer)
+        def helper(name):
+            with tracing.span(name):
+                pass
+        tracers = []
+        tracer = tracing.enable()
+        thread = threading.Thread(target=concurrent_run)
+        thread.start()
+        thread.join()
+        with runcontext.ContextExecutor(1) as executor:
+            executor.submit(helper, 'helper').result()
+        thread = threading.Thread(target=helper, args=('thread',))
+        thread.start()
+        thread.join()
+        self.assertIs(tracing.active(), tracer)
+        self.assertIsNone(tracers[0])
+        self.assertIsNot(tracers[1], tracer)
+        names = [event['name'] for event in tracer.events if event['ph'] == 'X']
+        self.assertEqual(names, ['helper'])
+        names = [event['name'] for event in tracers[1].events if event['ph'] == 'X']
+        self.assertEqual(names, ['other'])
+
+    def testTemplates(self):
+        directory = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(directory, 'module.vhd'), 'w') as fp:
+                fp.write("{% for item in items %}{% include 'instance.j2' %}{% endfor %}")
+            with open(os.path.join(directory, 'instance.j2'), 'w') as fp:
+                fp.write("{{ item }}\n")
+            # Tracing is decided on rendering, not on creating the engine
+            engine = vhdlproducer.TemplateEngine(directory, cache_dir=None)
+            tracer = tracing.enable()
+            self.assertEqual(engine.render('module.vhd', {'items': [1, 2]}), "12")
+            names = [event['name'] for event in tracer.events if event.get('cat') == 'template']
+            self.assertEqual(names, ['instance.j2', 'instance.j2', 'module.vhd'])
+            tracing.disable()
+            self.assertEqual(engine.render('module.vhd', {'items': [1, 2]}), "12")
+            self.assertEqual(len(tracer.events), 4)
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest.main()
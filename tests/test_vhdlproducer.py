@@ -1,6 +1,137 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
+from unittest import mock
+
+import jinja2
+import tmTable
 
 from tmVhdlProducer import vhdlproducer
+from tmVhdlProducer import plan
+from tmVhdlProducer import algodist
+from tmVhdlProducer.algodist import ProjectDir
+from tmVhdlProducer.algodist import tmEventSetup
+from tmVhdlProducer.handles import Payload
+from tmVhdlProducer.handles import CutValueHandle
+from tmVhdlProducer.handles import CutHandle
+from tmVhdlProducer.handles import ObjectHandle
+from tmVhdlProducer.handles import ConditionHandle
+from tmVhdlProducer.handles import AlgorithmHandle
+from tmVhdlProducer.handles import MenuHandle
+
+TemplateDir = os.path.join(ProjectDir, 'templates', 'vhdl')
+
+RenderPlan = """
+import sys
+for module in ('tmEventSetup', 'tmGrammar', 'tmTable'):
+    sys.modules[module] = None # blocks the import
+from tmVhdlProducer.plan import FirmwarePlan
+from tmVhdlProducer.vhdlproducer import VhdlProducer
+with open(sys.argv[1]) as fp:
+    firmware = FirmwarePlan.load(fp)
+VhdlProducer(sys.argv[2], cache_dir=None).write(firmware, sys.argv[3])
+print('\\n'.join(sys.modules))
+"""
+"""Renders a firmware plan with the event setup blocked."""
+
+Conditions = (
+    ('SingleMU10', algodist.kSingleMuon, [algodist.kMuon], 21),
+    ('DoubleMU3', algodist.kDoubleMuon, [algodist.kMuon, algodist.kMuon], 7),
+    ('SingleJET60', algodist.kSingleJet, [algodist.kJet], 120),
+    ('DoubleEG8', algodist.kDoubleEgamma, [algodist.kEgamma, algodist.kEgamma], 16),
+    ('ETT100', algodist.kTotalEt, [algodist.kETT], 200),
+)
+"""Sample conditions (name, condition type, object types, threshold)."""
+
+Assignments = (
+    (['SingleMU10'], 0), (['DoubleMU3', 'SingleJET60'], 1), (['SingleJET60'], 0),
+    (['DoubleEG8'], 1), (['ETT100'], 0), (['SingleMU10', 'ETT100'], 1),
+)
+"""Sample algorithms (condition names, module id)."""
+
+def make_condition(name, type, object_types, threshold):
+    objects = []
+    for i, object_type in enumerate(object_types):
+        cut = dict(name='{0}_thr'.format(name), cut_type=algodist.kThreshold,
+                   minimum=[threshold, float(threshold)], maximum=[0, .0], data='',
+                   precision=0, precision_pt=0, precision_math=0)
+        objects.append(dict(name='{0}_{1}'.format(name, i), type=object_type,
+                            comparison_operator=algodist.kGE, bx_offset=0,
+                            external_signal_name='', external_channel_id=0, cuts=[cut]))
+    return plan.decode_condition(dict(name=name, type=type, objects=objects, cuts=[], payload=[.01, .0]))
+
+def make_condition_handle(name, type, object_types, threshold):
+    """Returns condition handle (using event setup enumerations) of a sample
+    condition.
+    """
+    objects = []
+    for i, object_type in enumerate(object_types):
+        cut = plan.restore(CutHandle, name='{0}_thr'.format(name), object_type=getattr(tmEventSetup, object_type),
+                           cut_type=tmEventSetup.Threshold,
+                           minimum=plan.restore(CutValueHandle, index=threshold, value=float(threshold)),
+                           maximum=plan.restore(CutValueHandle, index=0, value=.0), data='',
+                           precision=0, precision_pt=0, precision_math=0)
+        objects.append(plan.restore(ObjectHandle, name='{0}_{1}'.format(name, i), type=getattr(tmEventSetup, object_type),
+                                    comparison_operator=tmEventSetup.GE, bx_offset=0,
+                                    external_signal_name='', external_channel_id=0, cuts=[cut]))
+    return plan.restore(ConditionHandle, name=name, type=getattr(tmEventSetup, type), objects=objects, cuts=[],
+                        payload=Payload(.01, .0))
+
+def make_plan(uuid_firmware='3f5d9a1c-0b4e-4c2f-9e1a-7d6b8c9e0f12'):
+    """Returns firmware plan of six algorithms distributed on two modules."""
+    conditions = dict((item[0], make_condition(*item)) for item in Conditions)
+    algorithms = []
+    counts = [0, 0]
+    for index, (names, module_id) in enumerate(Assignments):
+        expression = " AND ".join(names)
+        algorithms.append(plan.decode_algorithm(dict(
+            index=index, name="L1_Algorithm_{0}".format(index), expression=expression,
+            expression_in_condition=expression, module_id=module_id,
+            module_index=counts[module_id], conditions=names), conditions))
+        counts[module_id] += 1
+    info = dict(name='L1Menu_Sample', name_hash=0x1f2e3d4c, uuid_menu='8a9b0c1d-2e3f-4a5b-8c7d-9e0f1a2b3c4d',
+                uuid_firmware=uuid_firmware, uuid_firmware_hash=0x5a6b7c8d, scale_set='scales', version='0.7.4')
+    return plan.FirmwarePlan(info, 2, conditions, algorithms)
+
+def make_collection(modules):
+    """Returns module collection of the sample conditions and algorithms
+    distributed on *modules* modules (regenerating the firmware UUID).
+    """
+    conditions = dict((item[0], make_condition_handle(*item)) for item in Conditions)
+    algorithms = []
+    for index, (names, module_id) in enumerate(Assignments):
+        expression = " AND ".join(names)
+        algorithms.append(plan.restore(AlgorithmHandle, index=index, name="L1_Algorithm_{0}".format(index),
+                                       expression=expression, expression_in_condition=expression,
+                                       conditions=[conditions[name] for name in names],
+                                       module_id=None, module_index=None, payload=Payload(.01 * len(names), .0)))
+    menu = plan.restore(MenuHandle, name='L1Menu_Sample', menu_uuid='8a9b0c1d-2e3f-4a5b-8c7d-9e0f1a2b3c4d',
+                        firmware_uuid='3f5d9a1c-0b4e-4c2f-9e1a-7d6b8c9e0f12', scale_set_name='scales',
+                        version='0.7.4', condition_handles=conditions, algorithm_handles=algorithms)
+    collection = algodist.ModuleCollection(menu, algodist.ResourceTray(algodist.DefaultConfigFile))
+    collection.distribute(modules)
+    return collection
+
+class MenuTableStub(object):
+    """Provides the attributes of a tmTable menu used by writeXmlMenu."""
+
+    def __init__(self, names):
+        self.menu = {'name': 'L1Menu_Sample', 'uuid_menu': '', 'uuid_firmware': '', 'n_modules': '0', 'is_valid': '0'}
+        self.algorithms = [{'name': name, 'expression': name, 'index': '0', 'module_id': '0', 'module_index': '0'} for name in names]
+
+def read_files(directory):
+    """Returns mapping of relative filenames to contents of a directory tree."""
+    files = {}
+    for root, dirs, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            with open(path, 'rb') as fp:
+                files[os.path.relpath(path, directory)] = fp.read()
+    return files
 
 class VhdlProducerTest(unittest.TestCase):
 
@@ -16,5 +147,227 @@ class VhdlProducerTest(unittest.TestCase):
         r = vhdlproducer.bx_encode(2)
         self.assertEqual(r, 'p2')
 
+    def testTemplates(self):
+        # Every template shipped compiles and uses known filters only
+        engine = vhdlproducer.TemplateEngine(TemplateDir, cache_dir=None)
+        names = engine.preload()
+        for template in vhdlproducer.ModuleTemplates:
+            self.assertIn(template, names)
+        files = []
+        for root, dirs, filenames in os.walk(TemplateDir):
+            files.extend(os.path.relpath(os.path.join(root, filename), TemplateDir).replace(os.sep, '/') for filename in filenames)
+        self.assertEqual(sorted(names), sorted(files))
+
+    def testPreloadErrors(self):
+        sources = (
+            "{% for item in items %}{{ item }}",
+            "{{ value|no_such_filter }}",
+            "{% if value %}{{ value|no_such_filter }}{% endif %}",
+            "{% if value is no_such_test %}{{ value }}{% endif %}",
+        )
+        for source in sources:
+            directory = tempfile.mkdtemp()
+            try:
+                with open(os.path.join(directory, 'module.vhd'), 'w') as fp:
+                    fp.write(source)
+                engine = vhdlproducer.TemplateEngine(directory, cache_dir=None)
+                self.assertRaises(jinja2.TemplateSyntaxError, engine.preload)
+            finally:
+                shutil.rmtree(directory)
+
+    def testStream(self):
+        directory = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(directory, 'items.txt'), 'w') as fp:
+                fp.write("{% for item in items %}{{ item }}\n{% endfor %}")
+            engine = vhdlproducer.TemplateEngine(directory, cache_dir=None)
+            data = {'items': list(range(1000))}
+            filename = os.path.join(directory, 'items.out')
+            with open(filename, 'w') as fp:
+                engine.stream('items.txt', data, fp, buffer_size=16)
+            with open(filename) as fp:
+                self.assertEqual(fp.read(), engine.render('items.txt', data))
+        finally:
+            shutil.rmtree(directory)
+
+    def testUpdateFile(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'module.vhd')
+            digest, changed = vhdlproducer.update_file(filename, lambda fp: fp.write(b'foo'))
+            self.assertTrue(changed)
+            self.assertEqual(digest, vhdlproducer.file_digest(filename))
+            os.utime(filename, (0, 0))
+            digest, changed = vhdlproducer.update_file(filename, lambda fp: fp.write(b'foo'))
+            self.assertFalse(changed)
+            self.assertEqual(os.stat(filename).st_mtime, 0)
+            digest, changed = vhdlproducer.update_file(filename, lambda fp: fp.write(b'bar'))
+            self.assertTrue(changed)
+            with open(filename, 'rb') as fp:
+                self.assertEqual(fp.read(), b'bar')
+            self.assertEqual(os.listdir(directory), ['module.vhd'])
+        finally:
+            shutil.rmtree(directory)
+
+    def testBytecodeCache(self):
+        directory = tempfile.mkdtemp()
+        try:
+            engine = vhdlproducer.TemplateEngine(TemplateDir, cache_dir=directory)
+            names = engine.preload()
+            cached = []
+            for root, dirs, files in os.walk(directory):
+                cached.extend(files)
+            self.assertEqual(len(cached), len(names))
+        finally:
+            shutil.rmtree(directory)
+
+class WriteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.producer = vhdlproducer.VhdlProducer(TemplateDir, cache_dir=None)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testParallel(self):
+        serial = os.path.join(self.directory, 'serial')
+        parallel = os.path.join(self.directory, 'parallel')
+        self.producer.write(make_plan(), serial, jobs=1)
+        self.producer.write(make_plan(), parallel, jobs=2)
+        files = read_files(serial)
+        self.assertIn(os.path.join('vhdl', 'module_1', 'src', 'gtl_module_instances.vhd'), files)
+        self.assertIn(os.path.join('xml', 'manifest.json'), files)
+        self.assertEqual(files, read_files(parallel))
+
+    def testWithoutEventSetup(self):
+        filename = os.path.join(self.directory, 'plan.json')
+        with open(filename, 'w') as fp:
+            make_plan().dump(fp)
+        output = os.path.join(self.directory, 'output')
+        command = [sys.executable, '-c', RenderPlan, filename, TemplateDir, output]
+        process = subprocess.run(command, cwd=os.path.dirname(ProjectDir), stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        modules = process.stdout.split()
+        for module in ('tmVhdlProducer.algodist', 'tmVhdlProducer.handles'):
+            self.assertNotIn(module, modules)
+        expected = os.path.join(self.directory, 'expected')
+        self.producer.write(make_plan(), expected)
+        self.assertEqual(read_files(output), read_files(expected))
+
+    def readManifest(self):
+        with open(os.path.join(self.directory, 'xml', 'manifest.json')) as fp:
+            return json.load(fp)
+
+    def testUpdateUnchanged(self):
+        collection = make_collection(2)
+        self.producer.write(collection, self.directory)
+        manifest = self.readManifest()
+        for filename in read_files(self.directory):
+            os.utime(os.path.join(self.directory, filename), (0, 0))
+        # Distributing again regenerates the firmware UUID
+        collection = make_collection(2)
+        self.assertNotEqual(collection.eventSetup.getFirmwareUuid(), manifest['firmware_uuid'])
+        self.assertEqual(vhdlproducer.keep_firmware_uuid(collection, self.directory), manifest['firmware_uuid'])
+        self.assertEqual(collection.eventSetup.getFirmwareUuid(), manifest['firmware_uuid'])
+        self.assertEqual(self.producer.write(collection, self.directory), [])
+        self.assertEqual(self.readManifest(), manifest)
+        for filename in read_files(self.directory):
+            self.assertEqual(os.stat(os.path.join(self.directory, filename)).st_mtime, 0, filename)
+
+    def testMenuJson(self):
+        collection = make_collection(2)
+        self.producer.write(collection, self.directory)
+        with open(os.path.join(self.directory, 'xml', 'menu.json')) as fp:
+            data = json.load(fp)
+        expected = vhdlproducer.distribution_data(collection)
+        for key in ('menu_uuid', 'n_modules', 'algorithms', 'digests'):
+            self.assertEqual(data[key], expected[key], key)
+        algorithm, = [algorithm for algorithm in collection.algorithm_handles if algorithm.name == 'L1_Algorithm_0']
+        self.assertEqual(data['digests'][algorithm.name], plan.algorithm_digest(plan.resolve_algorithm(algorithm)))
+
+    def testUpdateChanged(self):
+        self.producer.write(make_collection(2), self.directory)
+        collection = make_collection(3)
+        firmware_uuid = collection.eventSetup.getFirmwareUuid()
+        self.assertIsNone(vhdlproducer.keep_firmware_uuid(collection, self.directory))
+        self.assertEqual(collection.eventSetup.getFirmwareUuid(), firmware_uuid)
+        self.assertEqual(self.producer.write(collection, self.directory), [0, 1, 2])
+        self.assertEqual(self.readManifest()['firmware_uuid'], firmware_uuid)
+
+class WriteXmlMenuTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.producer = vhdlproducer.VhdlProducer(TemplateDir, cache_dir=None)
+        self.firmware = make_plan()
+        self.written = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def menu2xml(self, menu, scale, ext_signal, target):
+        self.written.append((menu, target))
+
+    def writeXmlMenu(self, names, **kwargs):
+        tables = MenuTableStub(names), None, None
+        with mock.patch.object(tmTable, 'menu2xml', self.menu2xml):
+            return self.producer.writeXmlMenu('L1Menu_Sample.xml', self.directory, 2, tables=tables, **kwargs)
+
+    def assertUpdated(self, target):
+        self.assertEqual(target, os.path.join(self.directory, 'L1Menu_Sample-d2.xml'))
+        (menu, written), = self.written
+        self.assertEqual(written, target)
+        self.assertEqual(menu.menu['uuid_firmware'], self.firmware.getFirmwareUuid())
+        self.assertEqual(menu.menu['n_modules'], '2')
+        self.assertEqual(menu.menu['is_valid'], '1')
+        rows = dict((row['name'], row) for row in menu.algorithms)
+        for algorithm in self.firmware.algorithms:
+            row = rows[algorithm.name]
+            self.assertEqual((row['index'], row['module_id'], row['module_index']),
+                             (str(algorithm.index), str(algorithm.module_id), str(algorithm.module_index)))
+            self.assertEqual(row['expression'], algorithm.name) # copied
+        return rows
+
+    def names(self):
+        return [algorithm.name for algorithm in reversed(self.firmware.algorithms)]
+
+    def testCollection(self):
+        tables = MenuTableStub(self.names()), None, None
+        with mock.patch.object(vhdlproducer, 'read_xml_menu', side_effect=AssertionError("source menu read")):
+            with mock.patch.object(tmTable, 'menu2xml', self.menu2xml):
+                target = self.producer.writeXmlMenu('L1Menu_Sample.xml', self.directory, 2, distribution=self.firmware, tables=tables)
+        self.assertUpdated(target)
+
+    def testMapping(self):
+        target = self.writeXmlMenu(self.names(), distribution=vhdlproducer.distribution_data(self.firmware))
+        self.assertUpdated(target)
+
+    def testJson(self):
+        with open(os.path.join(self.directory, 'menu.json'), 'w') as fp:
+            json.dump(vhdlproducer.distribution_data(self.firmware), fp)
+        target = self.writeXmlMenu(self.names())
+        self.assertUpdated(target)
+
+    def testReadTables(self):
+        tables = MenuTableStub(self.names()), None, None
+        with mock.patch.object(vhdlproducer, 'read_xml_menu', return_value=tables) as read_xml_menu:
+            with mock.patch.object(tmTable, 'menu2xml', self.menu2xml):
+                target = self.producer.writeXmlMenu('L1Menu_Sample.xml', self.directory, 2, distribution=self.firmware)
+        read_xml_menu.assert_called_once_with('L1Menu_Sample.xml')
+        self.assertUpdated(target)
+
+    def testMissingAlgorithm(self):
+        names = self.names()[1:]
+        with self.assertRaises(ValueError) as context:
+            self.writeXmlMenu(names, distribution=self.firmware)
+        self.assertIn(self.firmware.algorithms[-1].name, str(context.exception))
+        self.assertEqual(self.written, [])
+
+    def testExtraAlgorithm(self):
+        # Algorithms of the XML menu not in the distribution are kept
+        rows = MenuTableStub(['L1_Extra']).algorithms
+        target = self.writeXmlMenu(self.names() + ['L1_Extra'], distribution=self.firmware)
+        self.assertEqual(self.assertUpdated(target)['L1_Extra'], rows[0])
+
 if __name__ == '__main__':
     unittest.main()
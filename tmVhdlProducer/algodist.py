@@ -23,8 +23,10 @@ Dump distribution to JSON file
 import argparse
 import logging
 import json, uuid
+import heapq
+import time
 import sys, os
-from collections import namedtuple
+from collections import namedtuple, deque, Counter
 
 import tmEventSetup
 import tmGrammar
@@ -32,18 +34,15 @@ import tmGrammar
 from .handles import Payload
 from .handles import ConditionHandle
 from .handles import AlgorithmHandle
-
-MinModules = 1
-MaxModules = 6
-
-ProjectDir = os.path.abspath(os.path.join(os.path.dirname(__file__)))
-"""Projects root directory."""
-
-DefaultConfigDir = os.path.join(ProjectDir, 'config')
-"""Default directory for resource configuration files."""
-
-DefaultConfigFile = os.path.join(DefaultConfigDir, 'resource_default.json')
-"""Default resource configuration file."""
+from .handles import MenuHandle
+from .plan import FirmwarePlan, algorithm_digest, resolve_condition, resolve_algorithm
+from . import tracing
+from . import stats
+from .options import MinModules, MaxModules
+from .options import PlacementLightest, PlacementMarginal, DefaultBalance
+from .options import ProjectDir, DefaultConfigDir, DefaultConfigFile
+from .options import expand_range, parse_range, constraint_t
+from .options import ratios_t, sortings_t, placements_t
 
 #
 # Keys for object types
@@ -169,6 +168,13 @@ kOvRmDeltaEta = 'OvRmDeltaEta'
 kOvRmDeltaPhi = 'OvRmDeltaPhi'
 kOvRmDeltaR = 'OvRmDeltaR'
 
+#
+# Keys for comparison operators
+#
+
+kGE = 'GE'
+kEQ = 'EQ'
+
 #
 # Operators
 #
@@ -205,6 +211,12 @@ CutTypeKey = {
 }
 """Dictionary for cut type enumerations."""
 
+ComparisonOperatorKey = {
+    tmEventSetup.GE: kGE,
+    tmEventSetup.EQ: kEQ,
+}
+"""Dictionary for comparison operator enumerations."""
+
 ObjectTypeKey = {
     tmEventSetup.Muon: kMuon,
     tmEventSetup.Egamma: kEgamma,
@@ -343,14 +355,6 @@ ConditionTypeKey = {
 # Functions
 #
 
-def constraint_t(value):
-    tokens = value.split(':')
-    try:
-        return tokens[0], parse_range(tokens[1])
-    except IndexError:
-        pass
-    raise ValueError(value)
-
 def filter_first(func, data):
     """Returns first result for filter() or None if not match found."""
     return (list(filter(func, data)) or [None])[0]
@@ -359,35 +363,37 @@ def get_condition_names(algorithm):
     """Returns list of condition names of an algorithm (from RPN vector)."""
     return [label for label in algorithm.getRpnVector() if label not in Operators]
 
+def bit_count(value):
+    """Returns number of bits set in an integer."""
+    return bin(value).count('1')
+
 def short_name(name, length):
     """Shortens long names, if longer then length replaces last characters by ..."""
     if len(name) > length:
         return "{name}...".format(name=name[:length-3])
     return name[:length]
 
-def expand_range(expr):
-    """Parse and resolves numeric ranges.
-    >>> parse_range("3")
-    [3]
-    >>> parse_range("4-7")
-    [4, 5, 6, 7]
+def read_distribution(fp):
+    """Reads distribution from JSON file object, either written by
+    `ModuleCollection.dump` or the `menu.json` file written by the VHDL
+    producer. Returns dictionary providing n_modules and list of algorithm
+    dictionaries (keys index, name, module_id, module_index and optional
+    expression and digest).
     """
-    tokens = expr.split('-')
-    if len(tokens) == 2:
-        return [int(tokens[0]), int(tokens[1])]
-    if len(tokens) == 1:
-        return [int(tokens[0])]
-    raise ValueError("invalid range {expr}".format(**locals()))
-
-def parse_range(expr):
-    """Parse and resolves numeric ranges.
-    >>> parse_range("2,4-7,5,9")
-    [2, 4, 5, 6, 7, 9]
-    """
-    result = set()
-    for token in expr.split(','):
-        result.update(expand_range(token))
-    return list(result)
+    data = json.load(fp)
+    digests = data.get('digests', {})
+    algorithms = []
+    for algorithm in data['algorithms']:
+        if isinstance(algorithm, dict):
+            algorithms.append(algorithm)
+        else: # menu.json: ["AlgoName", "Global_Index", "Module_Index", "Local_Index"]
+            name, index, module_id, module_index = algorithm
+            algorithm = dict(name=name, index=index, module_id=module_id, module_index=module_index)
+            if name in digests:
+                algorithm['digest'] = digests[name]
+            algorithms.append(algorithm)
+    data['algorithms'] = algorithms
+    return data
 
 #
 # Classes
@@ -397,12 +403,52 @@ class ResourceOverflowError(RuntimeError):
     """Custom exception class for reosurce overflow errors."""
     pass
 
+class MeasureCache(object):
+    """Cache of condition payloads keyed by structural condition signature
+    (see `ResourceTray.signature`), can be shared by multiple resource trays.
+
+    >>> cache = MeasureCache()
+    >>> tray = ResourceTray('algo_dist.json', cache)
+    >>> cache.hits, cache.misses
+    (0, 0)
+    """
+
+    def __init__(self):
+        self.payloads = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.payloads)
+
+    def get(self, key):
+        """Returns copy of cached payload for *key* or None if not cached."""
+        payload = self.payloads.get(key)
+        if payload is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return Payload(payload.sliceLUTs, payload.processors)
+
+    def put(self, key, payload):
+        """Stores copy of *payload* for *key*."""
+        self.payloads[key] = Payload(payload.sliceLUTs, payload.processors)
+
+    def clear(self):
+        """Removes all cached payloads and resets statistics."""
+        self.payloads.clear()
+        self.hits = 0
+        self.misses = 0
+
 class ResourceTray(object):
     """Scale tray for calculating condition and algorithm payloads. It loads
     payload and threshold specifications from a JSON file.
 
     >>> tray = ResourceTray('algo_dist.json')
     >>> tray.measure(condition)
+
+    Measurements are cached by structural condition signature, pass a shared
+    `MeasureCache` as *cache* to reuse them across trays.
     """
 
     # Instances used in resource configuration
@@ -412,12 +458,37 @@ class ResourceTray(object):
     kCorrelationCondition = 'CorrelationCondition'
     kCorrelationConditionOvRm = 'CorrelationConditionOvRm'
 
-    def __init__(self, filename):
-        """Attribute *filename* is a filename of an JSON payload configuration file."""
+    def __init__(self, filename, cache=None):
+        """Attribute *filename* is a filename of an JSON payload configuration
+        file, optional *cache* is a shared measurement cache.
+        """
         with open(filename) as fp:
             resources = json.load(fp, object_hook=self._object_hook).resources
         self.resources = resources
         self.filename = filename
+        self.cache = MeasureCache() if cache is None else cache
+        self._compile()
+
+    def _compile(self):
+        """Compile resource configuration into dictionary lookup tables, keyed
+        by instance type, by (instance type, mapped object types) and by
+        (instance type, mapped object types, mapped cut type). First entry
+        wins for duplicate keys, as for a linear search.
+        """
+        mapping = self.resources.mapping
+        self._instance_map = mapping.instances._asdict()
+        self._object_map = mapping.objects._asdict()
+        self._cut_map = mapping.cuts._asdict()
+        self._instances = {}
+        self._objects = {}
+        self._cuts = {}
+        for instance in self.resources.instances:
+            self._instances.setdefault(instance.type, instance)
+            for item in instance.objects:
+                types = tuple(item.types)
+                self._objects.setdefault((instance.type, types), item)
+                for cut in getattr(item, 'cuts', ()):
+                    self._cuts.setdefault((instance.type, types, cut.type), cut)
 
     def _object_hook(self, d):
         """Convert a dict into a namedtuple, used to convert JSON input.
@@ -433,28 +504,28 @@ class ResourceTray(object):
         >>> tray.map_instance("SingleTau")
         'CaloCondition'
         """
-        return self.resources.mapping.instances._asdict()[key]
+        return self._instance_map[key]
 
     def map_object(self, key):
         """Returns mapped condition object type for *key*.
         >>> tray.map_object("Egamma")
         'calo'
         """
-        return self.resources.mapping.objects._asdict()[key]
+        return self._object_map[key]
 
     def map_objects(self, keys):
         """Returns mapped condition object types for *keys*.
         >>> tray.map_objects(["Jet", "Tau"])
         ['calo', 'calo']
         """
-        return [self.map_object(key) for key in keys]
+        return [self._object_map[key] for key in keys]
 
     def map_cut(self, key):
         """Returns mapped condition cut type for *key*.
         >>> tray.map_cut("ORMDETA")
         'deta'
         """
-        return self.resources.mapping.cuts._asdict()[key]
+        return self._cut_map[key]
 
     def floor(self):
         """Returns minimum resource consumption payload.
@@ -475,10 +546,7 @@ class ResourceTray(object):
     def find_instance(self, condition):
         """Returns instance resource namedtuple for *key* or None if not found."""
         assert isinstance(condition, ConditionHandle)
-        instance_map = self.resources.mapping.instances._asdict()
-        def compare(instance):
-            return instance.type == self.map_instance(ConditionTypeKey[condition.type])
-        return filter_first(compare, self.resources.instances)
+        return self._instances.get(self.map_instance(ConditionTypeKey[condition.type]))
 
     def calc_factor(self, condition):
         """Returns calculated multiplication factor for base resources.
@@ -560,15 +628,38 @@ class ResourceTray(object):
             raise RuntimeError("missing mapped objects for ovrm corr")
         return 1.
 
+    def signature(self, condition):
+        """Returns structural signature of a condition handle, identical for
+        conditions of equal payload: configuration file, condition type, object
+        types and slice sizes, same BX flag and cut types.
+        """
+        assert isinstance(condition, ConditionHandle)
+        objects = tuple((object_.type, object_.slice_size) for object_ in condition.objects)
+        cuts = tuple(cut.cut_type for cut in condition.cuts)
+        return self.filename, condition.type, objects, condition.same_object_bxs, cuts
+
     def measure(self, condition):
         """Calculates the payload of a condition by its type and objects.
         Conditions can be of type `tmEventSetup.esCondition` or `ConditionHandle`.
+        Payloads are cached by condition signature.
         >>> tray.measure(condition)
         Payload(sliceLUTs=0.42%, processors=0.00%)
         """
         if isinstance(condition, tmEventSetup.esCondition):
             condition = ConditionHandle(condition, Payload()) # cast to handle with empty payload
 
+        stats.increment('measure.calls')
+        key = self.signature(condition)
+        payload = self.cache.get(key)
+        if payload is None:
+            payload = self._measure(condition)
+            self.cache.put(key, payload)
+        else:
+            stats.increment('measure.hits')
+        return payload
+
+    def _measure(self, condition):
+        """Calculates the payload of a condition handle (uncached)."""
         # Pick resource instance
         instance = self.find_instance(condition)
         if not instance:
@@ -580,8 +671,8 @@ class ResourceTray(object):
 
         # Pick object configuration
         objects_types = [ObjectTypeKey[object_.type] for object_ in condition.objects]
-        mapped_objects = self.map_objects(objects_types)
-        instance_objects = filter_first(lambda item: item.types == mapped_objects, instance.objects)
+        mapped_objects = tuple(self.map_objects(objects_types))
+        instance_objects = self._objects.get((instance.type, mapped_objects))
         if not instance_objects:
             condition_type = ConditionTypeKey[condition.type]
             message = "Missing configuration for condition of type '{0}' with " \
@@ -600,7 +691,7 @@ class ResourceTray(object):
             except KeyError as e:
                 logging.warning("skipping cut '%s' (not defined in resource config)", name)
             else:
-                result = filter_first(lambda cut: cut.type == mapped_cut, instance_objects.cuts)
+                result = self._cuts.get((instance.type, mapped_objects, mapped_cut))
                 if result:
                     factor = self.calc_cut_factor(condition, name)
                     logging.debug("%s.calc_cut_factor(<instance %s>, '%s') => %s", self.__class__.__name__, condition.name, name, factor)
@@ -612,7 +703,12 @@ class ResourceTray(object):
         return payload
 
 class Module(object):
-    """Represents a uGT module implementation holding a subset of algorithms."""
+    """Represents a uGT module implementation holding a subset of algorithms.
+
+    The module payload and the set of assigned conditions are updated
+    incrementally on append/remove using a reference counted condition table,
+    so reading them does not require to iterate over all algorithms.
+    """
     def __init__(self, id, tray):
         """Attribute *id* is the module index."""
         assert isinstance(tray, ResourceTray)
@@ -620,6 +716,9 @@ class Module(object):
         self.algorithms = []
         self.floor = tray.floor()
         self.ceiling = tray.ceiling()
+        self._payload = self.floor
+        self._conditions = {} # condition name => [condition, reference count]
+        self._condition_list = None
 
     def __len__(self):
         """Returns count of algorithms assigned to this module."""
@@ -632,43 +731,281 @@ class Module(object):
     @property
     def conditions(self):
         """Returns list of conditions assigned to this module."""
-        conditions = set()
-        for algorithm in self.algorithms:
-            for condition in algorithm.conditions:
-                conditions.add(condition)
-        return list(conditions)
+        if self._condition_list is None:
+            self._condition_list = [entry[0] for entry in self._conditions.values()]
+        return self._condition_list
+
+    def hasCondition(self, name):
+        """Returns True if a condition with *name* is assigned to this module."""
+        return name in self._conditions
 
     @property
     def payload(self):
-        payload = self.floor
-        payloadMap = {}
-        for algorithm in self.algorithms:
+        """Returns payload of module (floor and unique conditions)."""
+        return self._payload
+
+    def _addConditions(self, algorithm):
+        """Increment condition references of *algorithm*, adds payload of
+        conditions not yet assigned to this module.
+        """
+        for condition in algorithm.conditions:
+            entry = self._conditions.get(condition.name)
+            if entry:
+                entry[1] += 1
+            else:
+                self._conditions[condition.name] = [condition, 1]
+                self._payload = self._payload + condition.payload
+                self._condition_list = None
+
+    def _removeConditions(self, algorithm):
+        """Decrement condition references of *algorithm*, subtracts payload of
+        conditions no longer referenced by any algorithm of this module.
+        """
+        for condition in algorithm.conditions:
+            entry = self._conditions[condition.name]
+            entry[1] -= 1
+            if not entry[1]:
+                del self._conditions[condition.name]
+                self._payload = self._payload - condition.payload
+                self._condition_list = None
+
+    def marginal(self, algorithm):
+        """Returns payload increase when adding *algorithm*, ignoring conditions
+        already assigned to this module.
+        """
+        payload = Payload()
+        names = set()
+        for condition in algorithm.conditions:
+            if condition.name not in names and condition.name not in self._conditions:
+                payload += condition.payload
+            names.add(condition.name)
+        return payload
+
+    def exchange(self, remove=(), append=()):
+        """Returns module payload after removing algorithms *remove* and
+        appending algorithms *append* without modifying the module.
+        """
+        removed = {} # condition name => references removed
+        for algorithm in remove:
+            for condition in algorithm.conditions:
+                removed[condition.name] = removed.get(condition.name, 0) + 1
+        payload = self._payload
+        appended = set()
+        for algorithm in append:
             for condition in algorithm.conditions:
-                payloadMap[condition.name] = condition.payload
-        for name, payload_ in payloadMap.items():
-            payload += payload_
+                if condition.name not in appended:
+                    appended.add(condition.name)
+                    if condition.name not in self._conditions:
+                        payload = payload + condition.payload
+        for name, count in removed.items():
+            condition, references = self._conditions[name]
+            if references == count and name not in appended:
+                payload = payload - condition.payload
         return payload
 
-    def append(self, algorithm):
-        """Appends an algorithm, updates module id and index of assigned algorithm."""
-        payload = self.payload + algorithm.payload
+    def within(self, payload):
+        """Returns True if *payload* does not exceed the ceiling."""
         if payload.sliceLUTs > self.ceiling.sliceLUTs:
-             raise ResourceOverflowError() # no more resources left, ceiling exceeded
+            return False
         if payload.processors > self.ceiling.processors:
+            return False
+        return True
+
+    def fits(self, algorithm, payload=None):
+        """Returns True if *algorithm* can be appended without exceeding the
+        ceiling. Optional *payload* replaces the current module payload.
+        """
+        return self.within((self.payload if payload is None else payload) + algorithm.payload)
+
+    def append(self, algorithm):
+        """Appends an algorithm, updates module id and index of assigned algorithm."""
+        stats.increment('append.attempts')
+        if not self.fits(algorithm):
+             stats.increment('append.rejected')
              raise ResourceOverflowError() # no more resources left, ceiling exceeded
+        self.insert(algorithm)
+
+    def insert(self, algorithm):
+        """Appends an algorithm without checking the ceiling, used for changes
+        already checked using `exchange` and `within`.
+        """
         algorithm.module_id = self.id
         algorithm.module_index = len(self) # enumerate
         self.algorithms.append(algorithm)
+        self._addConditions(algorithm)
+
+    def remove(self, algorithm):
+        """Removes an algorithm, resets its module id and index and re-enumerates
+        the module indices of subsequent algorithms.
+        """
+        index = self.algorithms.index(algorithm)
+        del self.algorithms[index]
+        for module_index in range(index, len(self.algorithms)):
+            self.algorithms[module_index].module_index = module_index
+        algorithm.module_id = None
+        algorithm.module_index = None
+        self._removeConditions(algorithm)
 
     def __repr__(self):
         count = len(self)
         return "{self.__class__.__name__}(id={self.id}, algorithms={count}, payload={self.payload})".format(**locals())
 
+class ModuleScheduler(object):
+    """Priority queue keeping modules ordered by their current payload.
+
+    Modules are stored in binary heaps (one for all modules and one for every
+    requested constraint subset) using lazy invalidation: every payload update
+    pushes a new versioned entry, outdated entries are discarded when reaching
+    the top of a heap. Ties are resolved by module id.
+
+    >>> scheduler = ModuleScheduler(modules)
+    >>> module = scheduler.lightest(constraints=[0, 2])
+    >>> module.append(algorithm)
+    >>> scheduler.update(module)
+    """
+
+    def __init__(self, modules):
+        self.modules = dict((module.id, module) for module in modules)
+        self.versions = dict((module.id, 0) for module in modules)
+        self.heaps = {}
+
+    def _entry(self, module):
+        payload = module.payload
+        return payload.sliceLUTs, payload.processors, module.id, self.versions[module.id]
+
+    def _heap(self, key):
+        """Returns heap for constraint subset *key*, creates it on demand."""
+        heap = self.heaps.get(key)
+        if heap is None:
+            heap = [self._entry(module) for module in self.modules.values() if key is None or module.id in key]
+            heapq.heapify(heap)
+            self.heaps[key] = heap
+        return heap
+
+    def lightest(self, constraints=None):
+        """Returns module with the least payload. Assign constraints to limit modules."""
+        key = frozenset(constraints) if constraints else None
+        heap = self._heap(key)
+        while heap:
+            entry = heap[0]
+            if entry[3] == self.versions[entry[2]]:
+                return self.modules[entry[2]]
+            heapq.heappop(heap) # outdated entry
+        raise IndexError("no modules matching constraints {0}".format(constraints))
+
+    def update(self, module):
+        """Update position of *module* after its payload changed."""
+        self.versions[module.id] += 1
+        entry = self._entry(module)
+        for key, heap in self.heaps.items():
+            if key is None or module.id in key:
+                # Compact heap if outdated entries are piling up
+                if len(heap) > 4 * len(self.modules):
+                    heap[:] = [self._entry(module) for module in self.modules.values() if key is None or module.id in key]
+                    heapq.heapify(heap)
+                else:
+                    heapq.heappush(heap, entry)
+
+class ShadowIndex(object):
+    """Inverted condition index over a stack of algorithms used to collect
+    shadowed algorithms.
+
+    Condition sets are represented as integer bitmasks, overlap ratios are only
+    calculated for pending algorithms sharing at least one condition.
+
+    >>> index = ShadowIndex(stack)
+    >>> index.discard(algorithm) # algorithm was taken from stack
+    >>> index.shadowed(['cond_a', 'cond_b'], ratio=0.25)
+    [AlgorithmHandle(...), ...]
+    """
+
+    def __init__(self, stack):
+        self.bits = {} # condition name => bit
+        self.masks = {} # algorithm => condition bitmask
+        self.positions = {} # algorithm => stack position
+        self.algorithms = {} # condition name => list of algorithms
+        self.pending = set()
+        for position, algorithm in enumerate(stack):
+            names = []
+            for condition in algorithm.conditions:
+                if condition.name not in names:
+                    names.append(condition.name)
+            for name in names:
+                if name not in self.bits:
+                    self.bits[name] = 1 << len(self.bits)
+                self.algorithms.setdefault(name, []).append(algorithm)
+            self.masks[algorithm] = self.mask(names)
+            self.positions[algorithm] = position
+            self.pending.add(algorithm)
+
+    def mask(self, names):
+        """Returns condition bitmask for list of condition names."""
+        mask = 0
+        for name in names:
+            mask |= self.bits.get(name, 0)
+        return mask
+
+    def discard(self, algorithm):
+        """Remove algorithm from pending algorithms."""
+        self.pending.discard(algorithm)
+
+    def candidates(self, names, taken):
+        """Returns pending algorithms not yet taken sharing at least one
+        condition in *names*, ordered by stack position.
+        """
+        found = set()
+        for name in names:
+            algorithms = self.algorithms.get(name)
+            if algorithms:
+                # Drop algorithms already taken from stack
+                algorithms[:] = [algorithm for algorithm in algorithms if algorithm in self.pending]
+                found.update(algorithms)
+        found.difference_update(taken)
+        return sorted(found, key=self.positions.get)
+
+    def shadowed(self, conditions, ratio, depth=1):
+        """Returns list of pending algorithms shadowed by a list of condition
+        names. Attribute *ratio* (0.0 < ratio <= 1.0) regulates the minimum
+        amount of a shadowed algorithm. Shadowed algorithms are collected
+        recursively, extending the condition set by the conditions of every
+        shadowed algorithm found (depth first, in stack order).
+        """
+        shadowed = []
+        taken = set()
+        names = set(conditions)
+        levels = [(self.mask(names), names, iter(self.candidates(names, taken)), depth)]
+        comparisons = 0
+        while levels:
+            mask, names, candidates, depth = levels[-1]
+            for algorithm in candidates:
+                if algorithm in taken:
+                    continue
+                comparisons += 1
+                other = self.masks[algorithm]
+                left = bit_count(mask & other) # number of identical conditions
+                total = bit_count(mask | other) # total number of conditions
+                percent = total/100.
+                if ratio <= (left/percent/100.):
+                    indent = " +-{0}".format("-" * depth)
+                    logging.info("%s %s shadowed ratio %.1f %%", indent, algorithm.name, (left/percent))
+                    shadowed.append(algorithm)
+                    taken.add(algorithm)
+                    names = names.union(condition.name for condition in algorithm.conditions)
+                    levels.append((mask | other, names, iter(self.candidates(names, taken)), depth + 1))
+                    break
+            else:
+                levels.pop()
+        stats.increment('shadowed.comparisons', comparisons)
+        return shadowed
+
 class ModuleCollection(object):
     """Collection of modules permitting various operations."""
+    @tracing.traced('ModuleCollection')
     def __init__(self, es, tray):
-        """Attribute *modules* represents the number of instantiated modules."""
-        assert isinstance(es, tmEventSetup.esTriggerMenu)
+        """Attribute *es* is either an event setup or a menu handle (eg. restored
+        from a menu cache) providing already measured handles.
+        """
+        assert isinstance(es, (tmEventSetup.esTriggerMenu, MenuHandle))
         assert isinstance(tray, ResourceTray)
         self.eventSetup = es
         self.tray = tray
@@ -677,11 +1014,22 @@ class ModuleCollection(object):
         self.reverse_sorting = False
         self.regenerate_uuid = True
         self.constraints = {}
+        self.placement = PlacementLightest
+        self.balance = DefaultBalance
+        if isinstance(es, MenuHandle):
+            self.condition_handles = es.condition_handles
+            self.algorithm_handles = list(es.algorithm_handles)
+            self.algorithm_handles.sort(key = lambda algorithm: algorithm.payload, reverse=self.reverse_sorting)
+            return
         # Calculate condition handles
         self.condition_handles = {}
-        for name, condition in es.getConditionMapPtr().items():
-            payload = tray.measure(condition)
-            self.condition_handles[name] = ConditionHandle(condition, payload)
+        with tracing.span('ResourceTray.measure'):
+            for name, condition in es.getConditionMapPtr().items():
+                condition_handle = ConditionHandle(condition, Payload())
+                condition_handle.payload = tray.measure(condition_handle)
+                self.condition_handles[name] = condition_handle
+        logging.debug("measured %d conditions, cache hits: %d, misses: %d",
+                      len(self.condition_handles), tray.cache.hits, tray.cache.misses)
         # Calculate algorithms handles, sort them descending by payload
         self.algorithm_handles = []
         for name, algorithm in es.getAlgorithmMapPtr().items():
@@ -716,6 +1064,27 @@ class ModuleCollection(object):
         # /END HACK
         #
 
+    @classmethod
+    def fromHandles(cls, eventSetup, tray, condition_handles, algorithm_handles):
+        """Returns collection for already measured condition and algorithm
+        handles, *eventSetup* provides the menu information.
+        """
+        return cls(MenuHandle(eventSetup, condition_handles, algorithm_handles), tray)
+
+    def firmwarePlan(self):
+        """Returns portable firmware plan of the distribution."""
+        return FirmwarePlan.fromCollection(self)
+
+    def planConditions(self):
+        """Returns mapping of condition names to plan conditions (see
+        `plan.resolve_condition`).
+        """
+        return dict((name, resolve_condition(condition)) for name, condition in self.condition_handles.items())
+
+    def menuHandle(self):
+        """Returns picklable menu handle of the collection."""
+        return MenuHandle(self.eventSetup, self.condition_handles, list(self.algorithm_handles))
+
     def __len__(self):
         """Returns count of modules assigned to this collection."""
         return len(self.modules)
@@ -741,7 +1110,31 @@ class ModuleCollection(object):
         modules = self.modules
         if constraints:
             modules = [module for module in self.modules if module.id in constraints]
-        return sorted(modules, key = lambda module: module.payload)[0]
+        return min(modules, key = lambda module: module.payload)
+
+    def cheapestModule(self, algorithm, constraints=None):
+        """Returns module with the least marginal payload increase for
+        *algorithm* (conditions already present on a module are free), plus
+        the current module payload weighted by the balance factor. Modules
+        without capacity left are only considered if no other module fits.
+        Assign constraints to limit modules.
+        """
+        modules = self.modules
+        if constraints:
+            modules = [module for module in self.modules if module.id in constraints]
+        modules = [module for module in modules if module.fits(algorithm)] or modules
+        def cost(module):
+            marginal = module.marginal(algorithm)
+            payload = module.payload
+            return (marginal.sliceLUTs + self.balance * payload.sliceLUTs,
+                    marginal.processors + self.balance * payload.processors)
+        return min(modules, key=cost)
+
+    def placeModule(self, scheduler, algorithm, constraints=None):
+        """Returns module for *algorithm* according to placement strategy."""
+        if self.placement == PlacementMarginal:
+            return self.cheapestModule(algorithm, constraints)
+        return scheduler.lightest(constraints)
 
     @property
     def algorithms(self):
@@ -763,6 +1156,7 @@ class ModuleCollection(object):
         """Retruns unsorted list of all conditions."""
         return [condition for _, condition in self.condition_handles.items()]
 
+    @tracing.traced('distribute')
     def distribute(self, modules):
         """Distribute algorithms to modules, applying shadow ratio.
         """
@@ -773,47 +1167,308 @@ class ModuleCollection(object):
             self.eventSetup.setFirmwareUuid(str(uuid.uuid4()))
         logging.info("starting algorithm distribution for %d algorithms on %d " \
                      "modules using shadow ratio of %.1f", len(self.algorithm_handles), modules, self.ratio)
+        logging.info("using %s placement", self.placement)
         self.modules = [Module(id, self.tray) for id in range(modules)]
-        stack = list(self.algorithm_handles) # copy list
+        scheduler = ModuleScheduler(self.modules)
+        stack = deque(self.algorithm_handles) # work queue
+        placed = set() # shadowed algorithms already taken from the queue
+        index = ShadowIndex(stack)
         try:
             while stack:
-                algorithm = stack.pop(0) # POP
-                module = self.lightestModule()
+                algorithm = stack.popleft() # POP
+                if algorithm in placed:
+                    continue
+                index.discard(algorithm)
+                module = self.placeModule(scheduler, algorithm)
                 # ######## constraints ########
                 for condition in algorithm:
                     if condition.type in self.constraints:
-                        module = self.lightestModule(self.constraints[condition.type])
+                        module = self.placeModule(scheduler, algorithm, self.constraints[condition.type])
+                        stats.increment('constraint.redirects')
                         logging.info("[*] applying condition constraint %s => module %s", condition.type, module.id)
                 # ######## /constraints ########
                 logging.info(" . adding %s (%d) to module %s", algorithm.name, algorithm.index, module.id)
                 module.append(algorithm)
+                scheduler.update(module)
                 condition_names = [condition.name for condition in algorithm.conditions]
-                for shadowed in self.getShadowed(stack, condition_names, self.ratio):
+                for shadowed in index.shadowed(condition_names, self.ratio):
                     # ######## constraints ########
                     has_constraint = False
-                    i = stack.index(shadowed)
-                    for condition in stack[i]:
+                    for condition in shadowed:
                         if condition.type in self.constraints:
                             if module.id != self.constraints[condition.type]:
-                                logging.info("[*] applying condition constraint, ignoring shadowed algorithm %s", stack[i].name)
+                                logging.info("[*] applying condition constraint, ignoring shadowed algorithm %s", shadowed.name)
+                                stats.increment('constraint.ignored')
                                 has_constraint = True
                                 break
                     if has_constraint:
                         continue
                     # ######## /constraints ########
-                    stack.pop(stack.index(shadowed)) # POP
+                    placed.add(shadowed) # POP
+                    index.discard(shadowed)
                     logging.info(" ... adding shadowed %s %s to module %s", shadowed.name, shadowed.index, module.id)
                     module.append(shadowed)
+                    scheduler.update(module)
         except ResourceOverflowError:
+            unassigned = [algorithm for algorithm in stack if algorithm not in placed]
             logging.error("no resources left to implement menu")
-            logging.error("there are %d unassigned algorithms left:", len(stack))
-            for algorithm in stack:
+            logging.error("there are %d unassigned algorithms left:", len(unassigned))
+            for algorithm in unassigned:
                 logging.error("%s %s", algorithm.index, algorithm.name)
             logging.error("previously assigned resources:")
             for module in self.modules:
                 logging.error("module: %s %s ceiling: %s algorithms: %s", module.id, module.payload, module.ceiling, len(module))
             raise
 
+    def allowedModules(self, algorithm):
+        """Returns list of module ids permitted by constraints for *algorithm*."""
+        allowed = set(module.id for module in self.modules)
+        for condition in algorithm:
+            if condition.type in self.constraints:
+                allowed &= set(self.constraints[condition.type])
+        return sorted(allowed)
+
+    @tracing.traced('redistribute')
+    def changedAlgorithms(self, previous):
+        """Returns set of names of algorithms of a *previous* distribution
+        (see `read_distribution`) whose logic changed. Algorithms are compared
+        by digest (see `plan.algorithm_digest`). Algorithms without digest (eg.
+        `menu.json` of previous releases) are only considered unchanged if the
+        menu UUID is unchanged.
+        """
+        handles = dict((algorithm.name, algorithm) for algorithm in self.algorithm_handles)
+        conditions = self.planConditions()
+        same_menu = previous.get('menu_uuid') == self.eventSetup.getMenuUuid()
+        changed = set()
+        for entry in previous['algorithms']:
+            algorithm = handles.get(entry['name'])
+            if algorithm is None:
+                continue
+            if 'digest' in entry:
+                if entry['digest'] != algorithm_digest(resolve_algorithm(algorithm, conditions)):
+                    changed.add(algorithm.name)
+            elif not same_menu:
+                changed.add(algorithm.name)
+        if not same_menu and not any('digest' in entry for entry in previous['algorithms']):
+            logging.warning("previous distribution provides no algorithm digests, treating all algorithms as changed")
+        return changed
+
+    def changedModules(self, previous, changed=None):
+        """Returns sorted list of ids of modules differing from a *previous*
+        distribution: modules with other algorithms or algorithm order, modules
+        with algorithms whose logic changed (*changed*, default is
+        `changedAlgorithms`) and removed modules.
+        """
+        if changed is None:
+            changed = self.changedAlgorithms(previous)
+        entries = {} # previous (name, index) entries by module
+        for entry in sorted(previous['algorithms'], key=lambda entry: (entry['module_id'], entry['module_index'])):
+            entries.setdefault(entry['module_id'], []).append((entry['name'], entry['index']))
+        result = []
+        for module in self.modules:
+            current = [(algorithm.name, algorithm.index) for algorithm in module]
+            if current != entries.get(module.id, []) or any(algorithm.name in changed for algorithm in module):
+                result.append(module.id)
+        result.extend(id for id in sorted(entries) if id >= len(self.modules))
+        return result
+
+    def redistribute(self, previous, modules=None):
+        """Distribute algorithms preserving a *previous* distribution (see
+        `read_distribution`) to touch as few modules as possible. Algorithms
+        found unchanged in the previous distribution (see `changedAlgorithms`)
+        are kept on their modules in previous order, only new or changed
+        algorithms (or ones no longer fitting) are placed in sort order,
+        preferring modules already changed, then least marginal payload
+        increase. Argument *modules* defaults to the previous number of
+        modules. Returns sorted list of ids of changed modules (see
+        `changedModules`).
+        """
+        modules = previous['n_modules'] if modules is None else modules
+        # regenerate firmware UUID
+        if self.regenerate_uuid:
+            self.eventSetup.setFirmwareUuid(str(uuid.uuid4()))
+        logging.info("starting sticky redistribution for %d algorithms on %d " \
+                     "modules (previously %d)", len(self.algorithm_handles), modules, previous['n_modules'])
+        self.modules = [Module(id, self.tray) for id in range(modules)]
+        handles = dict((algorithm.name, algorithm) for algorithm in self.algorithm_handles)
+        modified = self.changedAlgorithms(previous)
+        touched = set()
+        kept = set()
+        for entry in sorted(previous['algorithms'], key=lambda entry: (entry['module_id'], entry['module_index'])):
+            module_id = entry['module_id']
+            algorithm = handles.get(entry['name'])
+            if algorithm is None:
+                logging.info(" . removed %s from module %s", entry['name'], module_id)
+                touched.add(module_id)
+                continue
+            if algorithm.name in modified:
+                logging.info(" . changed %s on module %s", algorithm.name, module_id)
+                touched.add(module_id)
+                continue
+            if module_id >= modules or module_id not in self.allowedModules(algorithm):
+                touched.add(module_id)
+                continue
+            module = self.modules[module_id]
+            if not module.fits(algorithm):
+                logging.info(" . %s does no longer fit on module %s", algorithm.name, module_id)
+                touched.add(module_id)
+                continue
+            module.append(algorithm)
+            kept.add(algorithm.name)
+        # Place new and changed algorithms
+        pending = [algorithm for algorithm in self.algorithm_handles if algorithm.name not in kept]
+        pending.sort(key=lambda algorithm: algorithm.payload, reverse=self.reverse_sorting)
+        try:
+            for algorithm in pending:
+                allowed = self.allowedModules(algorithm)
+                candidates = [self.modules[id] for id in allowed if self.modules[id].fits(algorithm)]
+                if not candidates:
+                    raise ResourceOverflowError()
+                def cost(module):
+                    marginal = module.marginal(algorithm)
+                    return module.id not in touched, marginal._astuple(), module.payload._astuple()
+                module = min(candidates, key=cost)
+                logging.info(" . adding %s (%d) to module %s", algorithm.name, algorithm.index, module.id)
+                module.append(algorithm)
+                touched.add(module.id)
+        except ResourceOverflowError:
+            unassigned = [algorithm for algorithm in pending if algorithm.module_id is None]
+            logging.error("no resources left to implement menu")
+            logging.error("there are %d unassigned algorithms left:", len(unassigned))
+            for algorithm in unassigned:
+                logging.error("%s %s", algorithm.index, algorithm.name)
+            raise
+        changed = self.changedModules(previous, modified)
+        logging.info("kept %d algorithms, placed %d algorithms", len(kept), len(pending))
+        logging.info("changed modules: %s", ", ".join(str(id) for id in changed) or "none")
+        return changed
+
+    @tracing.traced('refine')
+    def refine(self, iterations=None, timeout=None):
+        """Improve an existing distribution by moving and swapping algorithms
+        between modules, minimizing the peak module payload and the total
+        payload of all modules (duplicated conditions). Payloads are compared
+        by significance, sliceLUTs before processors (as by `cheapestModule`).
+        Stops when no improving
+        move or swap is left, after *iterations* applied changes or after
+        *timeout* seconds. Module ceilings and condition constraints are
+        respected. Returns number of applied changes.
+        """
+        epsilon = 1e-12
+        deadline = None if timeout is None else time.time() + timeout
+        modules = dict((module.id, module) for module in self.modules)
+
+        def cost(payloads):
+            """Returns peak and total payload attributes ordered by significance."""
+            peak = max(payloads.values(), key=Payload._astuple)
+            total = sum(payloads.values(), Payload())
+            return peak._astuple() + total._astuple()
+
+        def better(a, b):
+            for left, right in zip(a, b):
+                if left < right - epsilon:
+                    return True
+                if left > right + epsilon:
+                    return False
+            return False
+
+        def evaluate(payloads, changes):
+            """Returns cost with updated payloads for some modules."""
+            updated = dict(payloads)
+            updated.update(changes)
+            return cost(updated)
+
+        def groups(module):
+            """Returns algorithms of a module, single and grouped by shared conditions."""
+            result = [[algorithm] for algorithm in module]
+            shared = {}
+            for algorithm in module:
+                for name in set(condition.name for condition in algorithm.conditions):
+                    shared.setdefault(name, []).append(algorithm)
+            result.extend(group for group in shared.values() if len(group) > 1)
+            return result
+
+        def allowed(algorithms):
+            ids = set(modules)
+            for algorithm in algorithms:
+                ids.intersection_update(self.allowedModules(algorithm))
+            return sorted(ids)
+
+        payloads = dict((id, module.payload) for id, module in modules.items())
+        current = cost(payloads)
+        logging.info("refining distribution, peak payload %.2f%%, total payload %.2f%%", current[0] * 100., current[2] * 100.)
+        changes = 0
+        while iterations is None or changes < iterations:
+            if deadline is not None and time.time() > deadline:
+                logging.info("refinement stopped, time budget exceeded")
+                break
+            peak = modules[max(payloads, key=lambda id: payloads[id]._astuple())]
+            # Best move of single algorithms of any module or groups of
+            # algorithms sharing conditions of the peak module to another module
+            best = None
+            for source in self.modules:
+                for group in (groups(source) if source is peak else [[algorithm] for algorithm in source]):
+                    released = source.exchange(remove=group)
+                    for id in allowed(group):
+                        target = modules[id]
+                        if target is source:
+                            continue
+                        payload = target.exchange(append=group)
+                        if not target.within(payload):
+                            continue
+                        result = evaluate(payloads, {
+                            source.id: released,
+                            target.id: payload,
+                        })
+                        if better(result, best[0] if best else current):
+                            best = result, group, source, target
+            if best:
+                current, group, source, target = best
+                for algorithm in group:
+                    logging.info(" . moving %s (%d) from module %s to module %s", algorithm.name, algorithm.index, source.id, target.id)
+                    source.remove(algorithm)
+                for algorithm in group:
+                    target.insert(algorithm)
+            else:
+                # First swap of an algorithm of the peak module with an algorithm of another module
+                for algorithm in peak:
+                    permitted = self.allowedModules(algorithm)
+                    for target in self.modules:
+                        if target is peak or target.id not in permitted:
+                            continue
+                        for other in target:
+                            if peak.id not in self.allowedModules(other):
+                                continue
+                            peak_payload = peak.exchange(remove=[algorithm], append=[other])
+                            if not peak.within(peak_payload):
+                                continue
+                            target_payload = target.exchange(remove=[other], append=[algorithm])
+                            if not target.within(target_payload):
+                                continue
+                            result = evaluate(payloads, {
+                                peak.id: peak_payload,
+                                target.id: target_payload,
+                            })
+                            if better(result, current):
+                                best = result, algorithm, other, target
+                                break
+                        if best: break
+                    if best: break
+                if not best:
+                    break
+                current, algorithm, other, target = best
+                logging.info(" . swapping %s (%d) of module %s with %s (%d) of module %s", algorithm.name, algorithm.index, peak.id, other.name, other.index, target.id)
+                peak.remove(algorithm)
+                target.remove(other)
+                peak.insert(other)
+                target.insert(algorithm)
+                source = peak
+            payloads[source.id] = source.payload
+            payloads[target.id] = target.payload
+            changes += 1
+        logging.info("refined distribution with %d changes, peak payload %.2f%%, total payload %.2f%%", changes, current[0] * 100., current[2] * 100.)
+        return changes
+
     def validate(self):
         """Raises an asserion exception on errors."""
         for module in self:
@@ -822,21 +1477,43 @@ class ModuleCollection(object):
                 assert module.id == algorithm.module_id
 
     def load(self, fp):
-        """Loads distribution from JSON."""
-        data = json.load(fp)
-        modules = [Module(id, self.tray) for id in range(data['n_modules'])]
-        stack = list(self.algorithm_handles)
+        """Loads distribution from JSON (see `read_distribution`)."""
+        data = read_distribution(fp)
+        self.assign(data['n_modules'], data['algorithms'])
+
+    def assign(self, n_modules, algorithms):
+        """Assigns algorithms to *n_modules* modules. Argument *algorithms* is a
+        list of dictionaries providing keys index, name, module_id and
+        module_index (see also method `assignments`). Module payloads are
+        checked including shared conditions (as by `refine` and `verify`).
+        Raises a ValueError if an algorithm of the menu is listed more then
+        once or not at all.
+        """
+        handles = dict(((handle.index, handle.name), handle) for handle in self.algorithm_handles)
+        counts = Counter((algorithm['index'], algorithm['name']) for algorithm in algorithms)
+        duplicated = sorted(key for key, count in counts.items() if count > 1)
+        if duplicated:
+            raise ValueError("algorithm assigned more then once: {0} {1}".format(*duplicated[0]))
+        missing = sorted(set(handles) - set(counts))
+        if missing:
+            raise ValueError("algorithm not assigned: {0} {1}".format(*missing[0]))
+        modules = [Module(id, self.tray) for id in range(n_modules)]
+        assigned = set()
         try:
-            for algorithm in sorted(data['algorithms'], key=lambda a: a['module_index']):
-                index = algorithm['index']
-                name = algorithm['name']
-                module_id = algorithm['module_id']
-                module_index = algorithm['module_index']
-                algorithm_handle = filter_first(lambda handle: handle.index == index and handle.name == name, self.algorithm_handles)
-                stack.pop(stack.index(algorithm_handle))
-                # insert in correct order!
-                modules[module_id].append(algorithm_handle)
+            # insert in correct order!
+            for algorithm in sorted(algorithms, key=lambda a: a['module_index']):
+                key = algorithm['index'], algorithm['name']
+                if key not in handles:
+                    raise RuntimeError("no such algorithm in menu: {0} {1}".format(*key))
+                if not 0 <= algorithm['module_id'] < n_modules:
+                    raise RuntimeError("algorithm {0} assigned to invalid module {1}".format(algorithm['name'], algorithm['module_id']))
+                module = modules[algorithm['module_id']]
+                if not module.within(module.exchange(append=[handles[key]])):
+                    raise ResourceOverflowError()
+                module.insert(handles[key])
+                assigned.add(key)
         except ResourceOverflowError:
+            stack = [handle for key, handle in handles.items() if key not in assigned]
             logging.error("no resources left to implement menu")
             logging.error("there are %d unassigned algorithms left:", len(stack))
             for algorithm in stack:
@@ -847,8 +1524,55 @@ class ModuleCollection(object):
             raise
         self.modules = modules
 
-    def dump(self, fp, indent=2):
-        """Dumps distribution to JSON."""
+    def verify(self, n_modules, algorithms):
+        """Verifies a stored distribution without assigning it, checking for
+        unknown, duplicated and missing algorithms, module ids and local
+        indices, condition constraints and module ceilings. Arguments as for
+        method `assign`. Returns list of error messages (empty if valid).
+        """
+        errors = []
+        handles = dict(((handle.index, handle.name), handle) for handle in self.algorithm_handles)
+        floor = self.tray.floor()
+        ceiling = self.tray.ceiling()
+        conditions = [dict() for _ in range(n_modules)] # unique conditions by module
+        indices = [set() for _ in range(n_modules)] # local indices by module
+        counts = [0] * n_modules
+        assigned = set()
+        for algorithm in algorithms:
+            key = algorithm['index'], algorithm['name']
+            module_id = algorithm['module_id']
+            handle = handles.get(key)
+            if handle is None:
+                errors.append("no such algorithm in menu: {0} {1}".format(*key))
+                continue
+            if key in assigned:
+                errors.append("algorithm assigned more then once: {0} {1}".format(*key))
+                continue
+            assigned.add(key)
+            if not 0 <= module_id < n_modules:
+                errors.append("algorithm {0} assigned to invalid module {1}".format(handle.name, module_id))
+                continue
+            indices[module_id].add(algorithm['module_index'])
+            counts[module_id] += 1
+            for condition in handle:
+                if condition.type in self.constraints and module_id not in self.constraints[condition.type]:
+                    errors.append("algorithm {0} on module {1} violates constraint for {2}".format(handle.name, module_id, ConditionTypeKey.get(condition.type, condition.type)))
+                conditions[module_id][condition.name] = condition.payload
+        for key in handles:
+            if key not in assigned:
+                errors.append("algorithm not assigned: {0} {1}".format(*key))
+        for module_id in range(n_modules):
+            if indices[module_id] != set(range(counts[module_id])):
+                errors.append("module {0} has non consecutive local indices".format(module_id))
+            payload = Payload(floor.sliceLUTs, floor.processors)
+            for condition_payload in conditions[module_id].values():
+                payload += condition_payload
+            if payload.sliceLUTs > ceiling.sliceLUTs or payload.processors > ceiling.processors:
+                errors.append("module {0} exceeds ceiling: {1} > {2}".format(module_id, payload, ceiling))
+        return errors
+
+    def assignments(self):
+        """Returns list of algorithm assignments, sorted by global index."""
         algorithms = []
         for module in self:
             for algorithm in module:
@@ -857,9 +1581,19 @@ class ModuleCollection(object):
                     'index': algorithm.index,
                     'module_id': algorithm.module_id,
                     'module_index': algorithm.module_index,
+                    'expression': algorithm.expression,
                 })
         # Sort by global index
         algorithms.sort(key=lambda algorithm: algorithm['index'])
+        return algorithms
+
+    def dump(self, fp, indent=2):
+        """Dumps distribution to JSON."""
+        algorithms = self.assignments()
+        handles = dict((algorithm.name, algorithm) for algorithm in self.algorithm_handles)
+        conditions = self.planConditions()
+        for algorithm in algorithms:
+            algorithm['digest'] = algorithm_digest(resolve_algorithm(handles[algorithm['name']], conditions))
         data = {
             'name': self.eventSetup.getName(),
             'menu_uuid': self.eventSetup.getMenuUuid(),
@@ -872,27 +1606,9 @@ class ModuleCollection(object):
     def getShadowed(self, stack, conditions, ratio, depth=1):
         """Returns list of shadowed conditions from a stack of algorithms.
         Attribute *ratio* (0.0 < ratio <= 1.0) regulates the minimum amount of a shadowed algorithm.
-        Depth param is used for recursive call!
+        Depth param is used for indenting log messages.
         """
-        shadowed = []
-        a = conditions
-        for algorithm in stack:
-            if algorithm in shadowed:
-                continue
-            b = [condition.name for condition in algorithm.conditions]
-            # is shadowed at all?
-            if (set(a) & set(b)): # abc & bcd -> bc
-                left = len(set(a) & set(b)) # number of identical conditions len(bc)
-                right = len(set(a + b) - (set(a) & set(b))) # number of other conditions len(ad)
-                total = left + right # total number of conditions
-                percent = total/100.
-                if ratio <= (left/percent/100.):
-                    indent = " +-{0}".format("-" * depth)
-                    logging.info("%s %s shadowed ratio %.1f %%", indent, algorithm.name, (left/percent))
-                    shadowed.append(algorithm)
-                    shadowed += self.getShadowed(set(stack)-set(shadowed), list(set(a+b)), ratio, depth+1) # add recursive....
-                    shadowed = list(set(shadowed))
-        return shadowed
+        return ShadowIndex(stack).shadowed(conditions, ratio, depth)
 
     def __repr__(self):
         count = len(self)
@@ -912,11 +1628,25 @@ def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('filename', metavar='<file>', type=os.path.abspath, help="XML menu")
     parser.add_argument('--config', metavar='<file>', default=DefaultConfigFile, type=os.path.abspath, help="JSON resource configuration file, default {DefaultConfigFile}".format(**globals()))
-    parser.add_argument('--modules', metavar='<n>', default=2, type=int, help="number of modules, default is 2")
+    parser.add_argument('--modules', metavar='<n>', type=int, help="number of modules, default is 2 (or previous number of modules)")
     parser.add_argument('--ratio', metavar='<f>', default=0.0, type=float, help="algorithm shadow ratio (0.0 < ratio <= 1.0, default 0.0)")
     parser.add_argument('--sorting', metavar='asc|desc', choices=('asc', 'desc'), default='asc', help="sort order for weighting (asc or desc, default asc)")
     parser.add_argument('--constraint', metavar='<condition:module>', type=constraint_t, action='append', help="limit condition type to a specific module")
+    parser.add_argument('--placement', metavar='lightest|marginal', choices=(PlacementLightest, PlacementMarginal), default=PlacementLightest, help="module placement strategy (lightest or marginal, default lightest)")
+    parser.add_argument('--balance', metavar='<f>', default=DefaultBalance, type=float, help="weight of module payload for marginal placement, default {DefaultBalance}".format(**globals()))
+    parser.add_argument('--refine', metavar='<n>', type=int, help="refine distribution, applying up to <n> moves or swaps")
+    parser.add_argument('--refine-timeout', metavar='<sec>', type=float, help="refine distribution for up to <sec> seconds")
+    parser.add_argument('--sweep', action='store_true', help="sweep distribution parameters, apply best distribution")
+    parser.add_argument('--sweep-modules', metavar='<n>', type=parse_range, help="module counts to sweep (eg. 4-6)")
+    parser.add_argument('--sweep-ratio', metavar='<f>', type=ratios_t, help="shadow ratios to sweep (eg. 0:0.25:0.05)")
+    parser.add_argument('--sweep-sorting', metavar='asc,desc', type=sortings_t, help="sort orders to sweep")
+    parser.add_argument('--sweep-placement', metavar='lightest,marginal', type=placements_t, help="placement strategies to sweep")
+    parser.add_argument('--sweep-constraint', metavar='<condition:module>', type=constraint_t, action='append', help="alternative condition constraint to sweep")
+    parser.add_argument('--jobs', metavar='<n>', type=int, help="number of worker processes for sweep, default number of CPUs")
+    parser.add_argument('--verify', metavar='<file>', type=os.path.abspath, help="verify distribution (JSON dump or menu.json) and exit")
+    parser.add_argument('--previous', metavar='<file>', type=os.path.abspath, help="redistribute preserving previous distribution (JSON dump or menu.json)")
     parser.add_argument('-o', metavar='<file>', type=os.path.abspath, help="write calculated distribution to JSON file")
+    parser.add_argument('--plan', metavar='<file>', type=os.path.abspath, help="write firmware plan to JSON file")
     parser.add_argument('--list', action='store_true', help="list resource scales and exit")
     parser.add_argument("--verbose", dest="verbose", action="store_true")
     return parser.parse_args()
@@ -989,7 +1719,7 @@ def list_distribution(collection):
     for condition in conditions:
         modules = []
         for module in collection:
-            if condition in module.conditions:
+            if module.hasCondition(condition.name):
                 modules.append(module.id)
         logging.info("| {name:<48} | {modules:<24} |".format(name=condition.name, modules=','.join([str(module) for module in modules])))
     logging.info("|--------------------------------------------------|--------------------------|")
@@ -1019,15 +1749,28 @@ def dump_distribution(collection, args):
     with open(args.o, 'w') as fp:
         collection.dump(fp)
 
-def distribute(eventSetup, modules, config, ratio, reverse_sorting, constraints=None):
-    """Distribution wrapper function, provided for convenience."""
+def resource_tray(config, cache=None):
+    """Returns *config* if it is a resource tray (to share a loaded tray
+    between runs), else a resource tray loaded from JSON file *config*.
+    """
+    if isinstance(config, ResourceTray):
+        return config
+    logging.info("loading resource information from JSON: %s", config)
+    return ResourceTray(config, cache)
+
+def distribute(eventSetup, modules, config, ratio, reverse_sorting, constraints=None,
+               placement=PlacementLightest, balance=DefaultBalance,
+               refine_iterations=None, refine_timeout=None, cache=None):
+    """Distribution wrapper function, provided for convenience. Argument
+    *config* is a resource configuration file or a loaded resource tray.
+    Optional *cache* is a measurement cache shared between runs.
+    """
     logging.info("distributing menu...")
 
     constraints = constraints or {}
 
-    logging.info("loading resource information from JSON: %s", config)
     # Load resource file
-    tray = ResourceTray(config)
+    tray = resource_tray(config, cache)
     # Diagnostic output
     list_resources(tray)
 
@@ -1040,9 +1783,13 @@ def distribute(eventSetup, modules, config, ratio, reverse_sorting, constraints=
     logging.info("distributing algorithms, shadow ratio: %s", ratio)
     collection.ratio = ratio
     collection.reverse_sorting = reverse_sorting
+    collection.placement = placement
+    collection.balance = balance
     for k, v in constraints.items():
         collection.setConstraint(k, v)
     collection.distribute(modules)
+    if refine_iterations is not None or refine_timeout is not None:
+        collection.refine(refine_iterations, refine_timeout)
 
     # Diagnostic output
     list_distribution(collection)
@@ -1053,6 +1800,82 @@ def distribute(eventSetup, modules, config, ratio, reverse_sorting, constraints=
 
     return collection
 
+def redistribute(eventSetup, previous, config, modules=None, constraints=None, cache=None,
+                 reverse_sorting=False):
+    """Sticky redistribution wrapper function, provided for convenience.
+    Argument *previous* is the filename of a previous distribution (JSON dump
+    or menu.json). Returns module collection and list of changed module ids.
+    """
+    logging.info("redistributing menu...")
+
+    constraints = constraints or {}
+
+    # Load resource file
+    tray = resource_tray(config, cache)
+    # Diagnostic output
+    list_resources(tray)
+
+    # Create empty module collection
+    collection = ModuleCollection(eventSetup, tray)
+
+    # Diagnostic output
+    list_algorithms(collection)
+
+    logging.info("reading previous distribution: %s", previous)
+    with open(previous) as fp:
+        data = read_distribution(fp)
+    for k, v in constraints.items():
+        collection.setConstraint(k, v)
+    collection.reverse_sorting = reverse_sorting
+    changed = collection.redistribute(data, modules)
+
+    # Diagnostic output
+    list_distribution(collection)
+    list_summary(collection)
+
+    # Perform some checks
+    collection.validate()
+
+    return collection, changed
+
+def load_distribution(eventSetup, filename, config, constraints=None, cache=None):
+    """Load distribution wrapper function, provided for convenience. Assigns a
+    stored distribution (JSON dump or menu.json) without running the
+    distribution or listing diagnostics, keeping its firmware UUID. Raises a
+    RuntimeError if the stored distribution does not match the menu.
+    """
+    logging.info("loading distribution: %s", filename)
+
+    constraints = constraints or {}
+
+    # Load resource file
+    tray = resource_tray(config, cache)
+
+    # Create empty module collection
+    collection = ModuleCollection(eventSetup, tray)
+    for k, v in constraints.items():
+        collection.setConstraint(k, v)
+
+    with open(filename) as fp:
+        data = read_distribution(fp)
+    errors = collection.verify(data['n_modules'], data['algorithms'])
+    for error in errors:
+        logging.error(error)
+    if errors:
+        raise RuntimeError("invalid distribution for menu: {0}".format(filename))
+
+    # keep firmware UUID of stored distribution, regenerate if not provided
+    if data.get('firmware_uuid'):
+        collection.eventSetup.setFirmwareUuid(data['firmware_uuid'])
+    elif collection.regenerate_uuid:
+        collection.eventSetup.setFirmwareUuid(str(uuid.uuid4()))
+    collection.assign(data['n_modules'], data['algorithms'])
+
+    # Perform some checks
+    collection.validate()
+
+    return collection
+
 def main():
     args = parse_args()
 
@@ -1074,26 +1897,78 @@ def main():
     # Create module stubs
     collection = ModuleCollection(es, tray)
 
+    # Collect condition constraints
+    if args.constraint:
+        for k, v in args.constraint:
+            collection.setConstraint(k, v)
+
+    # Verify stored distribution and exit.
+    if args.verify:
+        logging.info("verifying distribution: %s", args.verify)
+        with open(args.verify) as fp:
+            data = read_distribution(fp)
+        errors = collection.verify(data['n_modules'], data['algorithms'])
+        for error in errors:
+            logging.error(error)
+        if errors:
+            logging.error("distribution is invalid, %d error(s)", len(errors))
+            return 1
+        logging.info("distribution is valid.")
+        return 0
+
     list_algorithms(collection)
 
     logging.info("distributing algorithms, shadow ratio: %s", args.ratio)
     collection.ratio = args.ratio
     # Set sort order (asc or desc)
     collection.reverse_sorting = (args.sorting == 'desc')
-    # Collect condition constraints
-    if args.constraint:
-        for k, v in args.constraint:
-            collection.setConstraint(k, v)
-    # Run distibution
-    collection.distribute(args.modules)
+    # Set placement strategy
+    collection.placement = args.placement
+    collection.balance = args.balance
+    previous = None
+    if args.previous:
+        # Sticky redistribution
+        logging.info("reading previous distribution: %s", args.previous)
+        with open(args.previous) as fp:
+            previous = read_distribution(fp)
+        collection.redistribute(previous, args.modules)
+    elif args.sweep:
+        # Sweep distribution parameters
+        from . import sweep
+        params = sweep.sweep_params(
+            modules=args.sweep_modules or [args.modules or 2],
+            ratios=args.sweep_ratio or [args.ratio],
+            sortings=args.sweep_sorting or [args.sorting],
+            placements=args.sweep_placement or [args.placement],
+            constraints=collection.constraints,
+            alternatives=[dict([constraint]) for constraint in args.sweep_constraint or []]
+        )
+        results = sweep.sweep(collection, params, args.jobs)
+        sweep.list_sweep(results)
+        sweep.apply_result(collection, results[0])
+    else:
+        # Run distibution
+        collection.distribute(args.modules or 2)
+    # Optional refinement
+    if args.refine is not None or args.refine_timeout is not None:
+        collection.refine(args.refine, args.refine_timeout)
 
     list_distribution(collection)
 
     list_summary(collection)
 
+    if previous is not None:
+        changed = collection.changedModules(previous)
+        logging.info(":: modules to be rebuilt: %s", ", ".join(str(id) for id in changed) or "none")
+
     if args.o:
         dump_distribution(collection, args)
 
+    if args.plan:
+        logging.info(":: writing firmware plan: %s", args.plan)
+        with open(args.plan, 'w') as fp:
+            collection.firmwarePlan().dump(fp)
+
     logging.info("done.")
 
     return 0
@@ -0,0 +1,249 @@
+"""Batch mode, produces many menus and distributions in one process.
+
+Jobs are read from a JSON manifest, each job provides the command line
+options of `tm-vhdlproducer` (long option names, without leading dashes).
+Flags are set using `true`, repeatable options (eg. `constraint`) accept a
+list. Relative paths are relative to the manifest. Options in `defaults`
+apply to all jobs. Options given on the batch command line apply to all jobs
+and overrule options of the manifest.
+
+    {
+      "defaults": {"output": "build", "modules": 6},
+      "jobs": [
+        {"menu": "L1Menu_sample.xml", "dist": 1},
+        {"menu": "L1Menu_sample.xml", "dist": 2, "ratio": 0.5, "constraint": ["ext:0"]}
+      ]
+    }
+
+Resource configurations, the optional menu cache and the template
+environment are loaded once and shared by all jobs. Jobs run concurrently in
+worker processes, each job writes its output directory as a single run of
+`tm-vhdlproducer` would. Condition measurements are only shared by jobs
+running in the same process (eg. using `--jobs 1`), use `--cache-dir` to
+reuse measured menus across worker processes and batch runs.
+
+    $ tm-vhdlproducer-batch releases.json --jobs 4
+
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import sys, os
+
+from .vhdlproducer import VhdlProducer
+from .algodist import ProjectDir
+from .algodist import ResourceTray, MeasureCache
+from .menucache import MenuCache
+from . import main as producer_main
+from . import __version__
+
+EXIT_SUCCESS = 0
+EXIT_FAILURE = 1
+
+PathOptions = ('menu', 'config', 'output', 'distribution', 'plan', 'previous', 'cache-dir')
+"""Options with paths relative to the manifest."""
+
+BatchOptions = ('output', 'cache-dir', 'update', 'dryrun', 'verbose')
+"""Options forwarded from the batch command line to every job."""
+
+# -----------------------------------------------------------------------------
+#  Shared state
+# -----------------------------------------------------------------------------
+
+_trays = {}
+"""Resource trays by configuration file, shared by jobs (inherited on fork)."""
+
+_producer = None
+"""VHDL producer shared by jobs (inherited on fork)."""
+
+_menu_cache = None
+"""Menu cache shared by jobs (inherited on fork)."""
+
+# -----------------------------------------------------------------------------
+#  Helpers
+# -----------------------------------------------------------------------------
+
+def job_argv(job, directory):
+    """Returns `tm-vhdlproducer` command line arguments of a job mapping,
+    relative paths are resolved against *directory*.
+    """
+    argv = []
+    for key, value in job.items():
+        option = key.replace('_', '-')
+        if option in PathOptions and not os.path.isabs(os.path.expanduser(value)):
+            value = os.path.join(directory, value)
+        if option == 'menu':
+            argv.append(value)
+        elif value is True:
+            argv.append('--{0}'.format(option))
+        elif value is False or value is None:
+            continue
+        elif isinstance(value, list):
+            for item in value:
+                argv.extend(['--{0}'.format(option), str(item)])
+        else:
+            argv.extend(['--{0}'.format(option), str(value)])
+    return argv
+
+def load_manifest(filename, options=None):
+    """Returns list of command line arguments for the jobs of a batch
+    manifest. Optional *options* (mapping, eg. from the command line) are
+    applied to all jobs and overrule options of the manifest.
+    """
+    with open(filename) as fp:
+        manifest = json.load(fp)
+    directory = os.path.dirname(os.path.abspath(filename))
+    jobs = []
+    for job in manifest['jobs']:
+        items = dict(manifest.get('defaults', {}))
+        items.update(job)
+        items.update(options or {})
+        jobs.append(job_argv(items, directory))
+    return jobs
+
+def prepare(jobs, measure_cache=None):
+    """Loads resource configurations, template environment and menu cache
+    shared by all *jobs* (list of parsed arguments). The measurement cache
+    of the resource trays is only shared by jobs running in this process,
+    worker processes inherit it as it is when forked.
+    """
+    global _producer, _menu_cache
+    cache = measure_cache or MeasureCache()
+    for args in jobs:
+        if args.config not in _trays:
+            logging.info("loading resource information from JSON: %s", args.config)
+            _trays[args.config] = ResourceTray(args.config, cache)
+        if args.cache_dir and _menu_cache is None:
+            _menu_cache = MenuCache(args.cache_dir)
+    if _producer is None and not all(args.dryrun for args in jobs):
+        template_dir = os.path.join(ProjectDir, 'templates', 'vhdl')
+        _producer = VhdlProducer(template_dir)
+        _producer.engine.preload() # compiled templates are inherited by workers
+
+def run_job(task):
+    """Runs a job, returns tuple of job index and exit code."""
+    index, args = task
+    logging.info("running job %d: %s (dist %s)", index, args.menu, args.dist)
+    try:
+        result = producer_main.run(
+            args,
+            tray=_trays[args.config],
+            producer=_producer,
+            menu_cache=_menu_cache
+        )
+    except Exception:
+        logging.exception("job %d failed", index)
+        result = EXIT_FAILURE
+    return index, result
+
+def run_batch(jobs, processes=None):
+    """Runs *jobs* (list of parsed arguments) using *processes* worker
+    processes (default is number of CPUs). Returns list of exit codes in
+    order of jobs.
+    """
+    prepare(jobs)
+    tasks = list(enumerate(jobs))
+    results = [None] * len(tasks)
+    if processes == 1 or len(tasks) < 2 or 'fork' not in multiprocessing.get_all_start_methods():
+        for task in tasks:
+            index, result = run_job(task)
+            results[index] = result
+    else:
+        # Worker processes can not fork, jobs run in a single process.
+        for args in jobs:
+            args.jobs = 1
+        context = multiprocessing.get_context('fork')
+        with context.Pool(processes) as pool:
+            for index, result in pool.imap_unordered(run_job, tasks):
+                results[index] = result
+    return results
+
+# -----------------------------------------------------------------------------
+#  Command line parser
+# -----------------------------------------------------------------------------
+
+def parse_args():
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(
+        prog='tm-vhdlproducer-batch',
+        description="Trigger Menu VHDL Producer for uGT upgrade, batch mode",
+        epilog="Report bugs to <bernhard.arnold@cern.ch>"
+    )
+    parser.add_argument('manifest',
+        type=os.path.abspath,
+        help="JSON manifest of jobs"
+    )
+    parser.add_argument('--jobs',
+        metavar='<n>',
+        type=int,
+        help="number of jobs to run concurrently (default is number of CPUs)",
+    )
+    parser.add_argument('--output',
+        metavar='<dir>',
+        type=os.path.abspath,
+        help="directory to write output (default is current directory)",
+    )
+    parser.add_argument('--cache-dir',
+        metavar='<dir>',
+        type=os.path.abspath,
+        help="cache parsed and measured menus in directory",
+    )
+    parser.add_argument('--update',
+        action='store_true',
+        help="update existing output directories",
+    )
+    parser.add_argument('--dryrun',
+        action='store_true',
+        help="do not write any output to the file system"
+    )
+    parser.add_argument("--verbose",
+        dest="verbose",
+        action="store_true",
+    )
+    parser.add_argument('--version',
+        action='version',
+        version="L1 Trigger Menu VHDL producer version {0}".format(__version__),
+    )
+    return parser.parse_args()
+
+# -----------------------------------------------------------------------------
+#  Main routine
+# -----------------------------------------------------------------------------
+
+def main():
+    """Main routine."""
+    args = parse_args()
+
+    # Setup console logging
+    level = logging.DEBUG if args.verbose else logging.INFO
+    logging.basicConfig(format='%(levelname)s: %(message)s', level=level)
+
+    options = {}
+    for option in BatchOptions:
+        value = getattr(args, option.replace('-', '_'))
+        if value:
+            options[option] = value
+
+    logging.info("loading batch manifest: %s", args.manifest)
+    jobs = []
+    for index, argv in enumerate(load_manifest(args.manifest, options)):
+        try:
+            jobs.append(producer_main.parse_args(argv))
+        except SystemExit:
+            logging.error("invalid job %d: %s", index, " ".join(argv))
+            return EXIT_FAILURE
+
+    results = run_batch(jobs, args.jobs)
+
+    for index, (job, result) in enumerate(zip(jobs, results)):
+        status = "ok" if result == EXIT_SUCCESS else "failed"
+        logging.info("job %d: %s (dist %s): %s", index, job.menu, job.dist, status)
+    failed = len([result for result in results if result != EXIT_SUCCESS])
+    logging.info("done, %d of %d job(s) failed.", failed, len(results))
+
+    return EXIT_FAILURE if failed else EXIT_SUCCESS
+
+if __name__ == '__main__':
+    sys.exit(main())
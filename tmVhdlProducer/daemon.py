@@ -0,0 +1,301 @@
+"""Producer daemon, a warm long running producer with a local HTTP API.
+
+The daemon keeps the compiled template environment, the resource trays
+(with a shared measurement cache) and the parsed and measured menus in
+memory, so requests skip interpreter start up, XML parsing and measuring.
+Requests are handled concurrently, one thread per request.
+
+Requests are JSON objects providing the command line options of
+`tm-vhdlproducer` (long option names without leading dashes, see `batch`),
+relative paths are relative to the working directory of the daemon. POST
+requests must be sent with `Content-Type: application/json`, other requests
+(eg. cross site form posts from a browser) are rejected.
+
+    POST /distribute   distribute menu, returns distribution (no output)
+    POST /dryrun       run producer in dryrun mode, returns status
+    POST /render       run producer writing output, returns status
+    GET  /menus        list cached menus by menu hash
+    POST /invalidate   remove cached menu by hash (`{"key": ...}`),
+                       by menu and config (`{"menu": ...}`) or all (`{}`)
+
+Responses are JSON objects, warnings and errors logged while processing a
+request are returned in `messages`. Requests are processed in separate run
+contexts (see `runcontext`), so a request with `trace` records its own trace
+and a request with `stats` its own counters.
+
+    $ tm-vhdlproducer-daemon --port 8750 &
+    $ curl -H 'Content-Type: application/json' \
+        -d '{"menu": "L1Menu_sample.xml", "modules": 6, "dist": 1}' localhost:8750/distribute
+
+Modules are rendered and sweeps are evaluated in the request thread, as
+forking worker processes is not safe in a multi threaded server.
+
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .vhdlproducer import VhdlProducer, distribution_data
+from .algodist import ProjectDir, DefaultConfigFile
+from .algodist import ResourceTray, MeasureCache, ResourceOverflowError
+from .menucache import MemoryMenuCache, load_menu
+from .batch import job_argv
+from . import main as producer_main
+from . import runcontext
+from . import __version__
+
+EXIT_SUCCESS = 0
+EXIT_FAILURE = 1
+
+DefaultHost = 'localhost'
+DefaultPort = 8750
+
+class RequestError(ValueError):
+    """Raised on invalid requests."""
+
+class MessageCollector(logging.Handler):
+    """Collects warnings and errors logged by the current run (see
+    `runcontext`), including its documentation threads.
+    """
+
+    def __init__(self, level=logging.WARNING):
+        super(MessageCollector, self).__init__(level)
+        self.addFilter(runcontext.RunFilter())
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append("{0}: {1}".format(record.levelname, record.getMessage()))
+
+class ProducerService(object):
+    """Warm producer state shared by concurrent requests.
+
+    >>> service = ProducerService()
+    >>> service.distribute({'menu': 'L1Menu_sample.xml', 'modules': 6, 'dist': 1})
+    """
+
+    def __init__(self):
+        self.measure_cache = MeasureCache()
+        self.menu_cache = MemoryMenuCache()
+        self.trays = {}
+        self.lock = threading.Lock()
+        template_dir = os.path.join(ProjectDir, 'templates', 'vhdl')
+        self.producer = VhdlProducer(template_dir)
+        self.producer.engine.preload()
+
+    def tray(self, config):
+        """Returns resource tray for configuration file *config*."""
+        with self.lock:
+            if config not in self.trays:
+                logging.info("loading resource information from JSON: %s", config)
+                self.trays[config] = ResourceTray(config, self.measure_cache)
+            return self.trays[config]
+
+    def parseArgs(self, options, dryrun=False):
+        """Returns parsed command line arguments for request *options*."""
+        if not isinstance(options, dict):
+            raise RequestError("expected JSON object")
+        argv = job_argv(options, os.getcwd())
+        try:
+            args = producer_main.parse_args(argv)
+        except SystemExit:
+            raise RequestError("invalid options: {0}".format(" ".join(argv)))
+        args.jobs = 1
+        if dryrun:
+            args.dryrun = True
+        return args
+
+    def distribute(self, options):
+        """Distributes a menu, returns distribution (see `menu.json`) with
+        module payloads.
+        """
+        if isinstance(options, dict):
+            options = dict({'dist': 1}, **options) # not relevant for distribution
+        args = self.parseArgs(options, dryrun=True)
+        tray = self.tray(args.config)
+        eventSetup = load_menu(args.menu, tray, self.menu_cache)
+        collection = producer_main.produce(args, eventSetup, None, tray)
+        data = distribution_data(collection)
+        data['menu_key'] = self.menu_cache.key(args.menu, args.config)
+        data['modules'] = []
+        for module in collection:
+            payload = getattr(module, 'payload', None)
+            data['modules'].append({
+                'id': module.id,
+                'algorithms': len(module),
+                'payload': [payload.sliceLUTs, payload.processors] if payload else None,
+            })
+        return data
+
+    def run(self, options, dryrun=False):
+        """Runs the producer, returns exit status and output directory."""
+        args = self.parseArgs(options, dryrun)
+        status = producer_main.run(
+            args,
+            tray=self.tray(args.config),
+            producer=self.producer,
+            menu_cache=self.menu_cache
+        )
+        return {'status': status, 'output': args.output}
+
+    def menus(self):
+        """Returns list of cached menus."""
+        return [{'key': key, 'name': name, 'size': size} for key, name, size in self.menu_cache.entries()]
+
+    def invalidate(self, options):
+        """Removes cached menus, returns number of removed menus."""
+        if not isinstance(options, dict):
+            raise RequestError("expected JSON object")
+        if 'key' in options:
+            return int(self.menu_cache.remove(options['key']))
+        if 'menu' in options:
+            menu = os.path.abspath(options['menu'])
+            config = os.path.abspath(options.get('config', DefaultConfigFile))
+            return int(self.menu_cache.remove(self.menu_cache.key(menu, config)))
+        return self.menu_cache.clear()
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """HTTP request handler dispatching to the producer service."""
+
+    server_version = "tm-vhdlproducer/{0}".format(__version__)
+
+    def do_GET(self):
+        routes = {
+            '/menus': lambda options: {'menus': self.server.service.menus()},
+        }
+        self.dispatch(routes, None)
+
+    def do_POST(self):
+        service = self.server.service
+        routes = {
+            '/distribute': lambda options: service.distribute(options),
+            '/dryrun': lambda options: service.run(options, dryrun=True),
+            '/render': lambda options: service.run(options),
+            '/invalidate': lambda options: {'removed': service.invalidate(options)},
+        }
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        if self.headers.get_content_type() != 'application/json':
+            self.respond(415, {'error': "expected Content-Type application/json"})
+            return
+        try:
+            options = json.loads(body.decode() or '{}')
+        except ValueError as e:
+            self.respond(400, {'error': "invalid JSON: {0}".format(e)})
+            return
+        self.dispatch(routes, options)
+
+    def dispatch(self, routes, options):
+        route = routes.get(self.path.split('?')[0])
+        if route is None:
+            self.respond(404, {'error': "no such resource: {0}".format(self.path)})
+            return
+        with runcontext.scope():
+            data, code, messages = self.call(route, options)
+        data['messages'] = messages
+        self.respond(code, data)
+
+    def call(self, route, options):
+        """Calls *route*, returns response data, status code and collected
+        messages.
+        """
+        collector = MessageCollector()
+        logging.getLogger().addHandler(collector)
+        try:
+            data = route(options)
+            code = 200
+        except ResourceOverflowError:
+            data = {'error': "distribution exceeds module resources"}
+            code = 400
+        except (RequestError, IOError, OSError) as e:
+            data = {'error': str(e)}
+            code = 400
+        except Exception as e:
+            logging.exception("request failed: %s", self.path)
+            data = {'error': str(e)}
+            code = 500
+        finally:
+            logging.getLogger().removeHandler(collector)
+        return data, code, collector.messages
+
+    def respond(self, code, data):
+        content = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        logging.debug("%s - %s", self.address_string(), format % args)
+
+class ProducerServer(ThreadingHTTPServer):
+    """Threading HTTP server providing a producer service to its handlers."""
+
+    daemon_threads = True
+
+    def __init__(self, address, service=None):
+        super(ProducerServer, self).__init__(address, RequestHandler)
+        self.service = service or ProducerService()
+
+# -----------------------------------------------------------------------------
+#  Command line parser
+# -----------------------------------------------------------------------------
+
+def parse_args():
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(
+        prog='tm-vhdlproducer-daemon',
+        description="Trigger Menu VHDL Producer for uGT upgrade, daemon mode",
+        epilog="Report bugs to <bernhard.arnold@cern.ch>"
+    )
+    parser.add_argument('--host',
+        metavar='<host>',
+        default=DefaultHost,
+        help="host to listen on (default is {0})".format(DefaultHost),
+    )
+    parser.add_argument('--port',
+        metavar='<n>',
+        default=DefaultPort,
+        type=int,
+        help="port to listen on (default is {0})".format(DefaultPort),
+    )
+    parser.add_argument("--verbose",
+        dest="verbose",
+        action="store_true",
+    )
+    parser.add_argument('--version',
+        action='version',
+        version="L1 Trigger Menu VHDL producer version {0}".format(__version__),
+    )
+    return parser.parse_args()
+
+# -----------------------------------------------------------------------------
+#  Main routine
+# -----------------------------------------------------------------------------
+
+def main():
+    """Main routine."""
+    args = parse_args()
+
+    # Setup console logging
+    level = logging.DEBUG if args.verbose else logging.INFO
+    logging.basicConfig(format='%(levelname)s: %(message)s', level=level)
+
+    server = ProducerServer((args.host, args.port))
+    logging.info("listening on %s:%s", *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("shutting down...")
+    finally:
+        server.server_close()
+
+    return EXIT_SUCCESS
+
+if __name__ == '__main__':
+    sys.exit(main())
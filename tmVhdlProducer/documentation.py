@@ -0,0 +1,97 @@
+"""Menu documentation using tm-reporter.
+
+HTML and TWiki documents are generated in a background thread from one
+loaded menu using the tm-reporter API in-process, one document after the
+other (a reporter instance is never shared between threads). If the API is
+not available the `tm-reporter` executable is used instead. Documents are
+written directly to their final names (eg. `L1Menu_sample-d1.html`).
+
+>>> with ThreadPoolExecutor() as executor:
+...     future = write_documentation(executor, 'L1Menu_sample-d1.xml', 'doc', 'L1Menu_sample', 1)
+...     # ... do other work
+...     filenames = future.result()
+
+"""
+
+import glob
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+
+from . import tracing
+
+try:
+    import tmReporter
+except ImportError:
+    tmReporter = None
+
+ExecReporter = 'tm-reporter'
+
+Modes = ('html', 'twiki')
+"""Documentation modes (also used as filename extensions)."""
+
+def document_filename(directory, name, dist, mode):
+    """Returns filename of a menu document."""
+    return os.path.join(directory, '{name}-d{dist}.{mode}'.format(name=name, dist=dist, mode=mode))
+
+@tracing.traced('tm-reporter load')
+def create_reporter(filename):
+    """Returns in-process tm-reporter instance for XML menu *filename*, or None
+    if the tm-reporter API is not available.
+    """
+    if tmReporter is None:
+        logging.info("tm-reporter API not available, using %s executable", ExecReporter)
+        return None
+    try:
+        from tmReporter.reporter import Reporter
+    except ImportError as e:
+        logging.info("tm-reporter API not available (%s), using %s executable", e, ExecReporter)
+        return None
+    template_dir = os.path.join(os.path.dirname(tmReporter.__file__), 'templates')
+    return Reporter(template_dir, filename)
+
+def write_inprocess(reporter, mode, target):
+    """Writes menu document using an in-process reporter instance."""
+    getattr(reporter, 'write_{0}'.format(mode))(target)
+
+def write_subprocess(filename, mode, target):
+    """Writes menu document using the tm-reporter executable."""
+    directory = tempfile.mkdtemp(dir=os.path.dirname(target))
+    try:
+        subprocess.check_call([ExecReporter, '-m', mode, '-o', directory, filename])
+        documents = glob.glob(os.path.join(directory, '*'))
+        if len(documents) != 1:
+            raise RuntimeError("{0}: expected one {1} document, got {2}".format(ExecReporter, mode, len(documents)))
+        os.replace(documents[0], target)
+    finally:
+        shutil.rmtree(directory)
+
+def write_document(reporter, filename, mode, target):
+    """Writes menu document using in-process *reporter* instance (or the
+    executable if None). Returns filename of written document.
+    """
+    logging.info("writing %s documentation %s", mode.upper(), target)
+    with tracing.span('tm-reporter {0}'.format(mode), filename=target):
+        if reporter is not None:
+            write_inprocess(reporter, mode, target)
+        else:
+            write_subprocess(filename, mode, target)
+    return target
+
+def write_documents(filename, directory, name, dist):
+    """Writes all menu documents of XML menu *filename*, loading the menu once.
+    Returns list of written filenames.
+    """
+    reporter = create_reporter(filename)
+    return [write_document(reporter, filename, mode, document_filename(directory, name, dist, mode)) for mode in Modes]
+
+def write_documentation(executor, filename, directory, name, dist):
+    """Submits generating the menu documentation of XML menu *filename* to
+    *executor* (a thread pool). Returns future of the list of written
+    filenames.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    return executor.submit(write_documents, filename, directory, name, dist)
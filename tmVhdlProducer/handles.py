@@ -6,12 +6,15 @@ Classes:
  * ObjectHandle
  * ConditionHandle
  * AlgorithmHandle
+ * MenuHandle
 
 """
 
 import tmEventSetup
 import tmGrammar
 
+from .plan import Payload
+
 #
 # Dictionaries
 #
@@ -224,48 +227,6 @@ def filter_first(func, data):
     """Returns first result for filter() or None if not match found."""
     return (list(filter(func, data)) or [None])[0]
 
-#
-#  Utility classes
-#
-
-class Payload(object):
-    """Implements a generic payload represented by multiple attributes.
-
-    >>> payload = Payload(sliceLUTs, processors)
-    >>> payload < (payload + payload)
-    >>> payload.sliceLUTs, payload.processors
-    """
-    def __init__(self, sliceLUTs=0, processors=0):
-        self.sliceLUTs = float(sliceLUTs)
-        self.processors = float(processors)
-
-    def _astuple(self):
-        """Retrurns tuple of payload attributes ordered by significance (most
-        significant last, least first).
-        """
-        return self.sliceLUTs, self.processors
-
-    def _asdict(self):
-        return dict(sliceLUTs=self.sliceLUTs, processors=self.processors)
-
-    def __add__(self, payload):
-        """Multiplicate payloads."""
-        sliceLUTs = self.sliceLUTs + payload.sliceLUTs
-        processors = self.processors + payload.processors
-        return Payload(sliceLUTs, processors)
-
-    def __eq__(self, payload):
-        return self._astuple() == payload._astuple()
-
-    def __lt__(self, payload):
-        """Compare payloads by list of attributes ordered by significance."""
-        return self._astuple() < payload._astuple()
-
-    def __repr__(self):
-        sliceLUTsPercent = self.sliceLUTs * 100
-        processorsPercent = self.processors * 100
-        return "{self.__class__.__name__}(sliceLUTs={sliceLUTsPercent:.2f}%, DSPs={processorsPercent:.2f}%)".format(**locals())
-
 #
 #  Handle classes
 #
@@ -438,3 +399,38 @@ class AlgorithmHandle(Handle):
 
     def __repr__(self):
         return "{self.__class__.__name__}(index={self.index}, name={self.name}, payload={self.payload})".format(**locals())
+
+class MenuHandle(Handle):
+    """Represents a trigger menu with its condition and algorithm handles,
+    providing the menu information getters of `tmEventSetup.esTriggerMenu`.
+    Unlike the event setup it can be pickled (see module `menucache`).
+    """
+    def __init__(self, eventSetup, condition_handles, algorithm_handles):
+        self.name = eventSetup.getName()
+        self.menu_uuid = eventSetup.getMenuUuid()
+        self.firmware_uuid = eventSetup.getFirmwareUuid()
+        self.scale_set_name = eventSetup.getScaleSetName()
+        self.version = eventSetup.getVersion()
+        self.condition_handles = condition_handles
+        self.algorithm_handles = algorithm_handles
+
+    def getName(self):
+        return self.name
+
+    def getMenuUuid(self):
+        return self.menu_uuid
+
+    def getFirmwareUuid(self):
+        return self.firmware_uuid
+
+    def setFirmwareUuid(self, uuid):
+        self.firmware_uuid = uuid
+
+    def getScaleSetName(self):
+        return self.scale_set_name
+
+    def getVersion(self):
+        return self.version
+
+    def __repr__(self):
+        return "{self.__class__.__name__}(name={self.name})".format(**locals())
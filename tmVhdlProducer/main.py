@@ -1,32 +1,37 @@
+"""Command line interface of the VHDL producer.
+
+Heavy dependencies (event setup, Jinja2, tmTable, tm-reporter) are imported by
+the stage using them, so parsing options, `--help`, `--version` and dryrun
+mode do not load the rendering and documentation stack.
+
+"""
+
 import argparse
-import subprocess
-import glob
 import logging
-import re
 import sys, os
 
-import tmEventSetup
-import tmReporter
-
-from .vhdlproducer import VhdlProducer
-from .algodist import ProjectDir
-from .algodist import distribute, constraint_t
-from .algodist import MinModules, MaxModules
-from .algodist import kExternals
+from .options import ProjectDir
+from .options import constraint_t
+from .options import MinModules, MaxModules
+from .options import PlacementLightest, PlacementMarginal, DefaultBalance
+from .options import SortingAsc, SortingDesc
+from .options import kExternals
+from .options import parse_range
+from .options import ratios_t, sortings_t, placements_t
+from .options import DefaultConfigFile
+from . import tracing
+from . import runcontext
+from . import stats
 from . import __version__
 
 EXIT_SUCCESS = 0
 EXIT_FAILURE = 1
 LOGFILE = 'tm-vhdlproducer.log'
-EXEC_REPORTER = 'tm-reporter'
-
-SortingAsc = 'asc'
-SortingDesc = 'desc'
+STATSFILE = 'stats.json'
 
 DefaultRatio = 0.0
 DefaultSorting = SortingAsc
 DefaultOutputDir = os.getcwd()
-from .algodist import DefaultConfigFile
 
 ConstraintTypes = {
     'ext': kExternals,
@@ -44,6 +49,13 @@ def modules_t(value):
         return value
     raise ValueError(value)
 
+def modules_range_t(value):
+    """Validate range of number of modules input (eg. 4-6)."""
+    values = sorted(parse_range(value))
+    for item in values:
+        modules_t(item)
+    return values
+
 def dist_t(value):
     """Validate firmware distribution number."""
     value = int(value)
@@ -62,8 +74,8 @@ def ratio_t(value):
 #  Command line parser
 # -----------------------------------------------------------------------------
 
-def parse_args():
-    """Parse command line options."""
+def parse_args(argv=None):
+    """Parse command line options, *argv* defaults to `sys.argv`."""
     parser = argparse.ArgumentParser(
         prog='tm-vhdlproducer',
         description="Trigger Menu VHDL Producer for uGT upgrade",
@@ -75,9 +87,8 @@ def parse_args():
     )
     parser.add_argument('--modules',
         metavar='<n>',
-        required=True,
         type=modules_t,
-        help="number of modules ({0}-{1})".format(MinModules, MaxModules),
+        help="number of modules ({0}-{1}), required unless using --distribution or --plan (defaults to previous number of modules using --previous)".format(MinModules, MaxModules),
     )
     parser.add_argument('--dist',
         metavar='<n>',
@@ -97,6 +108,78 @@ def parse_args():
         choices=(SortingAsc, SortingDesc),
         help="sort order for condition weights ({0} or {1}, default is {2})".format(SortingAsc, SortingDesc, DefaultSorting),
     )
+    parser.add_argument('--placement',
+        metavar='lightest|marginal',
+        default=PlacementLightest,
+        choices=(PlacementLightest, PlacementMarginal),
+        help="module placement strategy, either least total payload or least marginal payload increase ({0} or {1}, default is {0})".format(PlacementLightest, PlacementMarginal),
+    )
+    parser.add_argument('--balance',
+        metavar='<f>',
+        default=DefaultBalance,
+        type=float,
+        help="weight of current module payload for marginal placement (default is {0})".format(DefaultBalance),
+    )
+    parser.add_argument('--refine',
+        metavar='<n>',
+        type=int,
+        help="refine distribution by moving and swapping algorithms between modules, applying up to <n> changes",
+    )
+    parser.add_argument('--refine-timeout',
+        metavar='<sec>',
+        type=float,
+        help="time budget in seconds for refining the distribution",
+    )
+    parser.add_argument('--distribution',
+        metavar='<file>',
+        type=os.path.abspath,
+        help="use a stored distribution (menu.json or JSON dump), skipping the distribution",
+    )
+    parser.add_argument('--plan',
+        metavar='<file>',
+        type=os.path.abspath,
+        help="render a firmware plan (JSON, see algodist --plan), skipping the distribution",
+    )
+    parser.add_argument('--previous',
+        metavar='<file>',
+        type=os.path.abspath,
+        help="preserve a previous distribution (menu.json or JSON dump), placing only new or changed algorithms",
+    )
+    parser.add_argument('--sweep',
+        action='store_true',
+        help="sweep distribution parameters in parallel and apply the best distribution (lowest peak module payload)",
+    )
+    parser.add_argument('--sweep-modules',
+        metavar='<n>',
+        type=modules_range_t,
+        help="numbers of modules to sweep (eg. 4-6, default is --modules)",
+    )
+    parser.add_argument('--sweep-ratio',
+        metavar='<f>',
+        type=ratios_t,
+        help="shadow ratios to sweep, comma separated or <start>:<stop>:<step> (default is --ratio)",
+    )
+    parser.add_argument('--sweep-sorting',
+        metavar='asc,desc',
+        type=sortings_t,
+        help="sort orders to sweep (default is --sorting)",
+    )
+    parser.add_argument('--sweep-placement',
+        metavar='lightest,marginal',
+        type=placements_t,
+        help="placement strategies to sweep (default is --placement)",
+    )
+    parser.add_argument('--sweep-constraint',
+        metavar='<condition:modules>',
+        action='append',
+        type=constraint_t,
+        help="alternative condition constraint to sweep in addition to --constraint",
+    )
+    parser.add_argument('--jobs',
+        metavar='<n>',
+        type=int,
+        help="number of worker processes for sweep (default is number of CPUs) and for writing modules (default is 1)",
+    )
     parser.add_argument('--config',
         metavar='<file>',
         default=DefaultConfigFile,
@@ -109,12 +192,30 @@ def parse_args():
         type=constraint_t,
         help="limit condition type to a specific module, valid types are: {0}".format(", ".join(ConstraintTypes.keys())),
     )
+    parser.add_argument('--cache-dir',
+        metavar='<dir>',
+        type=os.path.abspath,
+        help="cache parsed and measured menus in directory, reused for identical menu, configuration and version",
+    )
     parser.add_argument('--output',
         metavar='<dir>',
         default=DefaultOutputDir,
         type=os.path.abspath,
         help="directory to write VHDL producer output (default is {0})".format(DefaultOutputDir),
     )
+    parser.add_argument('--update',
+        action='store_true',
+        help="update an existing output directory, files with unchanged content are not rewritten",
+    )
+    parser.add_argument('--trace',
+        metavar='<file>',
+        type=os.path.abspath,
+        help="write a trace of the processing stages to file (Chrome trace event JSON, see about:tracing or Perfetto)",
+    )
+    parser.add_argument('--stats',
+        action='store_true',
+        help="report hot path counters of distribution and rendering, written to {0} in the output directory".format(STATSFILE),
+    )
     parser.add_argument('--dryrun',
         action='store_true',
         help="do not write any output to the file system"
@@ -127,24 +228,74 @@ def parse_args():
         action='version',
         version="L1 Trigger Menu VHDL producer version {0}".format(__version__),
     )
-    return parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.modules is None and not (args.distribution or args.plan or args.previous):
+        parser.error("the following arguments are required: --modules")
+    return args
 
 # -----------------------------------------------------------------------------
 #  Main routine
 # -----------------------------------------------------------------------------
 
-def main():
-    """Main routine."""
-    args = parse_args()
-
-    # Setup console logging
+def run(args, tray=None, producer=None, menu_cache=None):
+    """Runs the VHDL producer for parsed command line arguments *args*,
+    returns exit code. Optional resource *tray* (loaded from `args.config`),
+    VHDL *producer* and *menu_cache* are used instead of creating them, to
+    share them between multiple runs (see `batch`).
+    """
     level = logging.DEBUG if args.verbose else logging.INFO
-    logging.basicConfig(format='%(levelname)s: %(message)s', level=level)
 
     logging.info("running VHDL producer...")
 
-    logging.info("loading XML menu: %s", args.menu)
-    eventSetup = tmEventSetup.getTriggerMenu(args.menu)
+    # Enable tracing unless already enabled by the caller (tracing is bound
+    # to the current context, concurrent runs record separate traces).
+    tracer = None
+    if args.trace:
+        if tracing.enabled():
+            logging.warning("tracing already enabled by the caller, not writing trace: %s", args.trace)
+        else:
+            tracer = tracing.enable()
+    if args.stats:
+        stats.reset()
+    try:
+        with runcontext.scope(), tracing.span('tm-vhdlproducer', menu=args.menu):
+            return run_stages(args, tray, producer, menu_cache, level)
+    finally:
+        if tracer:
+            tracing.disable()
+            logging.info("writing trace: %s", args.trace)
+            with open(args.trace, 'w') as fp:
+                tracer.dump(fp)
+
+def load_plan(filename):
+    """Returns firmware plan loaded from JSON file *filename*."""
+    from .plan import FirmwarePlan
+
+    logging.info("loading firmware plan: %s", filename)
+    with tracing.span('load plan', filename=filename):
+        with open(filename) as fp:
+            return FirmwarePlan.load(fp)
+
+def run_stages(args, tray, producer, menu_cache, level):
+    """Loads the menu (or the firmware plan, without parsing the menu),
+    prepares output directory and logging and runs the producer stages (see
+    `run`). Returns exit code.
+    """
+    if args.plan:
+        eventSetup = load_plan(args.plan)
+    else:
+        import tmEventSetup
+        from .algodist import ResourceTray
+        from .menucache import MenuCache, load_menu
+
+        logging.info("loading XML menu: %s", args.menu)
+        with tracing.span('load menu', filename=args.menu):
+            if args.cache_dir and not menu_cache:
+                menu_cache = MenuCache(args.cache_dir)
+            if menu_cache:
+                eventSetup = load_menu(args.menu, tray or ResourceTray(args.config), menu_cache)
+            else:
+                eventSetup = tmEventSetup.getTriggerMenu(args.menu)
     output_dir = os.path.join(args.output, "{name}-d{dist}".format(name=eventSetup.getName(), dist=args.dist))
 
     # Prevent overwirting source menu
@@ -157,18 +308,56 @@ def main():
 
     if not args.dryrun:
         if os.path.isdir(output_dir):
-            logging.error("directory `%s' already exists", output_dir)
-            return EXIT_FAILURE
+            if not args.update:
+                logging.error("directory `%s' already exists (use --update to update it)", output_dir)
+                return EXIT_FAILURE
+            logging.info("updating existing directory `%s'", output_dir)
         else:
             os.makedirs(output_dir)
 
+    handler = None
     if not args.dryrun:
         # Forward logs to file
         handler = logging.FileHandler(os.path.join(output_dir, LOGFILE), mode='a')
         handler.setFormatter(logging.Formatter(fmt='%(asctime)s %(levelname)s : %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
         handler.setLevel(level)
+        # Runs may be concurrent (see daemon), log records of this run only.
+        handler.addFilter(runcontext.RunFilter())
         logging.getLogger().addHandler(handler)
 
+    try:
+        produce(args, eventSetup, output_dir, tray or args.config, producer)
+        if args.stats:
+            write_stats(args, eventSetup, output_dir)
+        logging.info("done.")
+    finally:
+        if handler:
+            logging.getLogger().removeHandler(handler)
+            handler.close()
+
+    return EXIT_SUCCESS
+
+def write_stats(args, eventSetup, output_dir):
+    """Logs report of hot path counters and writes them to the output
+    directory (unless in dryrun mode).
+    """
+    logging.info("hot path counters:")
+    for line in stats.report():
+        logging.info("  %s", line)
+    if not args.dryrun:
+        filename = os.path.join(output_dir, STATSFILE)
+        logging.info("writing counters: %s", filename)
+        with open(filename, 'w') as fp:
+            stats.dump(fp, menu_name=eventSetup.getName(), dist=args.dist, version=__version__)
+
+def produce(args, eventSetup, output_dir, config, producer=None):
+    """Distributes menu and writes output according to command line
+    arguments *args*, *config* is a resource configuration file or tray.
+    Using `--plan` *eventSetup* may be the already loaded firmware plan.
+    Returns the distributed module collection (or the firmware plan).
+    """
+    from .plan import FirmwarePlan
+
     # Distribute algorithms, set sort order (asc or desc)
     reverse_sorting = (args.sorting == 'desc')
     # Collect condition constraints
@@ -176,47 +365,133 @@ def main():
     if args.constraint:
         for k, v in args.constraint:
             constraints[ConstraintTypes[k]] = v
-    # Run distibution
-    collection = distribute(
-        eventSetup=eventSetup,
-        modules=args.modules,
-        config=args.config,
-        ratio=args.ratio,
-        reverse_sorting=reverse_sorting,
-        constraints=constraints
-    )
+    if args.plan:
+        # Use firmware plan, rendered without the event setup
+        if isinstance(eventSetup, FirmwarePlan):
+            collection = eventSetup
+        else:
+            collection = load_plan(args.plan)
+    elif args.distribution:
+        # Use stored distribution
+        from .algodist import load_distribution
+        collection = load_distribution(
+            eventSetup=eventSetup,
+            filename=args.distribution,
+            config=config,
+            constraints=constraints
+        )
+    elif args.previous:
+        # Sticky redistribution
+        from .algodist import redistribute
+        collection, changed = redistribute(
+            eventSetup=eventSetup,
+            previous=args.previous,
+            config=config,
+            modules=args.modules,
+            constraints=constraints,
+            reverse_sorting=reverse_sorting
+        )
+        logging.info("modules to be rebuilt: %s", ", ".join(str(id) for id in changed) or "none")
+    elif args.sweep:
+        # Sweep distribution parameters
+        from .sweep import sweep_params, sweep_distribute
+        alternatives = []
+        if args.sweep_constraint:
+            for k, v in args.sweep_constraint:
+                alternatives.append({ConstraintTypes[k]: v})
+        params = sweep_params(
+            modules=args.sweep_modules or [args.modules],
+            ratios=args.sweep_ratio or [args.ratio],
+            sortings=args.sweep_sorting or [args.sorting],
+            placements=args.sweep_placement or [args.placement],
+            constraints=constraints,
+            alternatives=alternatives
+        )
+        collection = sweep_distribute(
+            eventSetup=eventSetup,
+            config=config,
+            params=params,
+            jobs=args.jobs,
+            balance=args.balance,
+            refine_iterations=args.refine,
+            refine_timeout=args.refine_timeout
+        )
+    else:
+        # Run distibution
+        from .algodist import distribute
+        collection = distribute(
+            eventSetup=eventSetup,
+            modules=args.modules,
+            config=config,
+            ratio=args.ratio,
+            reverse_sorting=reverse_sorting,
+            constraints=constraints,
+            placement=args.placement,
+            balance=args.balance,
+            refine_iterations=args.refine,
+            refine_timeout=args.refine_timeout
+        )
 
     if args.dryrun:
         logging.info("skipped writing output (dryrun mode)")
     else:
+        from .vhdlproducer import VhdlProducer, makedirs, keep_firmware_uuid
+        from .documentation import write_documentation
 
-        logging.info("writing VHDL modules...")
-        template_dir = os.path.join(ProjectDir, 'templates', 'vhdl')
-        producer = VhdlProducer(template_dir)
-        producer.write(collection, output_dir)
-        logging.info("writing updated XML file %s", args.menu)
+        if producer is None:
+            template_dir = os.path.join(ProjectDir, 'templates', 'vhdl')
+            producer = VhdlProducer(template_dir)
+        jobs = args.jobs or 1
+
+        # Keep firmware UUID of an unchanged distribution on update (a firmware
+        # plan provides its own UUID).
+        if args.update and not args.plan:
+            firmware_uuid = keep_firmware_uuid(collection, output_dir)
+            if firmware_uuid:
+                logging.info("distribution unchanged, keeping firmware UUID %s", firmware_uuid)
+
+        # Output is written from a firmware plan of the distribution.
+        if not isinstance(collection, FirmwarePlan):
+            with tracing.span('FirmwarePlan'):
+                plan = FirmwarePlan.fromCollection(collection)
+        else:
+            plan = collection
 
-        filename = producer.writeXmlMenu(args.menu, os.path.join(output_dir, 'xml'), args.dist) # TODO
+        # Write updated XML menu from the distribution.
+        logging.info("writing updated XML file %s", args.menu)
+        xml_dir = os.path.join(output_dir, 'xml')
+        makedirs(xml_dir)
+        filename = producer.writeXmlMenu(args.menu, xml_dir, args.dist, distribution=plan)
 
-        # Write menu documentation.
+        # Write menu documentation (HTML and TWiki page template) concurrently
+        # with the VHDL modules. Worker processes for writing modules are not
+        # forked while the documentation thread is running.
         logging.info("generating menu documentation...")
         doc_dir = os.path.join(output_dir, 'doc')
+        with runcontext.ContextExecutor(1) as executor:
+            if jobs == 1:
+                future = write_documentation(executor, filename, doc_dir, plan.getName(), args.dist)
+            logging.info("writing VHDL modules...")
+            with tracing.span('VhdlProducer.write', jobs=jobs):
+                changed = producer.write(plan, output_dir, jobs=jobs)
+            logging.info("modules with changed sources: %s", ", ".join(str(id) for id in changed) or "none")
+            if jobs != 1:
+                future = write_documentation(executor, filename, doc_dir, plan.getName(), args.dist)
+            with tracing.span('wait for documentation'):
+                for document in future.result():
+                    logging.info("written documentation %s", document)
 
-        logging.info("writing HTML documentation %s", filename)
-        subprocess.check_call([EXEC_REPORTER, '-m', 'html', '-o', doc_dir, filename])
-
-        logging.info("writing TWIKI page template %s", filename)
-        subprocess.check_call([EXEC_REPORTER, '-m', 'twiki', '-o', doc_dir, filename])
+    return collection
 
-        logging.info("patching filenames...")
-        for filename in glob.glob(os.path.join(doc_dir, '*')):
-            newname = re.sub(r'(.+)\.([a-z]+)$', r'\1-d{}.\2'.format(args.dist), filename)
-            logging.info("%s --> %s", filename, newname)
-            os.rename(filename, newname)
+def main():
+    """Main routine."""
+    args = parse_args()
 
-    logging.info("done.")
+    # Setup console logging
+    level = logging.DEBUG if args.verbose else logging.INFO
+    logging.basicConfig(format='%(levelname)s: %(message)s', level=level)
 
-    return EXIT_SUCCESS
+    return run(args)
 
 if __name__ == '__main__':
     sys.exit(main())
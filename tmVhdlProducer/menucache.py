@@ -0,0 +1,219 @@
+"""On-disk cache of parsed and measured trigger menus.
+
+Menus are cached as pickled menu handles (see `handles.MenuHandle`) holding
+the measured condition and algorithm handles including the cut precisions
+looked up from the menu scales. Cache entries are addressed by the SHA-256
+hash of the XML menu, the resource configuration and the package version, so
+any change of these invalidates the entry. The cache is bounded in size,
+least recently used entries are evicted first.
+
+>>> cache = MenuCache('~/.cache/tm-vhdlproducer')
+>>> eventSetup = load_menu('L1Menu_sample.xml', tray, cache)
+>>> collection = ModuleCollection(eventSetup, tray)
+
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+
+import tmEventSetup
+
+from .algodist import ModuleCollection
+from . import __version__
+
+DefaultMaxSize = 256 * 1024 * 1024
+"""Default cache size limit in bytes."""
+
+FormatVersion = 1
+"""Version of the cache entry format, part of the cache key."""
+
+Suffix = '.pickle'
+
+def menu_key(filename, config):
+    """Returns cache key for XML menu *filename* and resource configuration
+    *config*, the SHA-256 hash of both files and the package version.
+    """
+    digest = hashlib.sha256()
+    digest.update("{0}:{1}\n".format(__version__, FormatVersion).encode())
+    for path in (filename, config):
+        with open(path, 'rb') as fp:
+            digest.update(hashlib.sha256(fp.read()).digest())
+    return digest.hexdigest()
+
+class MenuCache(object):
+    """Size bounded on-disk cache of menu handles.
+
+    >>> cache = MenuCache('/tmp/cache', max_size=64 * 1024 * 1024)
+    >>> key = cache.key('L1Menu_sample.xml', 'resource_default.json')
+    >>> cache.load(key)
+    """
+
+    def __init__(self, directory, max_size=DefaultMaxSize):
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.max_size = max_size
+
+    def key(self, filename, config):
+        """Returns cache key for XML menu *filename* and resource
+        configuration *config*.
+        """
+        return menu_key(filename, config)
+
+    def path(self, key):
+        """Returns filename of cache entry."""
+        return os.path.join(self.directory, key + Suffix)
+
+    def load(self, key):
+        """Returns cached menu handle for *key* or None if not cached."""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as fp:
+                menu = pickle.load(fp)
+        except (IOError, OSError):
+            return None
+        except Exception as e:
+            logging.warning("discarding corrupt menu cache entry %s: %s", path, e)
+            self.remove(key)
+            return None
+        os.utime(path, None) # mark as recently used
+        return menu
+
+    def store(self, key, menu):
+        """Stores menu handle for *key* and evicts old entries."""
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                pickle.dump(menu, fp, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path(key))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.evict()
+
+    def remove(self, key):
+        """Removes cache entry for *key*."""
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def entries(self):
+        """Returns list of (mtime, size, path) of cache entries, least
+        recently used first.
+        """
+        entries = []
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(Suffix):
+                    path = os.path.join(self.directory, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        """Removes least recently used entries exceeding the size limit."""
+        entries = self.entries()
+        size = sum(entry[1] for entry in entries)
+        # Keep at least the most recent entry.
+        for mtime, entry_size, path in entries[:-1]:
+            if size <= self.max_size:
+                break
+            logging.debug("evicting menu cache entry %s", path)
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+
+    def clear(self):
+        """Removes all cache entries."""
+        for mtime, size, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+class MemoryMenuCache(object):
+    """In-memory cache of menu handles providing the interface of
+    `MenuCache`, for long running processes (see `daemon`). Menu handles
+    are stored pickled, every load returns an independent copy so concurrent
+    distributions of the same menu do not interfere.
+
+    >>> cache = MemoryMenuCache()
+    >>> eventSetup = load_menu('L1Menu_sample.xml', tray, cache)
+    """
+
+    def __init__(self):
+        self.menus = {}
+        self.names = {}
+        self.lock = threading.Lock()
+
+    def key(self, filename, config):
+        """Returns cache key for XML menu *filename* and resource
+        configuration *config*.
+        """
+        return menu_key(filename, config)
+
+    def path(self, key):
+        """Returns name of cache entry (for messages)."""
+        return 'memory:{0}'.format(key)
+
+    def load(self, key):
+        """Returns copy of cached menu handle for *key* or None if not cached."""
+        with self.lock:
+            data = self.menus.get(key)
+        if data is None:
+            return None
+        return pickle.loads(data)
+
+    def store(self, key, menu):
+        """Stores menu handle for *key*."""
+        data = pickle.dumps(menu, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.menus[key] = data
+            self.names[key] = menu.getName()
+
+    def remove(self, key):
+        """Removes cache entry for *key*, returns True if it existed."""
+        with self.lock:
+            self.names.pop(key, None)
+            return self.menus.pop(key, None) is not None
+
+    def entries(self):
+        """Returns list of (key, menu name, size) of cache entries."""
+        with self.lock:
+            return [(key, self.names[key], len(data)) for key, data in sorted(self.menus.items())]
+
+    def clear(self):
+        """Removes all cache entries, returns number of removed entries."""
+        with self.lock:
+            count = len(self.menus)
+            self.menus.clear()
+            self.names.clear()
+            return count
+
+def load_menu(filename, tray, cache=None):
+    """Returns menu handle for XML menu *filename* measured using *tray*,
+    restored from *cache* if available. Without a cache the event setup is
+    returned.
+    """
+    if cache is None:
+        return tmEventSetup.getTriggerMenu(filename)
+    key = cache.key(filename, tray.filename)
+    menu = cache.load(key)
+    if menu is not None:
+        logging.info("using cached menu: %s", cache.path(key))
+        return menu
+    eventSetup = tmEventSetup.getTriggerMenu(filename)
+    menu = ModuleCollection(eventSetup, tray).menuHandle()
+    logging.info("caching menu: %s", cache.path(key))
+    cache.store(key, menu)
+    return menu
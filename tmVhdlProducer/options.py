@@ -0,0 +1,110 @@
+"""Command line option constants and argument types.
+
+Provides the defaults and argument types used by the command line parsers
+without importing the event setup, Jinja2 or other heavy dependencies, so
+parsing options (eg. `--help` or `--version`) starts fast.
+
+"""
+
+import os
+
+MinModules = 1
+MaxModules = 32
+
+PlacementLightest = 'lightest'
+"""Place algorithms on module with the least total payload."""
+
+PlacementMarginal = 'marginal'
+"""Place algorithms on module with the least marginal payload increase."""
+
+DefaultBalance = 1.0
+"""Default weight of current module payload for marginal placement."""
+
+SortingAsc = 'asc'
+SortingDesc = 'desc'
+
+ProjectDir = os.path.abspath(os.path.join(os.path.dirname(__file__)))
+"""Projects root directory."""
+
+DefaultConfigDir = os.path.join(ProjectDir, 'config')
+"""Default directory for resource configuration files."""
+
+DefaultConfigFile = os.path.join(DefaultConfigDir, 'resource_default.json')
+"""Default resource configuration file."""
+
+kExternals = 'Externals'
+
+# -----------------------------------------------------------------------------
+#  Argument types
+# -----------------------------------------------------------------------------
+
+def expand_range(expr):
+    """Parse and resolves numeric ranges (inclusive).
+    >>> expand_range("3")
+    [3]
+    >>> expand_range("4-7")
+    [4, 5, 6, 7]
+    """
+    tokens = expr.split('-')
+    if len(tokens) == 2:
+        start, stop = int(tokens[0]), int(tokens[1])
+        if start > stop:
+            raise ValueError("invalid range {expr}".format(**locals()))
+        return list(range(start, stop + 1))
+    if len(tokens) == 1:
+        return [int(tokens[0])]
+    raise ValueError("invalid range {expr}".format(**locals()))
+
+def parse_range(expr):
+    """Parse and resolves numeric ranges.
+    >>> parse_range("2,4-7,5,9")
+    [2, 4, 5, 6, 7, 9]
+    """
+    result = set()
+    for token in expr.split(','):
+        result.update(expand_range(token))
+    return sorted(result)
+
+def constraint_t(value):
+    tokens = value.split(':')
+    try:
+        return tokens[0], parse_range(tokens[1])
+    except IndexError:
+        pass
+    raise ValueError(value)
+
+def ratios_t(value):
+    """Parse list of shadow ratios, either comma separated or as inclusive range
+    <start>:<stop>:<step>.
+    >>> ratios_t("0:0.2:0.05")
+    [0.0, 0.05, 0.1, 0.15, 0.2]
+    """
+    tokens = value.split(':')
+    if len(tokens) == 3:
+        start, stop, step = [float(token) for token in tokens]
+        if step <= 0:
+            raise ValueError(value)
+        count = int(round((stop - start) / step)) + 1
+        ratios = [round(start + step * i, 6) for i in range(count)]
+    else:
+        ratios = [float(token) for token in value.split(',')]
+    for ratio in ratios:
+        if not .0 <= ratio <= 1.:
+            raise ValueError(value)
+    return ratios
+
+def sortings_t(value):
+    """Parse comma separated list of sort orders."""
+    sortings = value.split(',')
+    for sorting in sortings:
+        if sorting not in (SortingAsc, SortingDesc):
+            raise ValueError(value)
+    return sortings
+
+def placements_t(value):
+    """Parse comma separated list of placement strategies."""
+    placements = value.split(',')
+    for placement in placements:
+        if placement not in (PlacementLightest, PlacementMarginal):
+            raise ValueError(value)
+    return placements
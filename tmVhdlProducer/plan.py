@@ -0,0 +1,571 @@
+"""Firmware plan, a portable representation of a distributed menu.
+
+A firmware plan holds the menu information, the conditions (with objects and
+cuts) and the algorithms including their module assignment. Enumerations of
+the event setup (condition, object and cut types, comparison operators) are
+resolved to their names and the hashes of menu name and firmware UUID are
+precomputed, so a plan is rendered without the event setup. It is serialised
+to versioned JSON, so a distribution can be rendered by other processes or on
+other machines. A plan is the input of the template helpers and the VHDL
+producer.
+
+>>> plan = FirmwarePlan.fromCollection(collection)
+>>> with open('plan.json', 'w') as fp:
+...     plan.dump(fp)
+>>> with open('plan.json') as fp:
+...     plan = FirmwarePlan.load(fp)
+>>> producer.write(plan, output_dir)
+
+"""
+
+import hashlib
+import json
+
+PlanFormat = 'tm-vhdlproducer-plan'
+PlanVersion = 2
+
+# -----------------------------------------------------------------------------
+#  Type names (names of the event setup enumerations)
+# -----------------------------------------------------------------------------
+
+MuonConditionTypes = (
+    'SingleMuon',
+    'DoubleMuon',
+    'TripleMuon',
+    'QuadMuon',
+)
+
+CaloConditionTypes = (
+    'SingleEgamma',
+    'DoubleEgamma',
+    'TripleEgamma',
+    'QuadEgamma',
+    'SingleTau',
+    'DoubleTau',
+    'TripleTau',
+    'QuadTau',
+    'SingleJet',
+    'DoubleJet',
+    'TripleJet',
+    'QuadJet',
+)
+
+EsumsConditionTypes = (
+    'TotalEt',
+    'TotalEtEM',
+    'TotalHt',
+    'MissingEt',
+    'MissingHt',
+    'MissingEtHF',
+#    'MissingHtHF',
+    'AsymmetryEt',
+    'AsymmetryHt',
+    'AsymmetryEtHF',
+    'AsymmetryHtHF',
+)
+
+SignalConditionTypes = (
+    'Centrality0',
+    'Centrality1',
+    'Centrality2',
+    'Centrality3',
+    'Centrality4',
+    'Centrality5',
+    'Centrality6',
+    'Centrality7',
+)
+
+ExternalConditionTypes = (
+    'Externals',
+)
+
+MinBiasConditionTypes = (
+    'MinBiasHFM0',
+    'MinBiasHFM1',
+    'MinBiasHFP0',
+    'MinBiasHFP1',
+)
+
+TowerCountConditionTypes = (
+    'TowerCount',
+)
+
+CorrelationConditionTypes = (
+    'MuonMuonCorrelation',
+    'MuonEsumCorrelation',
+    'CaloMuonCorrelation',
+    'CaloCaloCorrelation',
+    'CaloEsumCorrelation',
+    'InvariantMass',
+    'TransverseMass',
+)
+
+CorrelationConditionOvRmTypes = (
+    'CaloCaloCorrelationOvRm',
+    'InvariantMassOvRm',
+    'TransverseMassOvRm',
+)
+
+CaloConditionOvRmTypes = (
+    'SingleEgammaOvRm',
+    'DoubleEgammaOvRm',
+    'TripleEgammaOvRm',
+    'QuadEgammaOvRm',
+    'SingleTauOvRm',
+    'DoubleTauOvRm',
+    'TripleTauOvRm',
+    'QuadTauOvRm',
+    'SingleJetOvRm',
+    'DoubleJetOvRm',
+    'TripleJetOvRm',
+    'QuadJetOvRm',
+)
+
+MuonObjectTypes = (
+    'Muon',
+)
+
+CaloObjectTypes = (
+    'Egamma',
+    'Tau',
+    'Jet',
+)
+
+EsumsObjectTypes = (
+    'ETT',
+    'ETTEM',
+    'HTT',
+    'ETM',
+    'HTM',
+    'ETMHF',
+#    'HTMHF',
+    'ASYMET',
+    'ASYMHT',
+    'ASYMETHF',
+    'ASYMHTHF',
+)
+
+SignalObjectTypes = (
+    'CENT0',
+    'CENT1',
+    'CENT2',
+    'CENT3',
+    'CENT4',
+    'CENT5',
+    'CENT6',
+    'CENT7',
+)
+
+# -----------------------------------------------------------------------------
+#  Serialisation helpers
+# -----------------------------------------------------------------------------
+
+def restore(cls, **attributes):
+    """Returns instance of handle class *cls* with *attributes*, bypassing
+    the constructor (which requires event setup instances).
+    """
+    instance = cls.__new__(cls)
+    instance.__dict__.update(attributes)
+    return instance
+
+def encode_cut(cut):
+    return {
+        'name': cut.name,
+        'cut_type': cut.cut_type,
+        'minimum': [cut.minimum.index, cut.minimum.value],
+        'maximum': [cut.maximum.index, cut.maximum.value],
+        'data': cut.data,
+        'precision': cut.precision,
+        'precision_pt': cut.precision_pt,
+        'precision_math': cut.precision_math,
+    }
+
+def decode_cut(data):
+    data = dict(data)
+    data['minimum'] = PlanCutValue(*data['minimum'])
+    data['maximum'] = PlanCutValue(*data['maximum'])
+    return PlanCut(**data)
+
+def encode_object(object_):
+    return {
+        'name': object_.name,
+        'type': object_.type,
+        'comparison_operator': object_.comparison_operator,
+        'bx_offset': object_.bx_offset,
+        'external_signal_name': object_.external_signal_name,
+        'external_channel_id': object_.external_channel_id,
+        'cuts': [encode_cut(cut) for cut in object_.cuts],
+    }
+
+def decode_object(data):
+    data = dict(data)
+    data['cuts'] = [decode_cut(cut) for cut in data['cuts']]
+    return PlanObject(**data)
+
+def encode_condition(condition):
+    return {
+        'name': condition.name,
+        'type': condition.type,
+        'objects': [encode_object(object_) for object_ in condition.objects],
+        'cuts': [encode_cut(cut) for cut in condition.cuts],
+        'payload': [condition.payload.sliceLUTs, condition.payload.processors],
+    }
+
+def decode_condition(data):
+    data = dict(data)
+    data['objects'] = [decode_object(object_) for object_ in data['objects']]
+    data['cuts'] = [decode_cut(cut) for cut in data['cuts']]
+    data['payload'] = Payload(*data['payload'])
+    return PlanCondition(**data)
+
+def encode_algorithm(algorithm):
+    return {
+        'index': algorithm.index,
+        'name': algorithm.name,
+        'expression': algorithm.expression,
+        'expression_in_condition': algorithm.expression_in_condition,
+        'module_id': algorithm.module_id,
+        'module_index': algorithm.module_index,
+        'conditions': [condition.name for condition in algorithm.conditions],
+    }
+
+def algorithm_digest(algorithm):
+    """Returns SHA-256 digest of the logic of a plan algorithm, its
+    expression and conditions (excluding measured payloads). Used to detect
+    changed algorithms of the same name between menu versions. Algorithm
+    handles are resolved first (see `resolve_algorithm`).
+    """
+    conditions = {}
+    for condition in algorithm.conditions:
+        data = encode_condition(condition)
+        del data['payload']
+        conditions[condition.name] = data
+    data = {
+        'expression': algorithm.expression,
+        'expression_in_condition': algorithm.expression_in_condition,
+        'conditions': conditions,
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+def decode_algorithm(data, conditions):
+    data = dict(data)
+    data['conditions'] = [conditions[name] for name in data['conditions']]
+    return PlanAlgorithm(**data)
+
+# -----------------------------------------------------------------------------
+#  Resolving handles (requires the event setup)
+# -----------------------------------------------------------------------------
+
+def resolve_condition(condition):
+    """Returns plan condition of a condition handle, resolving the event setup
+    enumerations of condition, objects and cuts to their names.
+    """
+    from .algodist import ConditionTypeKey, ObjectTypeKey, CutTypeKey, ComparisonOperatorKey
+
+    def resolve_cut(cut):
+        return PlanCut(
+            name=cut.name,
+            cut_type=CutTypeKey[cut.cut_type],
+            minimum=PlanCutValue(cut.minimum.index, cut.minimum.value),
+            maximum=PlanCutValue(cut.maximum.index, cut.maximum.value),
+            data=cut.data,
+            precision=cut.precision,
+            precision_pt=cut.precision_pt,
+            precision_math=cut.precision_math,
+        )
+
+    def resolve_object(object_):
+        return PlanObject(
+            name=object_.name,
+            type=ObjectTypeKey[object_.type],
+            comparison_operator=ComparisonOperatorKey[object_.comparison_operator],
+            bx_offset=object_.bx_offset,
+            external_signal_name=object_.external_signal_name,
+            external_channel_id=object_.external_channel_id,
+            cuts=[resolve_cut(cut) for cut in object_.cuts],
+        )
+
+    return PlanCondition(
+        name=condition.name,
+        type=ConditionTypeKey[condition.type],
+        objects=[resolve_object(object_) for object_ in condition.objects],
+        cuts=[resolve_cut(cut) for cut in condition.cuts],
+        payload=Payload(condition.payload.sliceLUTs, condition.payload.processors),
+    )
+
+def resolve_algorithm(algorithm, conditions=None):
+    """Returns plan algorithm of an algorithm handle. Its conditions are
+    taken from mapping *conditions* of plan conditions by name, if None they
+    are resolved.
+    """
+    if conditions is None:
+        conditions = dict((condition.name, resolve_condition(condition)) for condition in algorithm.conditions)
+    return PlanAlgorithm(
+        index=algorithm.index,
+        name=algorithm.name,
+        expression=algorithm.expression,
+        expression_in_condition=algorithm.expression_in_condition,
+        module_id=algorithm.module_id,
+        module_index=algorithm.module_index,
+        conditions=[conditions[condition.name] for condition in algorithm.conditions],
+    )
+
+# -----------------------------------------------------------------------------
+#  Classes
+# -----------------------------------------------------------------------------
+
+class Payload(object):
+    """Implements a generic payload represented by multiple attributes.
+
+    >>> payload = Payload(sliceLUTs, processors)
+    >>> payload < (payload + payload)
+    >>> payload.sliceLUTs, payload.processors
+    """
+    def __init__(self, sliceLUTs=0, processors=0):
+        self.sliceLUTs = float(sliceLUTs)
+        self.processors = float(processors)
+
+    def _astuple(self):
+        """Retrurns tuple of payload attributes ordered by significance (most
+        significant last, least first).
+        """
+        return self.sliceLUTs, self.processors
+
+    def _asdict(self):
+        return dict(sliceLUTs=self.sliceLUTs, processors=self.processors)
+
+    def __add__(self, payload):
+        """Multiplicate payloads."""
+        sliceLUTs = self.sliceLUTs + payload.sliceLUTs
+        processors = self.processors + payload.processors
+        return Payload(sliceLUTs, processors)
+
+    def __sub__(self, payload):
+        """Subtract payloads."""
+        sliceLUTs = self.sliceLUTs - payload.sliceLUTs
+        processors = self.processors - payload.processors
+        return Payload(sliceLUTs, processors)
+
+    def __eq__(self, payload):
+        return self._astuple() == payload._astuple()
+
+    def __lt__(self, payload):
+        """Compare payloads by list of attributes ordered by significance."""
+        return self._astuple() < payload._astuple()
+
+    def __repr__(self):
+        sliceLUTsPercent = self.sliceLUTs * 100
+        processorsPercent = self.processors * 100
+        return "{self.__class__.__name__}(sliceLUTs={sliceLUTsPercent:.2f}%, DSPs={processorsPercent:.2f}%)".format(**locals())
+
+class PlanRecord(object):
+    """Base class of plan records, attributes are passed as keywords."""
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+    def __repr__(self):
+        return "{self.__class__.__name__}(name={self.name})".format(**locals())
+
+class PlanCutValue(object):
+    """Cut value of a plan cut."""
+
+    def __init__(self, index, value):
+        self.index = int(index)
+        self.value = float(value)
+
+class PlanCut(PlanRecord):
+    """Cut of a plan condition or object, *cut_type* is a name."""
+    pass
+
+class PlanObject(PlanRecord):
+    """Object of a plan condition, *type* and *comparison_operator* are
+    names.
+    """
+
+    def isMuonObject(self):
+        return self.type in MuonObjectTypes
+
+    def isCaloObject(self):
+        return self.type in CaloObjectTypes
+
+    def isEsumsObject(self):
+        return self.type in EsumsObjectTypes
+
+    def isSignalObject(self):
+        return self.type in SignalObjectTypes
+
+class PlanCondition(PlanRecord):
+    """Condition of a firmware plan, *type* is a name."""
+
+    def isMuonCondition(self):
+        return self.type in MuonConditionTypes
+
+    def isCaloCondition(self):
+        return self.type in CaloConditionTypes
+
+    def isEsumsCondition(self):
+        return self.type in EsumsConditionTypes
+
+    def isSignalCondition(self):
+        return self.type in SignalConditionTypes
+
+    def isExternalCondition(self):
+        return self.type in ExternalConditionTypes
+
+    def isMinBiasCondition(self):
+        return self.type in MinBiasConditionTypes
+
+    def isTowerCountCondition(self):
+        return self.type in TowerCountConditionTypes
+
+    def isCorrelationCondition(self):
+        return self.type in CorrelationConditionTypes
+
+    def isCorrelationConditionOvRm(self):
+        return self.type in CorrelationConditionOvRmTypes
+
+    def isCaloConditionOvRm(self):
+        return self.type in CaloConditionOvRmTypes
+
+class PlanAlgorithm(PlanRecord):
+    """Algorithm of a firmware plan, iterates over its plan conditions."""
+
+    @property
+    def payload(self):
+        """Returns sum of condition payloads."""
+        payload = Payload()
+        for condition in self.conditions:
+            payload += condition.payload
+        return payload
+
+    def __len__(self):
+        """Returns count of conditions."""
+        return len(self.conditions)
+
+    def __iter__(self):
+        """Iterate over conditions."""
+        return iter(self.conditions)
+
+    def __repr__(self):
+        return "{self.__class__.__name__}(index={self.index}, name={self.name})".format(**locals())
+
+class PlanModule(object):
+    """Module of a firmware plan, iterates over plan algorithms ordered by
+    local module index.
+    """
+
+    def __init__(self, id, algorithms):
+        self.id = id
+        self.algorithms = sorted(algorithms, key=lambda algorithm: algorithm.module_index)
+
+    def __len__(self):
+        return len(self.algorithms)
+
+    def __iter__(self):
+        return iter(self.algorithms)
+
+class FirmwarePlan(object):
+    """Portable firmware plan of a distributed menu, provides the modules,
+    algorithms and conditions used by `vhdlhelper.MenuHelper` and the menu
+    information getters of the event setup. Menu information *info* includes
+    the hashes of menu name and firmware UUID (`name_hash`,
+    `uuid_firmware_hash`).
+    """
+
+    def __init__(self, info, n_modules, condition_handles, algorithm_handles):
+        self.info = info
+        self.condition_handles = condition_handles
+        self.algorithm_handles = algorithm_handles
+        self.modules = []
+        for id in range(n_modules):
+            algorithms = [algorithm for algorithm in algorithm_handles if algorithm.module_id == id]
+            self.modules.append(PlanModule(id, algorithms))
+
+    @classmethod
+    def fromCollection(cls, collection):
+        """Returns firmware plan of a distributed module collection, resolving
+        its handles (requires the event setup).
+        """
+        import tmEventSetup
+        eventSetup = collection.eventSetup
+        info = {
+            'name': eventSetup.getName(),
+            'uuid_menu': eventSetup.getMenuUuid(),
+            'uuid_firmware': eventSetup.getFirmwareUuid(),
+            'scale_set': eventSetup.getScaleSetName(),
+            'version': eventSetup.getVersion(),
+        }
+        info['name_hash'] = tmEventSetup.getMmHashN(str(info['name']))
+        info['uuid_firmware_hash'] = tmEventSetup.getMmHashN(str(info['uuid_firmware']))
+        conditions = {}
+        for name, condition in collection.condition_handles.items():
+            conditions[name] = resolve_condition(condition)
+        algorithms = sorted(collection.algorithm_handles, key=lambda algorithm: algorithm.index)
+        algorithms = [resolve_algorithm(algorithm, conditions) for algorithm in algorithms]
+        return cls(info, len(collection), conditions, algorithms)
+
+    @classmethod
+    def load(cls, fp):
+        """Loads firmware plan from JSON."""
+        data = json.load(fp)
+        if data.get('format') != PlanFormat:
+            raise ValueError("not a firmware plan")
+        if data.get('version') != PlanVersion:
+            raise ValueError("unsupported firmware plan version: {0}".format(data.get('version')))
+        conditions = {}
+        for item in data['conditions']:
+            condition = decode_condition(item)
+            conditions[condition.name] = condition
+        algorithms = [decode_algorithm(item, conditions) for item in data['algorithms']]
+        return cls(data['info'], data['n_modules'], conditions, algorithms)
+
+    def dump(self, fp, indent=None):
+        """Dumps firmware plan to JSON."""
+        data = {
+            'format': PlanFormat,
+            'version': PlanVersion,
+            'info': self.info,
+            'n_modules': len(self.modules),
+            'conditions': [encode_condition(self.condition_handles[name]) for name in sorted(self.condition_handles)],
+            'algorithms': [encode_algorithm(algorithm) for algorithm in self.algorithm_handles],
+        }
+        json.dump(data, fp, indent=indent)
+
+    @property
+    def eventSetup(self):
+        """Provides menu information getters in place of the event setup."""
+        return self
+
+    def getName(self):
+        return self.info['name']
+
+    def getMenuUuid(self):
+        return self.info['uuid_menu']
+
+    def getFirmwareUuid(self):
+        return self.info['uuid_firmware']
+
+    def getScaleSetName(self):
+        return self.info['scale_set']
+
+    def getVersion(self):
+        return self.info['version']
+
+    @property
+    def algorithms(self):
+        """Returns list of all algorithms."""
+        return list(self.algorithm_handles)
+
+    @property
+    def conditions(self):
+        """Returns unsorted list of all conditions."""
+        return list(self.condition_handles.values())
+
+    def __len__(self):
+        """Returns count of modules."""
+        return len(self.modules)
+
+    def __iter__(self):
+        """Iterate over modules."""
+        return iter(self.modules)
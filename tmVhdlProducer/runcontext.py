@@ -0,0 +1,90 @@
+"""Run context of concurrent producer runs.
+
+Runs of one process may be concurrent (see `daemon`) and use helper threads
+(see `documentation`). Every run is identified by a context variable, which
+is propagated into the threads of a `ContextExecutor`, so log records are
+associated with their run instead of the thread that emitted them.
+
+>>> with runcontext.scope():
+...     handler.addFilter(runcontext.RunFilter())
+...     with runcontext.ContextExecutor() as executor:
+...         executor.submit(logging.info, "logged by the run")
+
+Use `quiet` instead of changing the level of the root logger to suppress
+verbose logging of a run, without affecting concurrent runs.
+
+>>> with runcontext.quiet():
+...     logging.info("not logged")
+
+"""
+
+import contextlib
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+_run = contextvars.ContextVar('tm_vhdlproducer_run', default=None)
+"""Identifier of the current run or None outside of runs."""
+
+_level = contextvars.ContextVar('tm_vhdlproducer_level', default=None)
+"""Minimum log level of the current context or None (see `quiet`)."""
+
+def current():
+    """Returns identifier of the current run, or None outside of runs."""
+    return _run.get()
+
+@contextlib.contextmanager
+def scope():
+    """Enters a new run context unless already in one (a run started by a
+    daemon request belongs to the request), yields the run identifier.
+    """
+    run = _run.get()
+    if run is not None:
+        yield run
+        return
+    token = _run.set(object())
+    try:
+        yield _run.get()
+    finally:
+        _run.reset(token)
+
+class RunFilter(logging.Filter):
+    """Passes log records emitted in the context of the current run only."""
+
+    def __init__(self):
+        super(RunFilter, self).__init__()
+        self.run = current()
+        if self.run is None:
+            raise RuntimeError("RunFilter created outside of a run context")
+
+    def filter(self, record):
+        return _run.get() is self.run
+
+class LevelFilter(logging.Filter):
+    """Drops log records below the minimum level of the current context."""
+
+    def filter(self, record):
+        level = _level.get()
+        return level is None or record.levelno >= level
+
+@contextlib.contextmanager
+def quiet(level=logging.WARNING):
+    """Suppresses records below *level* logged to the root logger in the
+    current context, records of other contexts are not affected.
+    """
+    token = _level.set(level)
+    log_filter = LevelFilter()
+    logger = logging.getLogger()
+    logger.addFilter(log_filter)
+    try:
+        yield
+    finally:
+        logger.removeFilter(log_filter)
+        _level.reset(token)
+
+class ContextExecutor(ThreadPoolExecutor):
+    """Thread pool executing submitted calls in the context of the caller."""
+
+    def submit(self, fn, *args, **kwargs):
+        context = contextvars.copy_context()
+        return super(ContextExecutor, self).submit(context.run, fn, *args, **kwargs)
@@ -0,0 +1,94 @@
+"""Hot path counters.
+
+Counts calls of the distribution and rendering hot paths, to compare the
+amount of work between releases and menus without a profiler. Counters are
+always enabled, an increment costs a context variable lookup and a
+dictionary update.
+
+>>> stats.reset()
+>>> collection.distribute(6)
+>>> stats.counters()['measure.calls']
+1337
+>>> with open('stats.json', 'w') as fp:
+...     stats.dump(fp, menu_name='L1Menu_sample')
+
+Counters incremented in forked worker processes are returned to the parent
+using `mark` and `collect` and merged using `merge`. Counters are bound to
+the current context by `reset`, so concurrent runs of one process (see
+`daemon`) count separately. Use a `runcontext.ContextExecutor` to count in
+helper threads.
+
+"""
+
+import collections
+import contextvars
+import json
+
+StatsFormat = 'tm-vhdlproducer-stats'
+StatsVersion = 1
+
+Counters = (
+    ('measure.calls', "ResourceTray.measure calls"),
+    ('measure.hits', "ResourceTray.measure cache hits"),
+    ('append.attempts', "Module.append attempts"),
+    ('append.rejected', "Module.append ResourceOverflowError rejections"),
+    ('shadowed.comparisons', "shadowed algorithm comparisons"),
+    ('constraint.redirects', "constraint redirections in distribute"),
+    ('constraint.ignored', "shadowed algorithms ignored by constraints"),
+    ('helper.conditions', "conditionFactory helper constructions"),
+    ('template.renders', "template renders"),
+)
+"""Counter names and descriptions, in report order."""
+
+_counters = contextvars.ContextVar('tm_vhdlproducer_counters', default=collections.Counter())
+"""Counters of the current context, process global unless reset."""
+
+def increment(name, count=1):
+    """Increments counter *name* by *count*."""
+    _counters.get()[name] += count
+
+def counters():
+    """Returns mapping of all counters, including counters not incremented."""
+    data = dict((name, 0) for name, _ in Counters)
+    data.update(_counters.get())
+    return data
+
+def reset():
+    """Resets all counters of the current context, counters of other contexts
+    are not affected.
+    """
+    _counters.set(collections.Counter())
+
+def mark():
+    """Returns copy of current counters (see `collect`)."""
+    return collections.Counter(_counters.get())
+
+def collect(marker):
+    """Returns counters incremented since *marker*, used to return counters
+    of forked worker processes to the parent.
+    """
+    return dict(_counters.get() - marker)
+
+def merge(counts):
+    """Adds counters returned by another process."""
+    _counters.get().update(counts)
+
+def report():
+    """Returns list of report lines."""
+    data = counters()
+    lines = []
+    for name, description in Counters:
+        lines.append("{0:<48} {1:>10}".format(description, data.pop(name)))
+    for name in sorted(data):
+        lines.append("{0:<48} {1:>10}".format(name, data[name]))
+    return lines
+
+def dump(fp, **info):
+    """Writes counters in JSON format, *info* is added to the header."""
+    data = {
+        'format': StatsFormat,
+        'version': StatsVersion,
+    }
+    data.update(info)
+    data['counters'] = counters()
+    json.dump(data, fp, indent=2)
@@ -0,0 +1,229 @@
+"""Parameter sweep over algorithm distribution settings.
+
+Evaluates distributions for all combinations of shadow ratios, sort orders,
+placement strategies, condition constraints and module counts in a process
+pool, sharing one parsed and measured menu (inherited by forked workers).
+
+>>> collection = ModuleCollection(es, tray)
+>>> params = sweep_params(modules=[4, 6], ratios=[0.0, 0.1], sortings=['asc', 'desc'])
+>>> results = sweep(collection, params, jobs=8)
+>>> apply_result(collection, results[0]) # apply best distribution
+>>> collection.dump(fp)
+
+"""
+
+import itertools
+import logging
+import multiprocessing
+import uuid
+from collections import namedtuple
+
+from .algodist import ResourceOverflowError
+from .algodist import ModuleCollection, resource_tray
+from .algodist import list_resources, list_algorithms, list_distribution, list_summary
+from .options import PlacementLightest, PlacementMarginal
+from .options import SortingAsc, SortingDesc
+from .options import ratios_t, sortings_t, placements_t
+from . import runcontext
+from . import tracing
+from . import stats
+
+SweepParams = namedtuple('SweepParams', 'modules ratio sorting placement constraints')
+"""Distribution parameters of a sweep candidate, *constraints* is a tuple of
+(condition type, module ids) pairs.
+"""
+
+SweepResult = namedtuple('SweepResult', 'params peak duplication algorithms')
+"""Result of a sweep candidate, *algorithms* is a list of algorithm assignments
+(see `ModuleCollection.assignments`) or None if the distribution failed.
+"""
+
+_collection = None
+"""Module collection of a worker process (inherited on fork, see
+`_init_worker`).
+"""
+
+_algorithms = None
+"""Initial algorithm order of the collection of a worker process."""
+
+# -----------------------------------------------------------------------------
+#  Functions
+# -----------------------------------------------------------------------------
+
+def sweep_params(modules, ratios=None, sortings=None, placements=None, constraints=None, alternatives=None):
+    """Returns list of parameter combinations for a sweep. Argument
+    *constraints* is a dictionary of constraints applied to all candidates,
+    *alternatives* is a list of additional constraint dictionaries, each
+    resulting in further candidates.
+    """
+    ratios = ratios or [.0]
+    sortings = sortings or [SortingAsc]
+    placements = placements or [PlacementLightest]
+    constraints = constraints or {}
+    variants = [dict(constraints)]
+    for alternative in alternatives or []:
+        variant = dict(constraints)
+        variant.update(alternative)
+        variants.append(variant)
+    variants = [tuple(sorted((k, tuple(v)) for k, v in variant.items())) for variant in variants]
+    return [SweepParams(*params) for params in itertools.product(modules, ratios, sortings, placements, variants)]
+
+def peak_payload(collection):
+    """Returns highest module payload (sliceLUTs)."""
+    return max(module.payload.sliceLUTs for module in collection)
+
+def duplicated_payload(collection):
+    """Returns payload (sliceLUTs) of conditions implemented on more then one module."""
+    conditions = {}
+    total = .0
+    for module in collection:
+        total += (module.payload - module.floor).sliceLUTs
+        for condition in module.conditions:
+            conditions[condition.name] = condition.payload.sliceLUTs
+    return total - sum(conditions.values())
+
+def missing_constraints(collection, params):
+    """Returns list of condition types used by *collection* constrained to
+    none of the modules of candidate *params* (eg. ext:4 on 2 modules).
+    """
+    types = set(condition.type for condition in collection.conditions)
+    missing = []
+    for condition_type, modules in params.constraints:
+        if condition_type in types and not any(0 <= module < params.modules for module in modules):
+            missing.append(condition_type)
+    return missing
+
+def evaluate(collection, algorithms, params):
+    """Distributes *collection* using *params*, returns sweep result. The
+    initial algorithm order *algorithms* is restored for every candidate as
+    distribution sorts algorithms in place (stable sort). Candidates
+    exceeding the module resources or constraining conditions to missing
+    modules are invalid (no algorithms assigned).
+    """
+    missing = missing_constraints(collection, params)
+    if missing:
+        logging.info("invalid sweep candidate, no modules for constraints: %s", ", ".join(missing))
+        return SweepResult(params, None, None, None)
+    collection.algorithm_handles = list(algorithms)
+    collection.ratio = params.ratio
+    collection.reverse_sorting = (params.sorting == SortingDesc)
+    collection.placement = params.placement
+    collection.constraints = dict((k, list(v)) for k, v in params.constraints)
+    try:
+        collection.distribute(params.modules)
+    except ResourceOverflowError:
+        return SweepResult(params, None, None, None)
+    return SweepResult(params, peak_payload(collection), duplicated_payload(collection), collection.assignments())
+
+def _evaluate_worker(params):
+    """Evaluates *params* in a worker process, returns sweep result and
+    counters incremented by the worker.
+    """
+    counters = stats.mark()
+    result = evaluate(_collection, _algorithms, params)
+    return result, stats.collect(counters)
+
+def rank(result):
+    """Sort key for sweep results, failed distributions last."""
+    if result.algorithms is None:
+        return 1, .0, .0
+    return 0, result.peak, result.duplication
+
+def _init_worker(collection, algorithms):
+    """Binds the collection to a worker process and suppresses verbose
+    distribution logging in the worker process.
+    """
+    global _collection, _algorithms
+    _collection = collection
+    _algorithms = algorithms
+    logging.getLogger().setLevel(logging.WARNING)
+
+@tracing.traced('sweep')
+def sweep(collection, params, jobs=None):
+    """Evaluates distributions for list of *params* using *jobs* worker
+    processes (default is number of CPUs). Returns list of sweep results
+    ranked by peak module payload and duplicated condition payload.
+    """
+    algorithms = list(collection.algorithm_handles)
+    regenerate_uuid = collection.regenerate_uuid
+    collection.regenerate_uuid = False
+    logging.info("sweeping %d distribution candidates...", len(params))
+    try:
+        if jobs == 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            # Sweeps may be concurrent (see daemon), suppress verbose
+            # distribution logging of this sweep only.
+            with runcontext.quiet():
+                results = [evaluate(collection, algorithms, item) for item in params]
+        else:
+            context = multiprocessing.get_context('fork')
+            with context.Pool(jobs, initializer=_init_worker, initargs=(collection, algorithms)) as pool:
+                results = []
+                for result, counters in pool.imap(_evaluate_worker, params, chunksize=1):
+                    results.append(result)
+                    stats.merge(counters)
+    finally:
+        collection.algorithm_handles = algorithms
+        collection.regenerate_uuid = regenerate_uuid
+    return sorted(results, key=rank)
+
+def apply_result(collection, result):
+    """Applies distribution of a sweep result to *collection*."""
+    if result.algorithms is None:
+        raise ResourceOverflowError()
+    params = result.params
+    collection.ratio = params.ratio
+    collection.reverse_sorting = (params.sorting == SortingDesc)
+    collection.placement = params.placement
+    collection.constraints = dict((k, list(v)) for k, v in params.constraints)
+    if collection.regenerate_uuid:
+        collection.eventSetup.setFirmwareUuid(str(uuid.uuid4()))
+    collection.assign(params.modules, result.algorithms)
+
+def list_sweep(results, count=10):
+    """Lists best *count* sweep results."""
+    logging.info("|-----------------------------------------------------------------------------|")
+    logging.info("|                                                                             |")
+    logging.info("| {message:<75} |".format(message="Sweep results, best {0} of {1} candidates".format(min(count, len(results)), len(results))))
+    logging.info("|                                                                             |")
+    logging.info("|------|---------|-------|---------|-----------|-----------|-------------------|")
+    logging.info("| Rank | Modules | Ratio | Sorting | Placement | Peak      | Duplicated        |")
+    logging.info("|------|---------|-------|---------|-----------|-----------|-------------------|")
+    for i, result in enumerate(results[:count]):
+        params = result.params
+        if result.algorithms is None:
+            peak = duplication = "invalid"
+        else:
+            peak = "{0:>8.2f}%".format(result.peak * 100.)
+            duplication = "{0:>8.2f}%".format(result.duplication * 100.)
+        logging.info("| {i:>4} | {params.modules:>7} | {params.ratio:>5.2f} | {params.sorting:<7} | " \
+                     "{params.placement:<9} | {peak:>9} | {duplication:<17} |".format(**locals()))
+        for condition, modules in params.constraints:
+            logging.info("|      |  constraint {condition}: {modules}".format(condition=condition, modules=','.join(str(module) for module in modules)))
+    logging.info("|------|---------|-------|---------|-----------|-----------|-------------------|")
+
+def sweep_distribute(eventSetup, config, params, jobs=None, balance=None,
+                     refine_iterations=None, refine_timeout=None, cache=None):
+    """Sweep distribution wrapper function, provided for convenience. Returns
+    module collection with best distribution applied. Optional *cache* is a
+    measurement cache shared between runs.
+    """
+    tray = resource_tray(config, cache)
+    list_resources(tray)
+
+    collection = ModuleCollection(eventSetup, tray)
+    list_algorithms(collection)
+
+    if balance is not None:
+        collection.balance = balance
+    results = sweep(collection, params, jobs)
+    list_sweep(results)
+    apply_result(collection, results[0])
+    if refine_iterations is not None or refine_timeout is not None:
+        collection.refine(refine_iterations, refine_timeout)
+
+    list_distribution(collection)
+    list_summary(collection)
+
+    collection.validate()
+
+    return collection
@@ -0,0 +1,172 @@
+"""Per stage tracing with Chrome trace event export.
+
+Records nested spans (complete events) of the producer stages and writes
+them in Chrome trace event JSON, to be viewed using `about:tracing` or
+Perfetto. Tracing is disabled by default, a disabled span costs a context
+variable lookup. The active tracer is bound to the current context, so
+concurrent runs of one process (see `daemon`) record separate traces. Use a
+`runcontext.ContextExecutor` to record spans of helper threads.
+
+>>> tracing.enable()
+>>> with tracing.span('distribute', modules=6):
+...     collection.distribute(6)
+>>> with open('trace.json', 'w') as fp:
+...     tracing.disable().dump(fp)
+
+Events recorded in forked worker processes are returned to the parent using
+`mark` and `collect` and merged using `Tracer.extend`.
+
+"""
+
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+
+DefaultCategory = 'stage'
+
+_tracer = contextvars.ContextVar('tm_vhdlproducer_tracer', default=None)
+"""Active tracer of the current context or None if tracing is disabled."""
+
+def timestamp():
+    """Returns monotonic timestamp in microseconds (shared by processes)."""
+    return time.perf_counter() * 1e6
+
+class Tracer(object):
+    """Collects Chrome trace events."""
+
+    def __init__(self):
+        self.events = []
+        self.threads = set()
+        self.lock = threading.Lock()
+
+    def complete(self, name, category, start, end, args=None):
+        """Adds a complete event, *start* and *end* are timestamps in
+        microseconds.
+        """
+        pid = os.getpid()
+        thread = threading.current_thread()
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': start,
+            'dur': end - start,
+            'pid': pid,
+            'tid': thread.ident,
+        }
+        if args:
+            event['args'] = args
+        with self.lock:
+            if (pid, thread.ident) not in self.threads:
+                self.threads.add((pid, thread.ident))
+                self.events.append({
+                    'name': 'thread_name',
+                    'ph': 'M',
+                    'pid': pid,
+                    'tid': thread.ident,
+                    'args': {'name': thread.name},
+                })
+            self.events.append(event)
+
+    def extend(self, events):
+        """Adds events recorded by another process."""
+        with self.lock:
+            self.events.extend(events)
+
+    def dump(self, fp):
+        """Writes events in Chrome trace event JSON format."""
+        with self.lock:
+            events = sorted(self.events, key=lambda event: event.get('ts', 0))
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fp)
+
+class Span(object):
+    """Context manager recording a complete event."""
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = timestamp()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.complete(self.name, self.category, self.start, timestamp(), self.args)
+        return False
+
+class NullSpan(object):
+    """Context manager doing nothing, used if tracing is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_null_span = NullSpan()
+
+def enable():
+    """Enables tracing in the current context, returns the active tracer."""
+    tracer = _tracer.get()
+    if tracer is None:
+        tracer = Tracer()
+        _tracer.set(tracer)
+    return tracer
+
+def disable():
+    """Disables tracing in the current context, returns the previously active
+    tracer (or None).
+    """
+    tracer = _tracer.get()
+    _tracer.set(None)
+    return tracer
+
+def enabled():
+    """Returns True if tracing is enabled in the current context."""
+    return _tracer.get() is not None
+
+def active():
+    """Returns the active tracer or None if tracing is disabled."""
+    return _tracer.get()
+
+def span(name, category=DefaultCategory, **args):
+    """Returns context manager recording a span if tracing is enabled."""
+    tracer = _tracer.get()
+    if tracer is None:
+        return _null_span
+    return Span(tracer, name, category, args)
+
+def traced(name, category=DefaultCategory):
+    """Decorator recording a span for every call if tracing is enabled."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer.get()
+            if tracer is None:
+                return func(*args, **kwargs)
+            with Span(tracer, name, category, None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def mark():
+    """Returns current number of recorded events (see `collect`)."""
+    tracer = _tracer.get()
+    return len(tracer.events) if tracer is not None else 0
+
+def collect(marker):
+    """Removes and returns events recorded since *marker*, used to return
+    events recorded by forked worker processes to the parent.
+    """
+    tracer = _tracer.get()
+    if tracer is None:
+        return []
+    with tracer.lock:
+        events = tracer.events[marker:]
+        del tracer.events[marker:]
+    return events
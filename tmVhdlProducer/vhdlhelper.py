@@ -47,11 +47,8 @@ import uuid
 import re, math
 import sys, os
 
-import tmEventSetup
-import tmGrammar  # import after tmEventSetup
-
-from . import algodist
-from . import handles
+from .plan import FirmwarePlan
+from . import stats
 from . import __version__
 
 # -----------------------------------------------------------------------------
@@ -67,118 +64,118 @@ RegexVhdlLabel=re.compile('[^A-Za-z0-9_]')
 # -----------------------------------------------------------------------------
 
 ObjectTypes = {
-    tmEventSetup.Muon: tmGrammar.MU,
-    tmEventSetup.Egamma: tmGrammar.EG,
-    tmEventSetup.Tau: tmGrammar.TAU,
-    tmEventSetup.Jet: tmGrammar.JET,
-    tmEventSetup.ETT: tmGrammar.ETT,
-    tmEventSetup.ETTEM: tmGrammar.ETTEM,
-    tmEventSetup.HTT: tmGrammar.HTT,
-    tmEventSetup.ETM: tmGrammar.ETM,
-    tmEventSetup.ETMHF: tmGrammar.ETMHF,
-#    tmEventSetup.HTMHF: tmGrammar.HTMHF,
-    tmEventSetup.HTM: tmGrammar.HTM,
-    tmEventSetup.ASYMET: tmGrammar.ASYMET,
-    tmEventSetup.ASYMHT: tmGrammar.ASYMHT,
-    tmEventSetup.ASYMETHF: tmGrammar.ASYMETHF,
-    tmEventSetup.ASYMHTHF: tmGrammar.ASYMHTHF,
-    tmEventSetup.CENT0: tmGrammar.CENT0,
-    tmEventSetup.CENT1: tmGrammar.CENT1,
-    tmEventSetup.CENT2: tmGrammar.CENT2,
-    tmEventSetup.CENT3: tmGrammar.CENT3,
-    tmEventSetup.CENT4: tmGrammar.CENT4,
-    tmEventSetup.CENT5: tmGrammar.CENT5,
-    tmEventSetup.CENT6: tmGrammar.CENT6,
-    tmEventSetup.CENT7: tmGrammar.CENT7,
-    tmEventSetup.EXT: tmGrammar.EXT,
-    tmEventSetup.MBT0HFP: tmGrammar.MBT0HFP,
-    tmEventSetup.MBT1HFP: tmGrammar.MBT1HFP,
-    tmEventSetup.MBT0HFM: tmGrammar.MBT0HFM,
-    tmEventSetup.MBT1HFM: tmGrammar.MBT1HFM,
-    tmEventSetup.TOWERCOUNT: tmGrammar.TOWERCOUNT,
+    'Muon': 'MU',
+    'Egamma': 'EG',
+    'Tau': 'TAU',
+    'Jet': 'JET',
+    'ETT': 'ETT',
+    'ETTEM': 'ETTEM',
+    'HTT': 'HTT',
+    'ETM': 'ETM',
+    'ETMHF': 'ETMHF',
+#    'HTMHF': 'HTMHF',
+    'HTM': 'HTM',
+    'ASYMET': 'ASYMET',
+    'ASYMHT': 'ASYMHT',
+    'ASYMETHF': 'ASYMETHF',
+    'ASYMHTHF': 'ASYMHTHF',
+    'CENT0': 'CENT0',
+    'CENT1': 'CENT1',
+    'CENT2': 'CENT2',
+    'CENT3': 'CENT3',
+    'CENT4': 'CENT4',
+    'CENT5': 'CENT5',
+    'CENT6': 'CENT6',
+    'CENT7': 'CENT7',
+    'EXT': 'EXT',
+    'MBT0HFP': 'MBT0HFP',
+    'MBT1HFP': 'MBT1HFP',
+    'MBT0HFM': 'MBT0HFM',
+    'MBT1HFM': 'MBT1HFM',
+    'TOWERCOUNT': 'TOWERCOUNT',
 }
 
 # Has the number of Objects of each Type
 ObjectCount = {
-    tmEventSetup.Muon:       8,
-    tmEventSetup.Egamma:    12,
-    tmEventSetup.Tau:       12,
-    tmEventSetup.Jet:       12,
-    tmEventSetup.ETT:        1,
-    tmEventSetup.ETTEM:      1,
-    tmEventSetup.HTT:        1,
-    tmEventSetup.ETM:        1,
-    tmEventSetup.ETMHF:      1,
-#    tmEventSetup.HTMHF:      1,
-    tmEventSetup.HTM:        1,
-    tmEventSetup.ASYMET:     1,
-    tmEventSetup.ASYMHT:     1,
-    tmEventSetup.ASYMETHF:   1,
-    tmEventSetup.ASYMHTHF:   1,
-    tmEventSetup.CENT0:      1,
-    tmEventSetup.CENT1:      1,
-    tmEventSetup.CENT2:      1,
-    tmEventSetup.CENT3:      1,
-    tmEventSetup.CENT4:      1,
-    tmEventSetup.CENT5:      1,
-    tmEventSetup.CENT6:      1,
-    tmEventSetup.CENT7:      1,
-    tmEventSetup.EXT:        1,
-    tmEventSetup.MBT0HFP:    1,
-    tmEventSetup.MBT1HFP:    1,
-    tmEventSetup.MBT0HFM:    1,
-    tmEventSetup.MBT1HFM:    1,
-    tmEventSetup.TOWERCOUNT: 1,
+    'Muon':        8,
+    'Egamma':     12,
+    'Tau':        12,
+    'Jet':        12,
+    'ETT':         1,
+    'ETTEM':       1,
+    'HTT':         1,
+    'ETM':         1,
+    'ETMHF':       1,
+#    'HTMHF':       1,
+    'HTM':         1,
+    'ASYMET':      1,
+    'ASYMHT':      1,
+    'ASYMETHF':    1,
+    'ASYMHTHF':    1,
+    'CENT0':       1,
+    'CENT1':       1,
+    'CENT2':       1,
+    'CENT3':       1,
+    'CENT4':       1,
+    'CENT5':       1,
+    'CENT6':       1,
+    'CENT7':       1,
+    'EXT':         1,
+    'MBT0HFP':     1,
+    'MBT1HFP':     1,
+    'MBT0HFM':     1,
+    'MBT1HFM':     1,
+    'TOWERCOUNT':  1,
 }
 
 CaloTypes = [
-    tmGrammar.EG,
-    tmGrammar.TAU,
-    tmGrammar.JET,
+    'EG',
+    'TAU',
+    'JET',
 ]
 
 MuonTypes = [
-    tmGrammar.MU,
+    'MU',
 ]
 
 EsumsTypes = [
-    tmGrammar.ETT,
-    tmGrammar.ETTEM,
-    tmGrammar.ETM,
-    tmGrammar.ETMHF,
-#    tmGrammar.HTMHF,
-    tmGrammar.HTT,
-    tmGrammar.HTM,
-    tmGrammar.ASYMET,
-    tmGrammar.ASYMHT,
-    tmGrammar.ASYMETHF,
-    tmGrammar.ASYMHTHF,
-    tmGrammar.CENT0,
-    tmGrammar.CENT1,
-    tmGrammar.CENT2,
-    tmGrammar.CENT3,
-    tmGrammar.CENT4,
-    tmGrammar.CENT5,
-    tmGrammar.CENT6,
-    tmGrammar.CENT7,
+    'ETT',
+    'ETTEM',
+    'ETM',
+    'ETMHF',
+#    'HTMHF',
+    'HTT',
+    'HTM',
+    'ASYMET',
+    'ASYMHT',
+    'ASYMETHF',
+    'ASYMHTHF',
+    'CENT0',
+    'CENT1',
+    'CENT2',
+    'CENT3',
+    'CENT4',
+    'CENT5',
+    'CENT6',
+    'CENT7',
 ]
 
 TowerCountTypes = [
-    tmGrammar.TOWERCOUNT,
+    'TOWERCOUNT',
 ]
 
 MinBiasTypes = [
-    tmGrammar.MBT0HFP,
-    tmGrammar.MBT1HFP,
-    tmGrammar.MBT0HFM,
-    tmGrammar.MBT1HFM,
+    'MBT0HFP',
+    'MBT1HFP',
+    'MBT0HFM',
+    'MBT1HFM',
 ]
 
 ComparisonOperator = {
-    tmEventSetup.GE: True,
-    tmEventSetup.EQ: False,
+    'GE': True,
+    'EQ': False,
 }
-"""See utm/tmEventSetup/esTypes.hh"""
+"""Comparison operator names, see utm/tmEventSetup/esTypes.hh"""
 
 # -----------------------------------------------------------------------------
 #  Filters
@@ -270,6 +267,7 @@ def bx_encode(value):
 
 def conditionFactory(condition_handle):
     """Returns condition template helper class according to condition handle."""
+    stats.increment('helper.conditions')
     if condition_handle.isCaloCondition():
         return CaloConditionHelper(condition_handle)
     elif condition_handle.isMuonCondition():
@@ -317,7 +315,8 @@ class VersionHelper(VhdlHelper):
         return "{self.major}.{self.minor}.{self.patch}".format(**locals())
 
 class MenuHelper(VhdlHelper):
-    """Menu template helper.
+    """Menu template helper, created from a firmware plan (see module `plan`,
+    convert module collections using `FirmwarePlan.fromCollection`).
 
     Attributes:
         info [struct]
@@ -326,13 +325,15 @@ class MenuHelper(VhdlHelper):
         modules  [list]
     """
 
-    def __init__(self, collection):
+    def __init__(self, plan):
+        if not isinstance(plan, FirmwarePlan):
+            raise TypeError("expected firmware plan, got {0}".format(type(plan).__name__))
         # Init attribiutes
-        self.info = InfoHelper(collection)
-        self.algorithms = collection.algorithms
-        self.conditions = collection.conditions
+        self.info = InfoHelper(plan)
+        self.algorithms = plan.algorithms
+        self.conditions = plan.conditions
         self.modules = []
-        for module in collection:
+        for module in plan:
             self.modules.append(ModuleHelper(module))
 
     def __len__(self):
@@ -348,21 +349,24 @@ class InfoHelper(VhdlHelper):
 
     Attributes:
         name  [str]
+        name_hash  murmur hash of name [int]
         uuid_menu  [str]
         uuid_firmware  [str]
+        uuid_firmware_hash  murmur hash of firmware UUID [int]
         scale_set  [str]
         version  [str]
         sw_version  [str]
     """
 
-    def __init__(self, collection):
-        eventSetup = collection.eventSetup
+    def __init__(self, plan):
         # Init attribiutes
-        self.name = eventSetup.getName()
-        self.uuid_menu = eventSetup.getMenuUuid()
-        self.uuid_firmware = eventSetup.getFirmwareUuid()
-        self.scale_set = eventSetup.getScaleSetName()
-        self.version = VersionHelper(eventSetup.getVersion())
+        self.name = plan.getName()
+        self.name_hash = plan.info['name_hash']
+        self.uuid_menu = plan.getMenuUuid()
+        self.uuid_firmware = plan.getFirmwareUuid()
+        self.uuid_firmware_hash = plan.info['uuid_firmware_hash']
+        self.scale_set = plan.getScaleSetName()
+        self.version = VersionHelper(plan.getVersion())
         self.sw_version = VersionHelper(__version__)
 
 class ModuleHelper(VhdlHelper):
@@ -526,16 +530,16 @@ class ModuleHelper(VhdlHelper):
         """Returns list of objects required for calo-muon and muon-esums correlations."""
         def isConversionCondition(condition):
             """Returns True if condition type requires eta/phi conversion."""
-            if condition.handle.type in (tmEventSetup.CaloMuonCorrelation, tmEventSetup.MuonEsumCorrelation):
+            if condition.handle.type in ('CaloMuonCorrelation', 'MuonEsumCorrelation'):
                 return True
             # Muon-Esum combinations for transverse mass
-            if condition.handle.type == tmEventSetup.TransverseMass:
+            if condition.handle.type == 'TransverseMass':
                 for obj in condition.objects:
                     if obj.is_esums_type:
                         return True
                 return False
             # Calo-Muon combinations for invariant mass
-            if condition.handle.type == tmEventSetup.InvariantMass:
+            if condition.handle.type == 'InvariantMass':
                 objects = condition.objects
                 if objects[0].is_calo_type and \
                    objects[1].is_muon_type:
@@ -583,7 +587,7 @@ class AlgorithmHelper(VhdlHelper):
         vhdl_signal      VHDL safe algorithm signal name [str]
         vhdl_expression  VHDL safe algorithm expression [str]
         conditions       sorted list of condition template helpers referenced by expression [list]
-        handle           reference to underlying algorithm handle [AlgorithmHandle]
+        handle           reference to underlying plan algorithm [PlanAlgorithm]
     """
 
     def __init__(self, algorithm_handle):
@@ -599,7 +603,7 @@ class AlgorithmHelper(VhdlHelper):
 
     def collect_conditions(self, algorithm_handle):
         """Collects list of conditions referenced by the algorithm expression from
-        an AlgorithmHandle instance. Returns list of condition template helpers sorted
+        a PlanAlgorithm instance. Returns list of condition template helpers sorted
         by number of objects, condition type and name.
         """
         conditions = {}
@@ -629,7 +633,7 @@ class ConditionHelper(VhdlHelper):
         vhdl_signal  VHDL safe condition signal name [str]
         objects      list of object template helpers contained by condition [list]
         nr_objects   number of actually used objects [int]
-        handle       reference to underlying condition handle [ConditionHandle]
+        handle       reference to underlying plan condition [PlanCondition]
     """
     ReqObjects = 1
     """Number of required objects."""
@@ -637,7 +641,7 @@ class ConditionHelper(VhdlHelper):
     def __init__(self, condition_handle):
         # Default attributes
         self.name = condition_handle.name
-        self.type = algodist.ConditionTypeKey[condition_handle.type] # type name!
+        self.type = condition_handle.type # type name!
         self.vhdl_signal = vhdl_label(condition_handle.name)
         self.handle = condition_handle
         self.init_objects()
@@ -680,7 +684,7 @@ class CaloConditionHelper(ConditionHelper):
         threshold    threshold bin index, alias for objects[0].threshold [int]
         objects      list of object template helpers contained by condition
         nr_objects   number of actually used objects [int]
-        handle       reference to underlying condition handle [ConditionHandle]
+        handle       reference to underlying plan condition [PlanCondition]
         twoBodyPt    [TwoBodyPtCutHelper]
     """
     ReqObjects = 4
@@ -694,7 +698,7 @@ class CaloConditionHelper(ConditionHelper):
 
     def update(self, condition_handle):
         for cut_handle in condition_handle.cuts:
-            if cut_handle.cut_type == tmEventSetup.TwoBodyPt:
+            if cut_handle.cut_type == 'TwoBodyPt':
                 self.twoBodyPt.update(cut_handle)
 
 class MuonConditionHelper(ConditionHelper):
@@ -706,7 +710,7 @@ class MuonConditionHelper(ConditionHelper):
         vhdl_signal  VHDL safe condition signal name [str]
         objects      list of object template helpers contained by condition
         nr_objects   number of actually used objects [int]
-        handle       reference to underlying condition handle [ConditionHandle]
+        handle       reference to underlying plan condition [PlanCondition]
         chargeCorrelation [str]
         twoBodyPt    [TwoBodyPtCutHelper]
     """
@@ -722,9 +726,9 @@ class MuonConditionHelper(ConditionHelper):
 
     def update_cuts(self, condition_handle):
         for cut_handle in condition_handle.cuts:
-            if cut_handle.cut_type == tmEventSetup.ChargeCorrelation:
+            if cut_handle.cut_type == 'ChargeCorrelation':
                 self.chargeCorrelation = charge_correlation_encode(cut_handle.data)
-            elif cut_handle.cut_type == tmEventSetup.TwoBodyPt:
+            elif cut_handle.cut_type == 'TwoBodyPt':
                 self.twoBodyPt.update(cut_handle)
 
 class EsumsConditionHelper(ConditionHelper):
@@ -761,7 +765,7 @@ class CorrelationConditionHelper(ConditionHelper):
         vhdl_signal  VHDL safe condition signal name [str]
         objects      list of object template helpers contained by condition
         nr_objects   number of actually used objects [int]
-        handle       reference to underlying condition handle [ConditionHandle]
+        handle       reference to underlying plan condition [PlanCondition]
         deltaEta     [DeltaEtaCutHelper]
         deltaPhi     [DeltaPhiCutHelper]
         deltaR       [DeltaRCutHelper]
@@ -791,26 +795,26 @@ class CorrelationConditionHelper(ConditionHelper):
 
     def update(self, condition_handle):
         for cut_handle in condition_handle.cuts:
-            if cut_handle.cut_type == tmEventSetup.DeltaEta:
+            if cut_handle.cut_type == 'DeltaEta':
                 self.deltaEta.update(cut_handle)
-            elif cut_handle.cut_type == tmEventSetup.DeltaPhi:
+            elif cut_handle.cut_type == 'DeltaPhi':
                 self.deltaPhi.update(cut_handle)
-            elif cut_handle.cut_type == tmEventSetup.DeltaR:
+            elif cut_handle.cut_type == 'DeltaR':
                 self.deltaR.update(cut_handle)
-            elif cut_handle.cut_type == tmEventSetup.Mass:
+            elif cut_handle.cut_type == 'Mass':
                 self.mass.update(cut_handle)
-            elif cut_handle.cut_type == tmEventSetup.TwoBodyPt:
+            elif cut_handle.cut_type == 'TwoBodyPt':
                 self.twoBodyPt.update(cut_handle)
-            elif cut_handle.cut_type == tmEventSetup.ChargeCorrelation:
+            elif cut_handle.cut_type == 'ChargeCorrelation':
                 self.chargeCorrelation = charge_correlation_encode(cut_handle.data)
 
         # Definition of mass_type:
         # 0 => invariant mass
         # 1 => transverse mass
 
-        if condition_handle.type == tmEventSetup.InvariantMass:
+        if condition_handle.type == 'InvariantMass':
             self.mass.type = 0
-        elif condition_handle.type == tmEventSetup.TransverseMass:
+        elif condition_handle.type == 'TransverseMass':
             self.mass.type = 1
 
 class CorrelationConditionOvRmHelper(ConditionHelper):
@@ -822,7 +826,7 @@ class CorrelationConditionOvRmHelper(ConditionHelper):
         vhdl_signal  VHDL safe condition signal name [str]
         objects      list of object template helpers contained by condition
         nr_objects   number of actually used objects [int]
-        handle       reference to underlying condition handle [ConditionHandle]
+        handle       reference to underlying plan condition [PlanCondition]
         deltaEtaOrm  [DeltaEtaCutHelper]
         deltaPhiOrm  [DeltaPhiCutHelper]
         deltaROrm    [DeltaRCutHelper]
@@ -858,32 +862,32 @@ class CorrelationConditionOvRmHelper(ConditionHelper):
 
     def update(self, condition_handle):
         for cut_handle in condition_handle.cuts:
-            if cut_handle.cut_type == tmEventSetup.DeltaEta:
+            if cut_handle.cut_type == 'DeltaEta':
                 self.deltaEta.update(cut_handle)
-            elif cut_handle.cut_type == tmEventSetup.DeltaPhi:
+            elif cut_handle.cut_type == 'DeltaPhi':
                 self.deltaPhi.update(cut_handle)
-            elif cut_handle.cut_type == tmEventSetup.DeltaR:
+            elif cut_handle.cut_type == 'DeltaR':
                 self.deltaR.update(cut_handle)
-            elif cut_handle.cut_type == tmEventSetup.Mass:
+            elif cut_handle.cut_type == 'Mass':
                 self.mass.update(cut_handle)
-            elif cut_handle.cut_type == tmEventSetup.TwoBodyPt:
+            elif cut_handle.cut_type == 'TwoBodyPt':
                 self.twoBodyPt.update(cut_handle)
-            elif cut_handle.cut_type == tmEventSetup.ChargeCorrelation:
+            elif cut_handle.cut_type == 'ChargeCorrelation':
                 self.chargeCorrelation = charge_correlation_encode(cut_handle.data)
-            elif cut_handle.cut_type == tmEventSetup.OvRmDeltaEta:
+            elif cut_handle.cut_type == 'OvRmDeltaEta':
                 self.deltaEtaOrm.update(cut_handle)
-            elif cut_handle.cut_type == tmEventSetup.OvRmDeltaPhi:
+            elif cut_handle.cut_type == 'OvRmDeltaPhi':
                 self.deltaPhiOrm.update(cut_handle)
-            elif cut_handle.cut_type == tmEventSetup.OvRmDeltaR:
+            elif cut_handle.cut_type == 'OvRmDeltaR':
                 self.deltaROrm.update(cut_handle)
 
         # Definition of mass_type:
         # 0 => invariant mass
         # 1 => transverse mass
 
-        if condition_handle.type == tmEventSetup.InvariantMassOvRm:
+        if condition_handle.type == 'InvariantMassOvRm':
             self.mass.type = 0
-        elif condition_handle.type == tmEventSetup.TransverseMassOvRm:
+        elif condition_handle.type == 'TransverseMassOvRm':
             self.mass.type = 1
 
 class CaloConditionOvRmHelper(ConditionHelper):
@@ -895,7 +899,7 @@ class CaloConditionOvRmHelper(ConditionHelper):
         vhdl_signal  VHDL safe condition signal name [str]
         objects      list of object template helpers contained by condition
         nr_objects   number of actually used objects [int]
-        handle       reference to underlying condition handle [ConditionHandle]
+        handle       reference to underlying plan condition [PlanCondition]
         deltaEtaOrm  [DeltaEtaCutHelper]
         deltaPhiOrm  [DeltaPhiCutHelper]
         deltaROrm    [DeltaRCutHelper]
@@ -921,13 +925,13 @@ class CaloConditionOvRmHelper(ConditionHelper):
 
     def update(self, condition_handle):
         for cut_handle in condition_handle.cuts:
-            if cut_handle.cut_type == tmEventSetup.OvRmDeltaEta:
+            if cut_handle.cut_type == 'OvRmDeltaEta':
                 self.deltaEtaOrm.update(cut_handle)
-            elif cut_handle.cut_type == tmEventSetup.OvRmDeltaPhi:
+            elif cut_handle.cut_type == 'OvRmDeltaPhi':
                 self.deltaPhiOrm.update(cut_handle)
-            elif cut_handle.cut_type == tmEventSetup.OvRmDeltaR:
+            elif cut_handle.cut_type == 'OvRmDeltaR':
                 self.deltaROrm.update(cut_handle)
-            elif cut_handle.cut_type == tmEventSetup.TwoBodyPt:
+            elif cut_handle.cut_type == 'TwoBodyPt':
                 self.twoBodyPt.update(cut_handle)
 
 # -----------------------------------------------------------------------------
@@ -970,7 +974,7 @@ class ObjectHelper(VhdlHelper):
         is_muon_type        [bool]
         is_calo_type        [bool]
         is_esums_type       [bool]
-        handle              handle to underlying object handle [None|ObjectHandle]
+        handle              handle to underlying plan object [None|PlanObject]
     """
 
     def __init__(self):
@@ -1025,22 +1029,22 @@ class ObjectHelper(VhdlHelper):
         phiCuts = []
         # setup cuts
         for cut_handle in object_handle.cuts:
-            if cut_handle.cut_type == tmEventSetup.Threshold:
+            if cut_handle.cut_type == 'Threshold':
                 self.threshold = cut_handle.minimum.index
-            elif cut_handle.cut_type == tmEventSetup.Isolation:
+            elif cut_handle.cut_type == 'Isolation':
                 self.isolationLUT = int(cut_handle.data)
-            elif cut_handle.cut_type == tmEventSetup.Eta:
+            elif cut_handle.cut_type == 'Eta':
                 etaCuts.append((cut_handle.minimum.index, cut_handle.maximum.index))
-            elif cut_handle.cut_type == tmEventSetup.Phi:
+            elif cut_handle.cut_type == 'Phi':
                 phiCuts.append((cut_handle.minimum.index, cut_handle.maximum.index))
-            elif cut_handle.cut_type == tmEventSetup.Quality:
+            elif cut_handle.cut_type == 'Quality':
                 self.qualityLUT = int(cut_handle.data)
-            elif cut_handle.cut_type == tmEventSetup.Charge:
+            elif cut_handle.cut_type == 'Charge':
                 self.charge = charge_encode(cut_handle.data)
-            if cut_handle.cut_type == tmEventSetup.Count:
+            if cut_handle.cut_type == 'Count':
                 self.count = cut_handle.minimum.index
                 self.hasCount = True
-            if cut_handle.cut_type == tmEventSetup.Slice:
+            if cut_handle.cut_type == 'Slice':
                 self.sliceLow  =  int(cut_handle.minimum.value) # float to int
                 self.sliceHigh =  int(cut_handle.maximum.value)
         # setup eta windows
@@ -1187,6 +1191,9 @@ if __name__ == '__main__':
     parser.add_argument('-o', action='store_true', help="show objects")
     args = parser.parse_args()
 
+    import tmEventSetup
+    from . import algodist
+
     # Create tray
     resource = os.path.join(os.path.dirname(__file__), '..', 'config', 'resource_default.json')
     tray = algodist.ResourceTray(resource)
@@ -1198,7 +1205,7 @@ if __name__ == '__main__':
     collection.reverse_sorting = True
     collection.distribute(modules=6)
     # Create template helper
-    menu = MenuHelper(collection)
+    menu = MenuHelper(collection.firmwarePlan())
 
     # Info
     print("*" * 80)
@@ -1246,11 +1253,11 @@ if __name__ == '__main__':
                     print("condition.name        :", condition.name)
                     print("condition.vhdl_signal :", condition.vhdl_signal)
                     print("condition.type :", condition.type)
-                    if condition.handle.type == tmEventSetup.InvariantMass:
+                    if condition.handle.type == 'InvariantMass':
                         print("condition.mass.enabled :", condition.mass.enabled)
                         print("condition.mass.lower :", condition.mass.lower)
                         print("condition.mass.upper :", condition.mass.upper)
-                    if condition.handle.type == tmEventSetup.TransverseMass:
+                    if condition.handle.type == 'TransverseMass':
                         print("condition.mass.enabled :", condition.mass.enabled)
                         print("condition.mass.lower :", condition.mass.lower)
                         print("condition.mass.upper :", condition.mass.upper)
@@ -1,19 +1,22 @@
+import hashlib
 import json
+import re
 import shutil
 import logging
+import multiprocessing
 import uuid
 import os, errno
 
-from jinja2 import Environment, FileSystemLoader, filters, StrictUndefined
+import jinja2
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, filters, StrictUndefined
 from os.path import join, exists, basename
 from itertools import cycle
 from binascii import hexlify
 
-import tmEventSetup
-import tmTable
-
 from . import vhdlhelper
-from . import algodist
+from .plan import FirmwarePlan, algorithm_digest
+from . import tracing
+from . import stats
 
 from tmVhdlProducer import __version__
 __all__ = ['VhdlProducer', 'writeXmlMenu']
@@ -67,10 +70,6 @@ def sort_by_attribute(items, attribute, reverse=False):
     """
     return sorted(items, key=lambda item: getattr(item, attribute), reverse=reverse)
 
-def murmurhash(s):
-    """Returns Murmurhash signed integer."""
-    return tmEventSetup.getMmHashN(str(s))
-
 # -----------------------------------------------------------------------------
 #  Constants
 # -----------------------------------------------------------------------------
@@ -87,9 +86,18 @@ CustomFilters = {
     'hexstr': hexstr_filter,
     'hexuuid': uuid2hex_filter,
     'vhdl_bool': lambda b: ('false', 'true')[bool(b)],
-    'mmhashn': murmurhash,
+    'algorithm_digest': algorithm_digest,
 }
 
+DefaultTemplateCacheDir = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'tm-vhdlproducer')
+"""Default directory for compiled template bytecode."""
+
+StreamBufferSize = 64
+"""Number of template events joined for a write when streaming output."""
+
+ManifestFormat = 'tm-vhdlproducer-manifest'
+ManifestVersion = 1
+
 ModuleTemplates = [
     'algo_index.vhd',
     'gtl_module_signals.vhd',
@@ -107,23 +115,246 @@ def makedirs(path):
     if not os.path.exists(path):
         os.makedirs(path)
 
+def file_digest(filename):
+    """Returns SHA-256 hex digest of a file, or None if it does not exist."""
+    digest = hashlib.sha256()
+    try:
+        with open(filename, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(1024 * 1024), b''):
+                digest.update(chunk)
+    except (IOError, OSError):
+        return None
+    return digest.hexdigest()
+
+class HashingWriter(object):
+    """Binary file wrapper computing the SHA-256 digest of written data."""
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.digest = hashlib.sha256()
+
+    def write(self, data):
+        self.digest.update(data)
+        return self.fp.write(data)
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+def update_file(filename, write):
+    """Calls *write* with a binary file object to produce the content of
+    *filename*. The file is replaced only if its content changed, else the
+    existing file (and its modification time) is left untouched. Returns tuple
+    of SHA-256 hex digest of the content and whether the file was changed.
+    """
+    tmp = '{0}.tmp'.format(filename)
+    try:
+        with open(tmp, 'wb') as fp:
+            writer = HashingWriter(fp)
+            write(writer)
+        digest = writer.hexdigest()
+        changed = digest != file_digest(filename)
+        if changed:
+            os.replace(tmp, filename)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return digest, changed
+
+def module_digest(files):
+    """Returns SHA-256 hex digest of a module from mapping of its filenames
+    to file digests.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(files):
+        digest.update("{0}:{1}\n".format(name, files[name]).encode())
+    return digest.hexdigest()
+
+def read_xml_menu(filename):
+    """Returns tuple of tmTable menu, scale and external signal instances
+    read from XML menu *filename*.
+    """
+    import tmTable
+    menu = tmTable.Menu()
+    scale = tmTable.Scale()
+    ext_signal = tmTable.ExtSignal()
+
+    logging.info("reading source XML menu file %s", filename)
+
+    message = tmTable.xml2menu(filename, menu, scale, ext_signal, False)
+    if message:
+        logging.error("{filename}: {message}".format(filename=filename, message=message))
+        raise RuntimeError(message)
+
+    return menu, scale, ext_signal
+
+def distribution_data(collection):
+    """Returns distribution of a firmware plan or module collection as
+    mapping with the structure of `menu.json`, including digests of the
+    algorithms (see `plan.algorithm_digest`) used by sticky redistribution.
+    """
+    if not isinstance(collection, FirmwarePlan):
+        collection = FirmwarePlan.fromCollection(collection)
+    eventSetup = collection.eventSetup
+    algorithms = sorted(collection.algorithm_handles, key=lambda algorithm: algorithm.index)
+    return {
+        'firmware_uuid': eventSetup.getFirmwareUuid(),
+        'menu_uuid': eventSetup.getMenuUuid(),
+        'n_modules': len(collection),
+        'algorithms': [[algorithm.name, algorithm.index, algorithm.module_id, algorithm.module_index] for algorithm in algorithms],
+        'digests': dict((algorithm.name, algorithm_digest(algorithm)) for algorithm in algorithms),
+    }
+
+def keep_firmware_uuid(collection, directory):
+    """Keeps the firmware UUID of a previous output in *directory* if its
+    distribution (`xml/menu.json`) is identical to the distribution of
+    *collection*. The firmware UUID is rendered into every module, keeping it
+    leaves files of an unchanged distribution untouched on update. Returns
+    the kept firmware UUID or None.
+    """
+    filename = os.path.join(directory, 'xml', 'menu.json')
+    if not os.path.isfile(filename):
+        return None
+    try:
+        with open(filename) as fp:
+            previous = json.load(fp)
+    except ValueError as e:
+        logging.warning("failed to read previous distribution `%s': %s", filename, e)
+        return None
+    current = distribution_data(collection)
+    for key in ('menu_uuid', 'n_modules', 'algorithms'):
+        if previous.get(key) != current[key]:
+            return None
+    firmware_uuid = previous.get('firmware_uuid')
+    if firmware_uuid:
+        collection.eventSetup.setFirmwareUuid(firmware_uuid)
+    return firmware_uuid or None
+
+# -----------------------------------------------------------------------------
+#  Parallel rendering
+# -----------------------------------------------------------------------------
+
+_producer = None
+"""VHDL producer of a worker process (inherited on fork, see `_init_worker`)."""
+
+_helper = None
+"""Menu template helper of a worker process."""
+
+def _init_worker(producer, helper):
+    """Binds producer and menu template helper to a worker process."""
+    global _producer, _helper
+    _producer, _helper = producer, helper
+
+def _write_module_template(task):
+    """Renders and writes a module template in a worker process. Returns
+    trace events recorded by the worker if tracing is enabled and counters
+    incremented by the worker.
+    """
+    index, template, filename = task
+    marker = tracing.mark()
+    counters = stats.mark()
+    params = {
+        'menu': _helper,
+        'module': _helper.modules[index],
+    }
+    digest, changed = _producer.writeTemplate(template, params, filename)
+    return template, filename, digest, changed, tracing.collect(marker), stats.collect(counters)
+
 # -----------------------------------------------------------------------------
 #  Template engines with custom loader environment.
 # -----------------------------------------------------------------------------
 
+def create_bytecode_cache(directory):
+    """Returns persistent bytecode cache for compiled templates in a Jinja
+    version specific subdirectory of *directory*, or None if the directory is
+    not writable. Cached bytecode is invalidated on template changes.
+    """
+    directory = os.path.join(directory, 'jinja2-{0}'.format(jinja2.__version__))
+    try:
+        makedirs(directory)
+    except OSError as e:
+        logging.warning("template cache disabled: %s", e)
+        return None
+    if not os.access(directory, os.W_OK):
+        logging.warning("template cache disabled: directory `%s' not writable", directory)
+        return None
+    return FileSystemBytecodeCache(directory)
+
+def traced_render_func(name, render_func):
+    """Returns template render function recording a span while its output
+    is consumed, including templates included by the template.
+    """
+    def wrapper(context):
+        with tracing.span(name, 'template'):
+            yield from render_func(context)
+    return wrapper
+
+class TracedTemplate(jinja2.Template):
+    """Template recording a span for every rendering if tracing is enabled in
+    the rendering context (see `tracing`), also for included templates.
+    """
+
+    @classmethod
+    def _from_namespace(cls, environment, namespace, globals):
+        template = super(TracedTemplate, cls)._from_namespace(environment, namespace, globals)
+        template.root_render_func = traced_render_func(template.name, template.root_render_func)
+        return template
+
 class TemplateEngine(object):
-    """Custom tempalte engine class."""
+    """Custom tempalte engine class. Compiled templates are cached in
+    *cache_dir* (disabled if None). Template renderings are traced if tracing
+    is enabled when rendering.
+    """
 
-    def __init__(self, searchpath, encoding='utf-8'):
+    def __init__(self, searchpath, encoding='utf-8', cache_dir=DefaultTemplateCacheDir):
         # Create Jinja environment.
         loader = FileSystemLoader(searchpath, encoding)
-        self.environment = Environment(loader=loader, undefined=StrictUndefined)
+        bytecode_cache = create_bytecode_cache(cache_dir) if cache_dir else None
+        self.environment = Environment(loader=loader, undefined=StrictUndefined, bytecode_cache=bytecode_cache)
         self.environment.filters.update(CustomFilters)
+        self.environment.template_class = TracedTemplate
 
     def render(self, template, data={}):
+        stats.increment('template.renders')
         template = self.environment.get_template(template)
         return template.render(data)
 
+    def stream(self, template, data, fp, buffer_size=StreamBufferSize, encoding=None):
+        """Renders template to file object *fp* in chunks of *buffer_size*
+        template events, without holding the whole output in memory. If
+        *encoding* is given, encoded bytes are written to *fp*.
+        """
+        stats.increment('template.renders')
+        stream = self.environment.get_template(template).stream(data)
+        stream.enable_buffering(buffer_size)
+        stream.dump(fp, encoding=encoding)
+
+    def preload(self):
+        """Compiles all templates of the search path in advance (eg. before
+        forking worker processes), raises an exception on template errors.
+        Unknown filters and tests are also rejected inside conditional blocks
+        (Jinja only fails when rendering those). Returns list of template
+        names.
+        """
+        names = self.environment.list_templates()
+        for name in names:
+            self.environment.get_template(name)
+            self.checkNames(name)
+        return names
+
+    def checkNames(self, name):
+        """Raises a TemplateAssertionError if template *name* uses an unknown
+        filter or test.
+        """
+        source, filename, _ = self.environment.loader.get_source(self.environment, name)
+        for node in self.environment.parse(source, name, filename).find_all((jinja2.nodes.Filter, jinja2.nodes.Test)):
+            if isinstance(node, jinja2.nodes.Filter):
+                kind, known = 'filter', self.environment.filters
+            else:
+                kind, known = 'test', self.environment.tests
+            if node.name not in known:
+                message = "No {0} named {1!r}.".format(kind, node.name)
+                raise jinja2.TemplateAssertionError(message, node.lineno, name, filename)
+
 # -----------------------------------------------------------------------------
 #  VHDL producer class.
 # -----------------------------------------------------------------------------
@@ -131,9 +362,9 @@ class TemplateEngine(object):
 class VhdlProducer(object):
     """VHDL producer class."""
 
-    def __init__(self, searchpath):
+    def __init__(self, searchpath, cache_dir=DefaultTemplateCacheDir):
         self.VHDLProducerVersion = __all__[0]+__version__
-        self.engine = TemplateEngine(searchpath)
+        self.engine = TemplateEngine(searchpath, cache_dir=cache_dir)
 
     def create_dirs(self, directory, n_modules):
         """Create directory tree for output."""
@@ -146,98 +377,184 @@ class VhdlProducer(object):
         for i in range(n_modules):
             module_id = "module_{i}".format(i=i)
             directories[module_id] = os.path.join(directories['vhdl'], module_id, "src")
-        # Check for exisiting directories (TODO obsolete?)
-        for directory in directories:
-            if os.path.exists(directory):
-                logging.warning("directory `%s' already exists. Will be overwritten.", directory)
-                shutil.rmtree(directory)
+        # Remove modules left over from a previous output with more modules,
+        # existing files are updated in place.
+        if os.path.isdir(directories['vhdl']):
+            for name in sorted(os.listdir(directories['vhdl'])):
+                match = re.match(r'^module_(\d+)$', name)
+                if match and int(match.group(1)) >= n_modules:
+                    logging.warning("removing obsolete module directory `%s'", name)
+                    shutil.rmtree(os.path.join(directories['vhdl'], name))
         # Create directries
         for directory in directories:
             makedirs(directories[directory])
         return directories
 
-    def write(self, collection, directory):
-        """Write distributed modules (VHDL templates) to *directory*."""
+    def writeTemplate(self, template, params, filename):
+        """Renders *template* using *params* and streams it to *filename*,
+        leaving the file untouched if its content did not change. Returns
+        tuple of SHA-256 hex digest of the content and whether the file was
+        changed.
+        """
+        with tracing.span('writeTemplate', template=template, filename=filename):
+            return update_file(filename, lambda fp: self.engine.stream(template, params, fp, encoding='utf-8'))
 
-        helper = vhdlhelper.MenuHelper(collection)
+    def writeManifest(self, helper, files, filename):
+        """Writes manifest of SHA-256 digests per module and file to
+        *filename*, *files* maps module ids to mappings of template names to
+        digests. Returns tuple of digest and whether the file was changed.
+        """
+        modules = {}
+        for module_id in sorted(files, key=lambda key: int(key.split('_')[-1])):
+            modules[module_id] = {
+                'digest': module_digest(files[module_id]),
+                'files': dict(sorted(files[module_id].items())),
+            }
+        data = {
+            'format': ManifestFormat,
+            'version': ManifestVersion,
+            'menu_name': helper.info.name,
+            'menu_uuid': helper.info.uuid_menu,
+            'firmware_uuid': helper.info.uuid_firmware,
+            'modules': modules,
+        }
+        content = json.dumps(data, indent=2).encode()
+        return update_file(filename, lambda fp: fp.write(content))
+
+    def write(self, collection, directory, jobs=1):
+        """Write distributed modules (VHDL templates) of a firmware plan or
+        module collection (converted to a plan) to *directory*. Module
+        templates are rendered by *jobs* worker processes (None for number of
+        CPUs), output is identical to serial rendering. Files with unchanged
+        content are not rewritten, a manifest of file digests is written to
+        `xml/manifest.json`. Returns list of ids of changed modules.
+        """
+        if not isinstance(collection, FirmwarePlan):
+            with tracing.span('FirmwarePlan'):
+                collection = FirmwarePlan.fromCollection(collection)
+        with tracing.span('MenuHelper'):
+            helper = vhdlhelper.MenuHelper(collection)
         logging.info("writing %s algorithms to %s module(s)", len(helper.algorithms), len(helper.modules))
         # Create directory tree
         directories = self.create_dirs(directory, len(collection))
         # Populate modules
-        for module in helper.modules:
-            logging.info("writing output for module: %s", module.id)
+        tasks = []
+        for index, module in enumerate(helper.modules):
             for template in ModuleTemplates:
-                params = {
-                    'menu': helper,
-                    'module': module,
-                }
-                content = self.engine.render(template, params)
                 module_id = "module_{id}".format(id=module.id)
                 filename = os.path.join(directories[module_id], template)
-                with open(filename, 'w') as fp:
-                    fp.write(content)
-                logging.info("{template:<24}: {filename}".format(**locals()))
+                tasks.append((index, template, filename))
+        results = []
+        if jobs == 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            for index, module in enumerate(helper.modules):
+                logging.info("writing output for module: %s", module.id)
+                with tracing.span('module_{id}'.format(id=module.id), 'module'):
+                    for task_index, template, filename in tasks:
+                        if task_index != index:
+                            continue
+                        params = {
+                            'menu': helper,
+                            'module': module,
+                        }
+                        digest, changed = self.writeTemplate(template, params, filename)
+                        results.append((digest, changed))
+                        logging.info("{template:<24}: {filename}{0}".format("" if changed else " (unchanged)", **locals()))
+        else:
+            logging.info("writing output for %s module(s) using %s worker processes", len(helper.modules), jobs or multiprocessing.cpu_count())
+            self.engine.preload() # compiled templates are inherited by workers
+            context = multiprocessing.get_context('fork')
+            with context.Pool(jobs, initializer=_init_worker, initargs=(self, helper)) as pool:
+                for template, filename, digest, changed, events, counters in pool.imap(_write_module_template, tasks):
+                    results.append((digest, changed))
+                    if events and tracing.active():
+                        tracing.active().extend(events)
+                    stats.merge(counters)
+                    logging.info("{template:<24}: {filename}{0}".format("" if changed else " (unchanged)", **locals()))
+
+        # Collect file digests per module
+        files = {}
+        changed_modules = []
+        for (index, template, filename), (digest, changed) in zip(tasks, results):
+            module = helper.modules[index]
+            files.setdefault("module_{id}".format(id=module.id), {})[template] = digest
+            if changed and module.id not in changed_modules:
+                changed_modules.append(module.id)
+        logging.info("changed modules: %s", ", ".join(str(id) for id in changed_modules) or "none")
 
         # Write JSON dump (TODO obsolete?)
         params = {
             'menu': helper,
         }
-        content = self.engine.render('menu.json', params)
         filename = os.path.join(directories['xml'], 'menu.json')
         makedirs(os.path.dirname(filename)) # Create path if required
-        with open(filename, 'w') as fp:
-            fp.write(content)
+        self.writeTemplate('menu.json', params, filename)
 
-    def writeXmlMenu(self, filename, json_dir, dist=1):
-        """Updates a XML menu file based on inforamtion from a JSON file (used to apply
-        a previously calculated algorithm distribution over multiple modules).
-        Returns path and filename of created XML menu.
-        """
-        # TODO
-        # Load mapping from JSON
-        with open(os.path.join(json_dir, 'menu.json')) as fp:
-            json_data = json.load(fp)
+        # Write manifest of module file digests
+        filename = os.path.join(directories['xml'], 'manifest.json')
+        self.writeManifest(helper, files, filename)
 
-        menu = tmTable.Menu()
-        scale = tmTable.Scale()
-        ext_signal = tmTable.ExtSignal()
+        return changed_modules
 
-        logging.info("reading source XML menu file %s", filename)
+    @tracing.traced('writeXmlMenu')
+    def writeXmlMenu(self, filename, json_dir, dist=1, distribution=None, tables=None):
+        """Updates a XML menu file based on a distribution (used to apply a
+        previously calculated algorithm distribution over multiple modules).
+        Returns path and filename of created XML menu.
 
-        message = tmTable.xml2menu(filename, menu, scale, ext_signal, False)
-        if message:
-            logging.error("{filename}: {message}".format(message))
-            raise RuntimeError(message)
+        *distribution* is either a firmware plan, a distributed module
+        collection or a mapping with the structure of `menu.json`, if None it
+        is read from `menu.json` in *json_dir*. *tables* is an optional tuple
+        of already loaded tmTable menu, scale and external signal instances of
+        *filename*, if None the source XML menu is read.
+        """
+        if distribution is None:
+            # Load mapping from JSON
+            with open(os.path.join(json_dir, 'menu.json')) as fp:
+                distribution = json.load(fp)
+        elif not isinstance(distribution, dict):
+            distribution = distribution_data(distribution)
+
+        import tmTable
+        if tables is None:
+            tables = read_xml_menu(filename)
+        menu, scale, ext_signal = tables
 
         logging.info("processing menu \"%s\" ... ", menu.menu["name"])
 
         # Update menu information
         logging.info("updating menu information...")
-        logging.info("uuid_menu     : %s", json_data["menu_uuid"])
-        logging.info("uuid_firmware : %s", json_data["firmware_uuid"])
-        logging.info("n_modules     : %s", json_data["n_modules"])
+        logging.info("uuid_menu     : %s", distribution["menu_uuid"])
+        logging.info("uuid_firmware : %s", distribution["firmware_uuid"])
+        logging.info("n_modules     : %s", distribution["n_modules"])
 
         # Update menu information
-        menu.menu["uuid_menu"] = str(json_data["menu_uuid"])
-        menu.menu["uuid_firmware"] = str(json_data["firmware_uuid"])
-        menu.menu["n_modules"] = str(json_data["n_modules"])
+        menu.menu["uuid_menu"] = str(distribution["menu_uuid"])
+        menu.menu["uuid_firmware"] = str(distribution["firmware_uuid"])
+        menu.menu["n_modules"] = str(distribution["n_modules"])
         menu.menu["is_valid"] = "1"
 
-        # Collect algorithm names
-        names = [algorithm["name"] for algorithm in menu.algorithms]
-
-        # Update algorithm
-        for name, index, module_id, module_index in json_data["algorithms"]:
+        # Index algorithm assignments by name
+        assignments = {}
+        for name, index, module_id, module_index in distribution["algorithms"]:
+            assignments[name] = (index, module_id, module_index)
+
+        # Update algorithms in a single pass
+        for id_, row in enumerate(menu.algorithms):
+            assignment = assignments.pop(row["name"], None)
+            if assignment is None:
+                continue
+            index, module_id, module_index = assignment
             algorithm = tmTable.Row()
-            id_ = names.index(name)
             # Copy attributes
-            for k, v in menu.algorithms[id_].items():
+            for k, v in row.items():
                 algorithm[k] = v
             # Update attributes
             algorithm["index"] = str(index)
             algorithm["module_id"] = str(module_id)
             algorithm["module_index"] = str(module_index)
             menu.algorithms[id_] = algorithm
+        if assignments:
+            raise ValueError("algorithms not in XML menu {0}: {1}".format(filename, ", ".join(sorted(assignments))))
 
         target = os.path.join(json_dir, '{name}-d{dist}.xml'.format(name=menu.menu['name'], dist=dist))
 